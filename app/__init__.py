@@ -1,27 +1,89 @@
 from flask import Flask
 from dotenv import load_dotenv
 import os
+import sys
+import atexit
+import queue
 import logging
 from pythonjsonlogger import jsonlogger
-import sys
+from app.services.log_pipeline import (
+    PayloadFilter, RequestIdFilter, SamplingFilter, StructuredQueueHandler, StructuredQueueListener,
+    create_file_handler, parse_sampling
+)
+
+_log_listener = None
+_queue_handler = None
+
+def _restart_log_listener():
+    """
+    Give a forked process its own listener.
+
+    A child inherits the queue handler but not the listener thread, so
+    under gunicorn's preload_app every worker would queue records that
+    nothing writes. The child starts over with an empty queue; what the
+    parent had queued is the parent's to write.
+    """
+    global _log_listener, _queue_handler
+    if _log_listener is None:
+        return
+    _queue_handler.queue = queue.SimpleQueue()
+    _log_listener = StructuredQueueListener(_queue_handler.queue, *_log_listener.handlers,
+                                            record_filter=_log_listener.record_filter,
+                                            respect_handler_level=_log_listener.respect_handler_level)
+    _log_listener.start()
+
+def _stop_log_listener():
+    # Flush what is still queued when the process exits
+    if _log_listener is not None:
+        _log_listener.stop()
 
 def setup_logging():
+    """
+    Log JSON to stdout and a rotating app.log without blocking the caller.
+
+    Records are put on a queue and formatted and written by a listener
+    thread, one per process (forked workers start their own). LOG_SAMPLING thins out chatty per-call events, LOG_PAYLOADS
+    (truncate, hash or full) and LOG_MAX_FIELD_CHARS shorten large fields,
+    LOG_MAX_BYTES/LOG_BACKUP_COUNT or LOG_ROTATE_WHEN rotate the file.
+    """
+    global _log_listener, _queue_handler
+
     # Create logger
     logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
+    logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    if _log_listener is not None:
+        return logger
 
     # Create JSON formatter
     formatter = jsonlogger.JsonFormatter('%(asctime)s %(levelname)s %(name)s %(message)s')
+    payload_filter = PayloadFilter(os.getenv('LOG_PAYLOADS', 'truncate').lower(),
+                                   int(os.getenv('LOG_MAX_FIELD_CHARS', '300')))
 
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
 
     # File handler
-    file_handler = logging.FileHandler('app.log')
+    file_handler = create_file_handler(
+        os.getenv('LOG_FILE', 'app.log'),
+        max_bytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+        backup_count=int(os.getenv('LOG_BACKUP_COUNT', '5')),
+        when=os.getenv('LOG_ROTATE_WHEN') or None
+    )
+
+    console_handler.setFormatter(formatter)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+
+    # The request thread only samples and enqueues; the listener does the rest
+    _queue_handler = StructuredQueueHandler(queue.SimpleQueue())
+    _queue_handler.addFilter(SamplingFilter(parse_sampling(os.getenv('LOG_SAMPLING'))))
+    _queue_handler.addFilter(RequestIdFilter())
+    logger.addHandler(_queue_handler)
+
+    _log_listener = StructuredQueueListener(_queue_handler.queue, console_handler, file_handler,
+                                            record_filter=payload_filter, respect_handler_level=True)
+    _log_listener.start()
+    os.register_at_fork(after_in_child=_restart_log_listener)
+    atexit.register(_stop_log_listener)
 
     return logger
 
@@ -35,8 +97,23 @@ def create_app():
     app = Flask(__name__)
     
     # Register blueprints
-    from app.routes.main import main_bp
+    from app.routes.main import main_bp, warm_up
+    from app.routes.observability import observability_bp
+    from app.routes.profiling import profiling_bp
+    from app.routes.chunked_uploads import chunked_uploads_bp
+    from app.routes.responses import responses_bp
     app.register_blueprint(main_bp)
+    app.register_blueprint(observability_bp)
+    app.register_blueprint(profiling_bp)
+    app.register_blueprint(chunked_uploads_bp)
+    # Registered last so its after_request hook runs first: the request
+    # metrics then include the time spent compressing
+    app.register_blueprint(responses_bp)
+
+    # Services are otherwise created by the first request that needs them
+    if os.getenv('PRELOAD_SERVICES', '').lower() in ('1', 'true', 'yes'):
+        with app.app_context():
+            warm_up()
     
     # Log application startup
     logger.info('Application started')
@@ -1,25 +1,38 @@
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 from .prompt_classifier import PromptClassifier
 from .sql_generator import SQLGenerator
 from .visualization_processor import VisualizationProcessor
 from .summary_generator import SummaryGenerator
+from ..services.context_store import ContextStore
+from ..services.llm_gateway import LLMGateway, get_llm_gateway
+from ..services.metrics import timed_stage
+from ..services.request_context import bind_context
 
 class AgentCoordinator:
-    def __init__(self):
+    def __init__(self, context_store: Optional[ContextStore] = None, llm: Optional[LLMGateway] = None,
+                 db_service=None):
         self.logger = logging.getLogger(__name__)
-        self.classifier = PromptClassifier()
-        self.sql_generator = SQLGenerator()
+        self.llm = llm or get_llm_gateway()
+        self.classifier = PromptClassifier(self.llm)
+        self.db_service = db_service
+        self.sql_generator = SQLGenerator(self.llm, db_service)
         self.viz_processor = VisualizationProcessor()
-        self.summary_generator = SummaryGenerator()
-        self.previous_context = None
+        self.summary_generator = SummaryGenerator(self.llm)
+        self.context_store = context_store or ContextStore()
 
-    def generate_sql_query(self, prompt: str) -> dict:
+    @timed_stage("generate_sql_query")
+    def generate_sql_query(self, prompt: str, session_id: Optional[str] = None) -> dict:
         """
         First phase: Generate SQL query from the prompt.
-        
+
         Args:
             prompt: The user's input prompt
-            
+            session_id: Identifies the conversation whose earlier queries
+                are used as follow-up context
+
         Returns:
             Dict containing:
             - success: boolean indicating if generation was successful
@@ -62,24 +75,23 @@ class AgentCoordinator:
             sql_result = self.sql_generator.generate_sql(
                 prompt=prompt,
                 is_followup=classification["is_followup"],
-                previous_context=self.previous_context
+                previous_context=self.context_store.get_previous_context(session_id)
             )
             self.logger.info({
                 "agent": "SQLGenerator",
                 "action": "sql_generation_complete",
                 "success": sql_result["success"],
+                "attempts": sql_result.get("attempts"),
+                "elapsed_ms": sql_result.get("elapsed_ms"),
                 "query": sql_result.get("query", None)
             })
             
             if not sql_result["success"]:
                 return {"error": sql_result["error"]}
                 
-            # Store query for context
-            self.previous_context = sql_result["query"]
-            
-            # Store query for context
-            self.previous_context = sql_result["query"]
-            
+            # Store query for this session's follow-up context
+            self.context_store.append(session_id, prompt, sql_result["query"])
+
             return {
                 "success": True,
                 "query": sql_result["query"],
@@ -89,6 +101,7 @@ class AgentCoordinator:
         except Exception as e:
             return {"error": f"Error generating SQL query: {str(e)}"}
             
+    @timed_stage("process_query_results")
     def process_query_results(self, query: str, query_results: dict, visualization_type: str = None) -> dict:
         """
         Second phase: Process query results after user approval.
@@ -151,3 +164,111 @@ class AgentCoordinator:
             
         except Exception as e:
             return {"error": f"Error processing query results: {str(e)}"}
+
+    def run_batch(self, prompts: List[str], max_workers: Optional[int] = None) -> dict:
+        """
+        Answer many independent prompts concurrently.
+
+        Duplicate prompts are answered once. SQL generation fans out under the
+        LLM gateway's concurrency limit and the queries run in parallel on
+        read-only connections.
+
+        Args:
+            prompts: Natural language questions, answered without follow-up context
+            max_workers: Parallel items; defaults to the gateway's concurrency limit
+
+        Returns:
+            Dict containing:
+            - success: boolean
+            - items: one entry per input prompt, in input order, with the query,
+              results, visualization_html, summaries_html, error and timings_ms
+            - elapsed_ms: wall time of the whole batch
+        """
+        started = time.perf_counter()
+
+        # Dedupe on normalized text, remembering which input maps to which unique prompt
+        unique_prompts = []
+        positions = {}
+        mapping = []
+        for prompt in prompts:
+            key = " ".join(prompt.lower().split())
+            if key not in positions:
+                positions[key] = len(unique_prompts)
+                unique_prompts.append(prompt)
+            mapping.append(positions[key])
+
+        self.logger.info({
+            "agent": "AgentCoordinator",
+            "action": "starting_batch",
+            "prompts": len(prompts),
+            "unique_prompts": len(unique_prompts)
+        })
+
+        workers = max(1, min(len(unique_prompts), max_workers or self.llm.max_concurrency))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+            # Each item runs in a copy of this request's context, so its logs keep the request id
+            futures = [pool.submit(bind_context(self._run_batch_item, prompt)) for prompt in unique_prompts]
+            answers = [future.result() for future in futures]
+
+        items = []
+        for index, unique_index in enumerate(mapping):
+            item = dict(answers[unique_index], prompt=prompts[index])
+            if mapping.index(unique_index) != index:
+                item["duplicate_of"] = mapping.index(unique_index)
+            items.append(item)
+
+        return {
+            "success": True,
+            "items": items,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+
+    def _run_batch_item(self, prompt: str) -> dict:
+        """Generate, execute and process a single batch prompt, timing each phase."""
+        timings = {}
+        item = {
+            "query": None,
+            "visualization_type": None,
+            "results": None,
+            "visualization_html": None,
+            "summaries_html": None,
+            "error": None,
+            "timings_ms": timings
+        }
+        started = time.perf_counter()
+        try:
+            generated = self.generate_sql_query(prompt)
+            timings["generate"] = round((time.perf_counter() - started) * 1000, 1)
+            if "error" in generated:
+                item["error"] = generated["error"]
+                return item
+            if generated.get("type") == "general":
+                item["error"] = generated["message"]
+                return item
+            item["query"] = generated["query"]
+            item["visualization_type"] = generated.get("visualization_type")
+
+            phase = time.perf_counter()
+            query_result = self.db_service.execute_query(item["query"], read_only=True)
+            timings["execute"] = round((time.perf_counter() - phase) * 1000, 1)
+            if not query_result["success"]:
+                item["error"] = query_result["error"]
+                return item
+            item["results"] = query_result["results"]
+
+            phase = time.perf_counter()
+            processed = self.process_query_results(item["query"], query_result, item["visualization_type"])
+            timings["process"] = round((time.perf_counter() - phase) * 1000, 1)
+            if "error" in processed:
+                item["error"] = processed["error"]
+                return item
+            item["visualization_html"] = processed.get("visualization_html")
+            item["summaries_html"] = processed.get("summaries_html")
+            return item
+
+        except Exception as e:
+            item["error"] = f"Error processing batch prompt: {str(e)}"
+            return item
+
+        finally:
+            timings["total"] = round((time.perf_counter() - started) * 1000, 1)
@@ -1,5 +1,5 @@
-from typing import Dict, Any
-from anthropic import Anthropic
+from typing import Dict, Any, Optional
+from ..services.llm_gateway import LLMGateway, get_llm_gateway
 import os
 import logging
 import json
@@ -7,8 +7,8 @@ import json
 logger = logging.getLogger(__name__)
 
 class PromptClassifier:
-    def __init__(self):
-        self.client = Anthropic()  # Will use ANTHROPIC_API_KEY env var by default
+    def __init__(self, llm: Optional[LLMGateway] = None):
+        self.llm = llm or get_llm_gateway()  # Shared, rate-limited Anthropic client
         logger.info("PromptClassifier initialized")
         
     def classify_prompt(self, prompt: str) -> Dict[str, Any]:
@@ -45,7 +45,7 @@ class PromptClassifier:
                 "prompt": prompt
             })
             
-            message = self.client.messages.create(
+            message = self.llm.create_message(
                 model="claude-3-sonnet-20240229",
                 max_tokens=1000,
                 system=system_prompt,
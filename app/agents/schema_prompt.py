@@ -0,0 +1,164 @@
+from typing import Dict, Any
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ..services.request_context import bind_context
+from ..services.database_service import is_hidden_table
+
+logger = logging.getLogger(__name__)
+
+# Columns that only carry keys and would waste prompt tokens
+SKIPPED_COLUMNS = {"id", "common_id"}
+
+JOIN_NOTES = [
+    "IW38 (orders), IW47 (confirmations) and IW68 (notification items) each link to common_fields "
+    "through <table>.common_id = common_fields.id; common_fields.file_type names the source report.",
+    "Most values are stored as TEXT: CAST numeric columns to FLOAT before calculating with them."
+]
+
+
+class SchemaPromptBuilder:
+    """
+    Builds the database description used in the SQL generation prompt.
+
+    The description is derived from the live database (tables, column types
+    and per-column value statistics) and cached until the data version or the
+    schema changes, so the large static prefix of the prompt stays identical
+    between requests and can be reused by provider-side prompt caching.
+
+    The statistics scan every report table, so once a description exists it
+    is rebuilt on a background thread, started after each ingest or by the
+    first request that sees a new version; requests keep the previous
+    description until the new one is ready. Only the very first build runs
+    inline.
+    """
+
+    def __init__(self, db_service, top_n: int = 5, max_categorical: int = 50, max_value_chars: int = 40):
+        self.db_service = db_service
+        self.top_n = top_n
+        self.max_categorical = max_categorical
+        self.max_value_chars = max_value_chars
+        self._lock = threading.Lock()
+        self._cache_key = None
+        self._cached = ""
+        self._rebuild_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="schema-prompt")
+        self._rebuild_lock = threading.Lock()
+        self._rebuild_pending = False
+
+    def _current_key(self):
+        return (self.db_service.get_data_version(), self.db_service.get_schema_version())
+
+    def build(self) -> str:
+        """Return the schema description; a stale one while its rebuild runs in the background."""
+        cache_key = self._current_key()
+        if cache_key == self._cache_key:
+            return self._cached
+        if self._cache_key is not None:
+            self.schedule_rebuild()
+            return self._cached
+        with self._lock:
+            if self._cache_key is None:
+                self._rebuild(cache_key)
+        return self._cached
+
+    def schedule_rebuild(self) -> None:
+        """
+        Queue a rebuild of the description for the current data.
+
+        Calls made while a rebuild is queued collapse into it.
+        """
+        with self._rebuild_lock:
+            if self._rebuild_pending:
+                return
+            self._rebuild_pending = True
+        self._rebuild_executor.submit(bind_context(self._run_scheduled_rebuild))
+
+    def _run_scheduled_rebuild(self) -> None:
+        with self._rebuild_lock:
+            self._rebuild_pending = False
+        cache_key = self._current_key()
+        if cache_key == self._cache_key:
+            return
+        with self._lock:
+            self._rebuild(cache_key)
+
+    def _rebuild(self, cache_key) -> None:
+        # The key is read before rendering: data ingested meanwhile triggers another rebuild
+        started = time.perf_counter()
+        self._cached = self._render()
+        self._cache_key = cache_key
+        logger.info({
+            "agent": "SchemaPromptBuilder",
+            "action": "schema_prompt_rebuilt",
+            "data_version": cache_key[0],
+            "length": len(self._cached),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+        })
+
+    def _render(self) -> str:
+        table_info = self.db_service.get_table_info()
+        if not table_info.get("success"):
+            logger.error({
+                "agent": "SchemaPromptBuilder",
+                "action": "table_info_failed",
+                "error": table_info.get("error")
+            })
+            return ""
+
+        sections = []
+        for table_name, info in sorted(table_info["tables"].items()):
+            if is_hidden_table(table_name):
+                continue
+            sections.append(self._render_table(table_name, info))
+
+        notes = JOIN_NOTES + self.db_service.get_prompt_notes()
+        return "\n\n".join(sections + ["Notes:\n" + "\n".join(f"- {note}" for note in notes)])
+
+    def _render_table(self, table_name: str, info: Dict[str, Any]) -> str:
+        # Dictionary keys next to their text column are listed without statistics
+        columns = [
+            col for col in info["columns"]
+            if col not in SKIPPED_COLUMNS and not (col.endswith("_id") and col[:-3] in info["columns"])
+        ]
+        types = dict(zip(info["columns"], info["types"]))
+        stats = self.db_service.get_column_statistics(
+            table_name, columns, top_n=self.top_n, max_categorical=self.max_categorical
+        )
+        if not stats.get("success"):
+            stats = {"row_count": None, "columns": {}}
+
+        row_count = stats["row_count"]
+        header = f"{table_name} ({row_count:,} rows)" if row_count is not None else table_name
+        lines = [header]
+        for col in info["columns"]:
+            if col in SKIPPED_COLUMNS:
+                lines.append(f"  {col} {types[col] or 'TEXT'}")
+                continue
+            lines.append(f"  {col} {types[col] or 'TEXT'}{self._describe(stats['columns'].get(col))}")
+        return "\n".join(lines)
+
+    def _describe(self, col_stats: Dict[str, Any]) -> str:
+        """Compact one-line value summary: distinct count, range and top values."""
+        if not col_stats or not col_stats["distinct"]:
+            return ": empty" if col_stats else ""
+        parts = [f"{col_stats['distinct']:,} distinct"]
+        if col_stats.get("top_values"):
+            values = ", ".join(
+                f"{self._clip(value)} ({count:,})" for value, count in col_stats["top_values"]
+            )
+            parts.append(f"top {values}")
+        elif col_stats["min"] is not None:
+            kind = "numeric " if col_stats["numeric"] else ""
+            parts.append(f"{kind}range {self._clip(col_stats['min'])} .. {self._clip(col_stats['max'])}")
+        return ": " + "; ".join(parts)
+
+    def _clip(self, value: Any) -> str:
+        if value is None:
+            return "NULL"
+        if isinstance(value, float):
+            return f"{value:.2f}".rstrip("0").rstrip(".")
+        text = str(value)
+        if len(text) > self.max_value_chars:
+            text = text[:self.max_value_chars - 3] + "..."
+        return repr(text)
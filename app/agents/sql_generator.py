@@ -1,76 +1,24 @@
 from typing import Dict, Any, Optional
-from anthropic import Anthropic
+from ..services.llm_gateway import LLMGateway, get_llm_gateway
+from .schema_prompt import SchemaPromptBuilder
 import os
 import json
 import logging
+import re
+import time
 
 logger = logging.getLogger(__name__)
 
 class SQLGenerator:
-    def __init__(self):
-        self.client = Anthropic()  # Will use ANTHROPIC_API_KEY env var by default
-        self.db_structure = """
-CREATE TABLE common_fields (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    file_type TEXT,
-    order_number TEXT,
-    notification_number TEXT,
-    breakdown TEXT,
-    functional_location TEXT
-);
+    def __init__(self, llm: Optional[LLMGateway] = None, db_service=None):
+        self.llm = llm or get_llm_gateway()  # Shared, rate-limited Anthropic client
+        self.db_service = db_service  # Used to compile generated queries against the live schema
+        self.schema_prompt = SchemaPromptBuilder(db_service) if db_service is not None else None
 
-CREATE TABLE IW38 (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    common_id INTEGER,
-    created_on TEXT,
-    basic_start_date TEXT,
-    equipment TEXT,
-    description TEXT,
-    plant_section TEXT,
-    total_actual_costs TEXT,
-    order_type TEXT,
-    main_workcenter TEXT,
-    maintenance_plan TEXT,
-    actual_finish TEXT,
-    cost_center TEXT,
-    basic_finish_date TEXT,
-    breakdown_duration TEXT,
-    FOREIGN KEY (common_id) REFERENCES common_fields(id)
-);
-
-CREATE TABLE IW68 (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    common_id INTEGER,
-    code_group TEXT,
-    problem_group_text TEXT,
-    damage_code TEXT,
-    problem_code_text TEXT,
-    item_text TEXT,
-    cause_code TEXT,
-    cause_group_text TEXT,
-    cause_text TEXT,
-    effect TEXT,
-    reported_by TEXT,
-    FOREIGN KEY (common_id) REFERENCES common_fields(id)
-);
-
-CREATE TABLE IW47 (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    common_id INTEGER,
-    created_on TEXT,
-    created_by TEXT,
-    actual_finish_date TEXT,
-    confirmation_number TEXT,
-    employees TEXT,
-    personnel_number TEXT,
-    confirmation_text TEXT,
-    planned_work TEXT,
-    actual_work TEXT,
-    system_status TEXT,
-    work_center TEXT,
-    actual_start_time TEXT,
-    FOREIGN KEY (common_id) REFERENCES common_fields(id)
-);"""
+    @property
+    def db_structure(self) -> str:
+        """Description of the live database, rebuilt whenever its data changes."""
+        return self.schema_prompt.build() if self.schema_prompt is not None else ""
 
     def generate_sql(self, prompt: str, is_followup: bool = False, previous_context: Optional[str] = None, max_attempts: int = 5) -> Dict[str, Any]:
         """
@@ -79,7 +27,7 @@ CREATE TABLE IW47 (
         Args:
             prompt (str): The user's input prompt
             is_followup (bool): Whether this is a follow-up question
-            previous_context (Optional[str]): Previous query context for follow-ups
+            previous_context (Optional[str]): Earlier questions and queries of the session for follow-ups
             max_attempts (int): Maximum number of attempts to generate valid SQL
             
         Returns:
@@ -88,8 +36,15 @@ CREATE TABLE IW47 (
             - query: the generated SQL query if successful
             - error: error message if unsuccessful
             - visualization_type: detected visualization type if any
+            - attempts: number of model calls used
+            - elapsed_ms: generation time in milliseconds (on success)
         """
-        system_prompt = f"""Using this database structure:
+        # The schema and instructions form a large prefix that only changes with
+        # the data, so mark it cacheable and keep per-request context after it
+        system_prompt = [
+            {
+                "type": "text",
+                "text": f"""Using this database structure:
 
 {self.db_structure}
 
@@ -100,14 +55,32 @@ Convert this message to a SQL query. Return ONLY the raw SQL query without any e
    - breakdown_duration as CAST(breakdown_duration AS FLOAT)
    - Explicit COUNT, SUM, AVG operations
 3. Use appropriate aliases for computed columns
-4. Handle visualization markers (@pie, @bar, etc.)"""
+4. Handle visualization markers (@pie, @bar, etc.)
+5. Use the listed top values when filtering on categorical columns""",
+                "cache_control": {"type": "ephemeral"}
+            }
+        ]
 
         if is_followup and previous_context:
-            system_prompt += f"\n\nThis is a follow-up to: {previous_context}"
+            system_prompt.append({
+                "type": "text",
+                "text": f"This is a follow-up to these earlier questions in the conversation:\n{previous_context}"
+            })
 
         attempts = 0
         last_error = None
-        
+        started = time.perf_counter()
+        messages = [{"role": "user", "content": prompt}]
+
+        # Extract visualization type if present
+        viz_type = None
+        if '@pie' in prompt:
+            viz_type = 'pie'
+        elif '@bar' in prompt:
+            viz_type = 'bar'
+        elif '@line' in prompt:
+            viz_type = 'line'
+
         while attempts < max_attempts:
             try:
                 logger.info({
@@ -119,53 +92,56 @@ Convert this message to a SQL query. Return ONLY the raw SQL query without any e
                     "has_previous_context": previous_context is not None
                 })
                 
-                message = self.client.messages.create(
+                message = self.llm.create_message(
                     model="claude-3-sonnet-20240229",
                     max_tokens=1000,
                     system=system_prompt,
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ]
+                    messages=messages
                 )
                 
                 response_text = message.content[0].text
+                query = self._clean_sql(response_text)
                 
-                # Extract visualization type if present
-                viz_type = None
-                if '@pie' in prompt:
-                    viz_type = 'pie'
-                elif '@bar' in prompt:
-                    viz_type = 'bar'
-                elif '@line' in prompt:
-                    viz_type = 'line'
-                
-                # Validate SQL syntax
-                if self._validate_sql(response_text):
+                # Validate the query against the live schema
+                validation_error = self._validate_sql(query)
+                attempts += 1
+                if validation_error is None:
+                    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
                     logger.info({
                         "agent": "SQLGenerator",
                         "action": "sql_generation_success",
-                        "attempt": attempts + 1,
-                        "query": response_text,
+                        "attempt": attempts,
+                        "elapsed_ms": elapsed_ms,
+                        "query": query,
                         "visualization_type": viz_type
                     })
                     return {
                         "success": True,
-                        "query": response_text,
-                        "visualization_type": viz_type
+                        "query": query,
+                        "visualization_type": viz_type,
+                        "attempts": attempts,
+                        "elapsed_ms": elapsed_ms
                     }
                 
-                attempts += 1
-                last_error = f"Invalid SQL syntax. Claude response: {response_text}"
+                last_error = f"Invalid SQL: {validation_error}. Claude response: {response_text}"
                 logger.warning({
                     "agent": "SQLGenerator",
                     "action": "sql_validation_failed",
                     "attempt": attempts,
-                    "error": last_error,
+                    "error": validation_error,
                     "response": response_text
                 })
+
+                # Tell the model why its query was rejected so the next attempt can fix it
+                messages = [
+                    {"role": "user", "content": prompt},
+                    {"role": "assistant", "content": query},
+                    {
+                        "role": "user",
+                        "content": f"That query is invalid for this database: {validation_error}. "
+                                   "Return ONLY the corrected SQL query."
+                    }
+                ]
                 
             except Exception as e:
                 attempts += 1
@@ -176,49 +152,59 @@ Convert this message to a SQL query. Return ONLY the raw SQL query without any e
                     "attempt": attempts,
                     "error": str(e)
                 })
+                # Back off before asking again instead of hammering the API
+                if attempts < max_attempts:
+                    time.sleep(self.llm.backoff_delay(attempts - 1))
         
         logger.error({
             "agent": "SQLGenerator",
             "action": "sql_generation_failed",
             "max_attempts": max_attempts,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
             "final_error": last_error
         })
         return {
             "success": False,
             "error": f"Failed after {max_attempts} attempts. Last error: {last_error}",
             "query": None,
-            "visualization_type": None
+            "visualization_type": None,
+            "attempts": attempts
         }
 
-    def _validate_sql(self, query: str) -> bool:
+    def _clean_sql(self, response_text: str) -> str:
+        """Strip markdown code fences and surrounding whitespace from a model response."""
+        query = re.sub(r'```(?:sql)?', '', response_text, flags=re.IGNORECASE)
+        return query.strip()
+
+    def _validate_sql(self, query: str) -> Optional[str]:
         """
-        Basic SQL syntax validation.
+        Validate a generated query.
+
+        The query must be a single SELECT (or WITH ... SELECT) statement. When a
+        database service is available the query is also compiled against the
+        live schema on a read-only connection, which catches unknown tables or
+        columns, misused aggregates and any attempt to write.
         
         Args:
             query (str): SQL query to validate
             
         Returns:
-            bool: True if query appears valid
+            Optional[str]: None if the query is valid, otherwise the reason it was rejected
         """
-        # Basic validation - check for required elements
-        query = query.lower().strip()
-        
-        # Remove any markdown code block markers
-        query = query.replace('```sql', '').replace('```', '')
-        
-        if not query.startswith('select'):
-            return False
-        
-        # Check for basic SQL injection patterns
-        dangerous_patterns = ['--', 'drop', 'delete', 'update', 'insert']
-        if any(pattern in query for pattern in dangerous_patterns):
-            return False
-            
-        # Check for balanced parentheses
-        if query.count('(') != query.count(')'):
-            return False
-            
-        return True
+        normalized = query.lower().lstrip('( \n\t')
+        if not (normalized.startswith('select') or normalized.startswith('with')):
+            return "the query must be a single SELECT statement"
+
+        if self.db_service is None:
+            # Without a schema only a lexical check is possible
+            if re.search(r'\b(drop|delete|update|insert|alter|create|attach|pragma)\b', normalized):
+                return "the query must not modify the database"
+            if query.count('(') != query.count(')'):
+                return "unbalanced parentheses"
+            return None
+
+        result = self.db_service.validate_query(query)
+        return None if result["success"] else result["error"]
 
     def get_visualization_columns(self, query: str, viz_type: str) -> Dict[str, Any]:
         """
@@ -248,7 +234,7 @@ Return ONLY a JSON object with x and y column names for visualization, no explan
                 "visualization_type": viz_type
             })
             
-            message = self.client.messages.create(
+            message = self.llm.create_message(
                 model="claude-3-sonnet-20240229",
                 max_tokens=1000,
                 system="Analyze the SQL query and determine appropriate columns for visualization. The x column should be categorical (text) and y should be numerical. Return only a JSON object with x and y column names.",
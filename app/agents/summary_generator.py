@@ -1,5 +1,5 @@
-from typing import Dict, Any, List
-from anthropic import Anthropic
+from typing import Dict, Any, Optional, List
+from ..services.llm_gateway import LLMGateway, get_llm_gateway
 import os
 import json
 import logging
@@ -7,8 +7,8 @@ import logging
 logger = logging.getLogger(__name__)
 
 class SummaryGenerator:
-    def __init__(self):
-        self.client = Anthropic()  # Will use ANTHROPIC_API_KEY env var by default
+    def __init__(self, llm: Optional[LLMGateway] = None):
+        self.llm = llm or get_llm_gateway()  # Shared, rate-limited Anthropic client
         logger.info("SummaryGenerator initialized")
 
     def generate_summaries(self, data: List[Dict[str, Any]], query: str, viz_type: str = None) -> Dict[str, Any]:
@@ -42,33 +42,9 @@ class SummaryGenerator:
                 "action": "generating_management_summary"
             })
             
-            # Generate management summary
-            mgmt_message = self.client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=1000,
-                system="Generate a brief management summary that highlights key findings, focuses on business impact, uses non-technical language, and includes relevant metrics/numbers. Return only the summary text, no additional formatting or explanation.",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": f"""Given these SQL query results:
-{data_str}
-
-From query:
-{query}
-
-Please provide a management summary (2-3 sentences)."""
-                    }
-                ]
-            )
-            
-            management_summary = mgmt_message.content[0].text
-            
-            logger.info({
-                "agent": "SummaryGenerator",
-                "action": "management_summary_complete",
-                "summary_length": len(management_summary),
-                "summary": management_summary
-            })
+            # The summaries do not depend on each other, so the management summary
+            # is requested on the gateway's threads while this one writes the other
+            management_message = self.llm.submit_message(**self._management_request(data_str, query))
 
             logger.info({
                 "agent": "SummaryGenerator",
@@ -76,7 +52,7 @@ Please provide a management summary (2-3 sentences)."""
             })
             
             # Generate comprehensive summary
-            comp_message = self.client.messages.create(
+            comp_message = self.llm.create_message(
                 model="claude-3-sonnet-20240229",
                 max_tokens=2000,
                 system="Generate a comprehensive analysis that includes: detailed breakdown of the data, trends and patterns, notable outliers or exceptions, potential business implications, and supporting metrics and calculations. Return only the analysis text, no additional formatting or explanation.",
@@ -96,7 +72,15 @@ Please provide a comprehensive analysis."""
             )
             
             comprehensive_summary = comp_message.content[0].text
-            
+            management_summary = management_message.result().content[0].text
+
+            logger.info({
+                "agent": "SummaryGenerator",
+                "action": "management_summary_complete",
+                "summary_length": len(management_summary),
+                "summary": management_summary
+            })
+
             logger.info({
                 "agent": "SummaryGenerator",
                 "action": "comprehensive_summary_complete",
@@ -124,6 +108,59 @@ Please provide a comprehensive analysis."""
                 "comprehensive_summary": None
             }
 
+    def generate_management_summary(self, data: List[Dict[str, Any]], query: str) -> Dict[str, Any]:
+        """
+        Generate only the brief management summary, e.g. for dashboard tiles.
+        
+        Args:
+            data: List of dictionaries containing query results
+            query: The SQL query that generated the results
+            
+        Returns:
+            Dict containing:
+            - success: boolean indicating if generation was successful
+            - management_summary: Brief executive summary
+            - error: Error message if generation failed
+        """
+        try:
+            management_summary = self._request_management_summary(json.dumps(data, indent=2, default=str), query)
+            return {"success": True, "management_summary": management_summary}
+        except Exception as e:
+            logger.error({
+                "agent": "SummaryGenerator",
+                "action": "management_summary_error",
+                "error": str(e)
+            })
+            return {
+                "success": False,
+                "error": f"Failed to generate management summary: {str(e)}",
+                "management_summary": None
+            }
+
+    def _request_management_summary(self, data_str: str, query: str) -> str:
+        """Ask the model for a 2-3 sentence management summary of the results."""
+        message = self.llm.create_message(**self._management_request(data_str, query))
+        return message.content[0].text
+
+    def _management_request(self, data_str: str, query: str) -> Dict[str, Any]:
+        return dict(
+            model="claude-3-sonnet-20240229",
+            max_tokens=1000,
+            system="Generate a brief management summary that highlights key findings, focuses on business impact, uses non-technical language, and includes relevant metrics/numbers. Return only the summary text, no additional formatting or explanation.",
+            messages=[
+                {
+                    "role": "user",
+                    "content": f"""Given these SQL query results:
+{data_str}
+
+From query:
+{query}
+
+Please provide a management summary (2-3 sentences)."""
+                }
+            ]
+        )
+
     def format_summaries_html(self, summaries: Dict[str, str]) -> str:
         """
         Format summaries as HTML for display.
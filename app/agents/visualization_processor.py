@@ -1,12 +1,13 @@
 from typing import Dict, Any, List
-import plotly.graph_objects as go
 import json
 import logging
+from ..services.metrics import timed_stage
 
 logger = logging.getLogger(__name__)
 
 class VisualizationProcessor:
-    def generate_visualization(self, data: List[Dict[str, Any]], viz_config: Dict[str, Any]) -> Dict[str, Any]:
+    @timed_stage("render_visualization")
+    def generate_visualization(self, data: List[Dict[str, Any]], viz_config: Dict[str, Any], output: str = "html") -> Dict[str, Any]:
         """
         Generate visualization HTML using Plotly based on data and configuration.
         
@@ -15,11 +16,13 @@ class VisualizationProcessor:
             viz_config: Dictionary containing:
                 - type: visualization type (pie, bar, line, table)
                 - columns: dict with x and y column names
+            output: "html" for a standalone page, "spec" for the Plotly figure JSON
                 
         Returns:
             Dict containing:
             - success: boolean indicating if visualization was generated
             - html: the generated HTML if successful
+            - spec: the Plotly figure as JSON if output is "spec"
             - error: error message if unsuccessful
         """
         logger.info({
@@ -101,15 +104,22 @@ class VisualizationProcessor:
             
             fig = self._create_figure(chart_type, x_data, y_data, x_col_match, y_col_match)
             
-            # Generate HTML
-            html = self._generate_html(fig)
-            
             logger.info({
                 "agent": "VisualizationProcessor",
                 "action": "visualization_complete",
                 "chart_type": chart_type
             })
             
+            # Figure JSON can be stored and rendered client-side with Plotly.newPlot
+            if output == "spec":
+                return {
+                    "success": True,
+                    "spec": fig.to_json()
+                }
+
+            # Generate HTML
+            html = self._generate_html(fig)
+            
             return {
                 "success": True,
                 "html": html
@@ -190,8 +200,11 @@ class VisualizationProcessor:
                 
         return x_data, y_data
 
-    def _create_figure(self, chart_type: str, x_data: List, y_data: List, x_label: str, y_label: str) -> go.Figure:
+    def _create_figure(self, chart_type: str, x_data: List, y_data: List, x_label: str, y_label: str) -> "go.Figure":
         """Create Plotly figure based on chart type."""
+        # Plotly is only imported once the first chart is drawn
+        import plotly.graph_objects as go
+
         if chart_type == 'pie':
             fig = go.Figure(data=[go.Pie(
                 labels=x_data,
@@ -244,7 +257,7 @@ class VisualizationProcessor:
             
         return fig
 
-    def _generate_html(self, fig: go.Figure) -> str:
+    def _generate_html(self, fig: "go.Figure") -> str:
         """Generate HTML with required headers and configuration."""
         html = fig.to_html(
             full_html=True,
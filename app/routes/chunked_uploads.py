@@ -0,0 +1,87 @@
+import os
+import re
+
+from flask import Blueprint, jsonify, request
+from werkzeug.utils import secure_filename
+
+from ..services.chunked_uploads import ChunkedUploadStore, UploadError
+from .main import REPORT_TYPES, UPLOAD_FOLDER, allowed_file, get_db_service, ingest_upload
+
+chunked_uploads_bp = Blueprint('chunked_uploads', __name__)
+
+# Resumable uploads: POST /upload_sessions, then PUT each chunk with its
+# X-Chunk-SHA256; the last chunk starts the ingest and GET reports progress
+UPLOAD_CHUNK_BYTES = int(os.getenv('UPLOAD_CHUNK_BYTES', str(8 * 1024 * 1024)))
+UPLOAD_MAX_MB = int(os.getenv('UPLOAD_MAX_MB', '2048'))
+UPLOAD_SESSION_TTL = float(os.getenv('UPLOAD_SESSION_TTL', '24'))
+CONTENT_RANGE_PATTERN = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+store = ChunkedUploadStore(
+    os.path.join(UPLOAD_FOLDER, 'incoming'),
+    chunk_size=UPLOAD_CHUNK_BYTES,
+    max_size=UPLOAD_MAX_MB * 1024 * 1024,
+    ttl_seconds=int(UPLOAD_SESSION_TTL * 3600)
+)
+
+
+@chunked_uploads_bp.errorhandler(UploadError)
+def upload_error(e):
+    body = {'error': str(e)}
+    if e.code:
+        body['code'] = e.code
+    return jsonify(body), e.status
+
+
+@chunked_uploads_bp.route('/upload_sessions', methods=['POST'])
+def create_upload_session():
+    data = request.get_json(silent=True) or {}
+    file_type = data.get('report')
+    file_name = secure_filename(data.get('filename') or '')
+    if file_type not in REPORT_TYPES:
+        return jsonify({'error': 'Unknown report type'}), 400
+    if not file_name or not allowed_file(file_name):
+        return jsonify({'error': 'File type not allowed'}), 400
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size is required'}), 400
+
+    # Created now rather than by the ingest, after the file is already in the report folder
+    get_db_service()
+    sha256 = data.get('sha256')
+    return jsonify(store.create(file_type, file_name, size, sha256.lower() if sha256 else None,
+                                shard=data.get('shard'))), 201
+
+
+@chunked_uploads_bp.route('/upload_sessions/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    return jsonify(store.status(upload_id))
+
+
+@chunked_uploads_bp.route('/upload_sessions/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def put_chunk(upload_id, index):
+    data = request.get_data(cache=False)
+    content_range = request.headers.get('Content-Range')
+    if content_range:
+        # Optional, but when sent it has to agree with the chunk index
+        found = CONTENT_RANGE_PATTERN.match(content_range)
+        status = store.status(upload_id)
+        if (not found or int(found.group(1)) != index * status['chunk_size']
+                or int(found.group(2)) - int(found.group(1)) + 1 != len(data)
+                or int(found.group(3)) != status['size']):
+            return jsonify({'error': 'Content-Range does not match the chunk'}), 416
+
+    status = store.write_chunk(upload_id, index, data, request.headers.get('X-Chunk-SHA256'), ingest_upload)
+    # The client only needs the progress here, not the full list for every chunk
+    return jsonify({key: status[key] for key in ('upload_id', 'status', 'total_chunks')}
+                   | {'received': len(status['received'])})
+
+
+@chunked_uploads_bp.route('/upload_sessions/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    status = store.status(upload_id)
+    missing = sorted(set(range(status['total_chunks'])) - set(status['received']))
+    if missing:
+        return jsonify({'error': 'Chunks missing', 'missing': missing}), 409
+    # Starts the ingest again if the worker that ran it died
+    return jsonify(store.complete(upload_id, ingest_upload))
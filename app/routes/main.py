@@ -1,53 +1,194 @@
-from flask import Blueprint, render_template, request, jsonify, current_app
+from flask import Blueprint, render_template, request, jsonify, current_app, g
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
 import os
-import requests
-import glob
-from flask import Blueprint, render_template, request, jsonify, current_app
-from werkzeug.utils import secure_filename
-from ..services.database_service import DatabaseService
+import re
+import uuid
+import logging
+import threading
+from ..services.context_store import create_context_store
+from ..services.speculative_cache import SpeculativeExecutor
+from .responses import cacheable, data_etag, not_modified
 import json
 
 main_bp = Blueprint('main', __name__)
+logger = logging.getLogger(__name__)
 
 UPLOAD_FOLDER = 'datalake'
-ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'xlsm'}
+# Workbooks, and SAP list exports saved as text (read by services.text_reports)
+ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'xlsm', 'csv', 'tsv', 'txt'}
 DB_PATH = os.path.join(UPLOAD_FOLDER, 'datalake.db')
+SESSION_DB_PATH = os.path.join(UPLOAD_FOLDER, 'sessions.db')
+SESSION_COOKIE = 'reportchat_session'
+SESSION_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+MAX_BATCH_PROMPTS = 50
+REPORT_TYPES = ['IW38', 'IW68', 'IW47']
+# Files listed per report on the page; /uploads/<report> serves the rest
+UPLOADS_PAGE_SIZE = 20
+# Snapshots kept per report after each upload; unset keeps the full history
+SNAPSHOT_KEEP = int(os.getenv('SNAPSHOT_KEEP', '0'))
+
+# DB_SHARDING keeps one database per plant section (or SHARD_MAP family) next to DB_PATH
+DB_SHARDING = os.getenv('DB_SHARDING', '').lower() in ('1', 'true', 'yes')
+SHARD_DIR = os.path.join(UPLOAD_FOLDER, 'shards')
+
+# Services are created on first use rather than at import, so importing the
+# app (and every worker boot) stays cheap; warm_up() creates them up front
+_services = {}
+_services_lock = threading.RLock()
+
+def _service(name, factory):
+    service = _services.get(name)
+    if service is None:
+        with _services_lock:
+            service = _services.get(name)
+            if service is None:
+                service = _services[name] = factory()
+    return service
+
+def _create_db_service():
+    if DB_SHARDING:
+        from ..services.sharding import ShardedDatabaseService, ShardRouter
+        service = ShardedDatabaseService(DB_PATH, SHARD_DIR, ShardRouter.from_env())
+    else:
+        from ..services.database_service import DatabaseService
+        service = DatabaseService(DB_PATH)
+    result = service.initialize_database()
+    if not result['success']:
+        logger.error(f"Database initialization failed: {result['error']}")
+    return service
+
+def get_db_service():
+    return _service('db', _create_db_service)
+
+def get_agent_coordinator():
+    """Agent coordinator with per-session conversation context."""
+    def create():
+        from ..agents import AgentCoordinator
+        return AgentCoordinator(create_context_store(SESSION_DB_PATH), db_service=get_db_service())
+    return _service('agents', create)
+
+def get_dashboard_service():
+    """Pinned queries whose results are recomputed after every ingest."""
+    def create():
+        from ..services.dashboard_service import DashboardService
+        return DashboardService(get_db_service(), get_agent_coordinator())
+    return _service('dashboard', create)
 
-# Initialize database service
-db_service = DatabaseService(DB_PATH)
-db_service.initialize_database()
+def warm_up():
+    """
+    Create every service and load the modules the first requests would otherwise wait for.
+
+    Called from create_app with PRELOAD_SERVICES set, or from a server hook
+    before workers start taking traffic.
+    """
+    started = datetime.now()
+    get_dashboard_service()
+    import pandas  # noqa: F401
+    import openpyxl  # noqa: F401
+    import plotly.graph_objects  # noqa: F401
+    # Builds and caches the schema description for the SQL generator
+    get_agent_coordinator().sql_generator.db_structure
+    logger.info(f"Services warmed up in {(datetime.now() - started).total_seconds():.2f}s")
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def get_session_id():
+    """Return the conversation id of the current browser, issuing one if needed."""
+    session_id = request.cookies.get(SESSION_COOKIE, '')
+    if SESSION_ID_PATTERN.match(session_id):
+        return session_id
+    if 'new_session_id' not in g:
+        g.new_session_id = uuid.uuid4().hex
+    return g.new_session_id
+
+@main_bp.after_app_request
+def set_session_cookie(response):
+    if 'new_session_id' in g:
+        response.set_cookie(SESSION_COOKIE, g.new_session_id, httponly=True, samesite='Lax')
+    return response
+
 @main_bp.route('/')
 def home():
-    # Get list of uploaded files for each dropzone
-    uploads = {}
-    for dropzone in ['IW38', 'IW68', 'IW47']:
-        folder_path = os.path.join(UPLOAD_FOLDER, dropzone)
-        if os.path.exists(folder_path):
-            files = []
-            for file in os.listdir(folder_path):
-                file_path = os.path.join(folder_path, file)
-                last_modified = datetime.fromtimestamp(os.path.getmtime(file_path))
-                files.append({
-                    'name': file,
-                    'lastUpdated': last_modified.strftime('%Y-%m-%d %H:%M:%S')
-                })
-            uploads[dropzone] = files
+    # Make sure the browser gets its conversation id with the page
+    get_session_id()
+
+    # The page only changes with the uploads, the data and the schema
+    db_service = get_db_service()
+    etag = data_etag('home', db_service.get_upload_version(), db_service.get_data_version(),
+                     db_service.get_schema_version())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # Newest uploads per dropzone from the upload manifest
+    uploads, upload_cursors = {}, {}
+    for dropzone in REPORT_TYPES:
+        listing = db_service.list_upload_files(dropzone, per_page=UPLOADS_PAGE_SIZE)
+        if listing['success']:
+            uploads[dropzone] = [upload_listing_entry(entry) for entry in listing['files']]
+            upload_cursors[dropzone] = uploads[dropzone][-1]['id'] if listing['has_more'] else None
     
     # Get database structure information
-    db_info = db_service.get_table_info()
+    db_info = db_service.get_visible_table_info()
     
-    return render_template('index.html', uploads=uploads, db_info=db_info.get('tables', {}))
+    page = render_template('index.html', uploads=uploads, upload_cursors=upload_cursors,
+                           uploads_page_size=UPLOADS_PAGE_SIZE, db_info=db_info.get('tables', {}))
+    return cacheable(current_app.make_response(page), etag)
+
+def upload_listing_entry(entry):
+    return {
+        'id': entry['id'],
+        'name': entry['name'],
+        'lastUpdated': entry['uploaded_on'],
+        'status': entry['status'],
+        'rows': entry['row_count'],
+        'sizeBytes': entry['size_bytes']
+    }
+
+@main_bp.route('/uploads/<file_type>', methods=['GET'])
+def list_uploads(file_type):
+    """
+    A page of the files uploaded for a report, newest first (?before=<id>&per_page=20).
 
-from ..agents import AgentCoordinator
+    before is the id of the last file already shown and next_before the one
+    to ask for the page after this, null on the last page.
+    """
+    if file_type not in REPORT_TYPES:
+        return jsonify({'error': 'Unknown report type'}), 404
+    before = request.args.get('before', type=int)
+    per_page = min(100, max(1, request.args.get('per_page', UPLOADS_PAGE_SIZE, type=int)))
+    etag = data_etag('uploads', file_type, before, per_page, get_db_service().get_upload_version())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    listing = get_db_service().list_upload_files(file_type, before, per_page)
+    if not listing['success']:
+        return jsonify({'error': listing['error']}), 500
+    files = [upload_listing_entry(entry) for entry in listing['files']]
+    return cacheable(jsonify({
+        'files': files,
+        'per_page': per_page,
+        'total': listing['total'],
+        'next_before': files[-1]['id'] if listing['has_more'] else None
+    }), etag)
 
-# Initialize agent coordinator
-agent_coordinator = AgentCoordinator()
+# Generated queries are read-only, so start them while the user reviews the SQL.
+# SPECULATIVE_PROCESSING also pre-renders the chart and summaries (costs LLM calls).
+SPECULATIVE_PROCESSING = os.getenv('SPECULATIVE_PROCESSING', '').lower() in ('1', 'true', 'yes')
+speculative_executor = SpeculativeExecutor(ttl_seconds=int(os.getenv('SPECULATIVE_TTL_SECONDS', '120')))
+
+def speculation_key(query, visualization_type):
+    return f"{visualization_type or ''}\n{query}"
+
+def run_speculative_query(query, visualization_type):
+    """Execute a generated query before approval and optionally process its results."""
+    query_result = get_db_service().execute_query(query, read_only=True)
+    process_result = None
+    if SPECULATIVE_PROCESSING and query_result['success']:
+        process_result = get_agent_coordinator().process_query_results(query, query_result, visualization_type)
+    return {'query_result': query_result, 'process_result': process_result}
 
 @main_bp.route('/translate_to_sql', methods=['POST'])
 def translate_to_sql():
@@ -58,7 +199,7 @@ def translate_to_sql():
             return jsonify({'error': 'No message provided'}), 400
             
         # Generate SQL query
-        result = agent_coordinator.generate_sql_query(data['message'])
+        result = get_agent_coordinator().generate_sql_query(data['message'], get_session_id())
         
         if "error" in result:
             return jsonify({'error': result["error"]}), 500
@@ -66,14 +207,46 @@ def translate_to_sql():
         if result.get("type") == "general":
             return jsonify({'message': result["message"]}), 200
             
+        # Start executing while the user reviews the query
+        ticket = speculative_executor.submit(
+            speculation_key(result["query"], result.get("visualization_type")),
+            run_speculative_query,
+            result["query"],
+            result.get("visualization_type")
+        )
+
         return jsonify({
             'query': result["query"],
-            'visualization_type': result.get("visualization_type")
+            'visualization_type': result.get("visualization_type"),
+            'ticket': ticket
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def ingest_upload(file_path, file_type, shard=None):
+    """
+    Ingest a received file, apply snapshot retention and refresh the dashboard.
+
+    Shared by the single-request upload and the chunked uploads, which call
+    it from a background thread once the last chunk is in.
+    """
+    result = get_db_service().process_excel_file(file_path, file_type, shard=shard)
+    if not result['success']:
+        return result
+
+    if SNAPSHOT_KEEP:
+        retention = get_db_service().apply_retention(SNAPSHOT_KEEP)
+        if not retention['success']:
+            logger.error(f"Snapshot retention failed: {retention['error']}")
+
+    # Recompute pinned dashboard queries and the schema prompt statistics against the new data
+    get_dashboard_service().schedule_refresh()
+    schema_prompt = get_agent_coordinator().sql_generator.schema_prompt
+    if schema_prompt is not None:
+        schema_prompt.schedule_rebuild()
+    return result
+
 @main_bp.route('/upload/<dropzone_type>', methods=['POST', 'OPTIONS'])
 def upload_file(dropzone_type):
     if request.method == 'OPTIONS':
@@ -92,6 +265,9 @@ def upload_file(dropzone_type):
     
     if file and allowed_file(file.filename):
         try:
+            # A service created after the file is saved would register it as a pre-existing file
+            get_db_service()
+
             # Create folder if it doesn't exist
             folder_path = os.path.join(UPLOAD_FOLDER, dropzone_type)
             os.makedirs(folder_path, exist_ok=True)
@@ -102,8 +278,9 @@ def upload_file(dropzone_type):
             file_path = os.path.join(folder_path, filename)
             file.save(file_path)
             
-            # Process file and update database
-            result = db_service.process_excel_file(file_path, dropzone_type)
+            # Process file and update database; an optional shard tag overrides plant routing
+            shard = request.form.get('shard') or request.args.get('shard')
+            result = ingest_upload(file_path, dropzone_type, shard)
             
             if not result['success']:
                 return jsonify({
@@ -129,17 +306,27 @@ def execute_sql_query():
         if not data or 'query' not in data:
             return jsonify({'error': 'No query provided'}), 400
             
+        # Claim the speculative result for this exact query if one is parked
+        speculative = speculative_executor.claim(
+            data.get('ticket'),
+            speculation_key(data['query'], data.get('visualization_type'))
+        ) or {}
+        query_result = speculative.get('query_result')
+        process_result = speculative.get('process_result')
+
         # Execute the approved query
-        query_result = db_service.execute_query(data['query'])
+        if not query_result or not query_result['success']:
+            query_result = get_db_service().execute_query(data['query'])
         if not query_result['success']:
             return jsonify({'error': query_result.get('error', 'Unknown error')}), 500
             
         # Process results with visualization and summaries
-        process_result = agent_coordinator.process_query_results(
-            data['query'],
-            query_result,
-            data.get('visualization_type')
-        )
+        if not process_result or "error" in process_result:
+            process_result = get_agent_coordinator().process_query_results(
+                data['query'],
+                query_result,
+                data.get('visualization_type')
+            )
         
         if "error" in process_result:
             return jsonify({'error': process_result["error"]}), 500
@@ -162,6 +349,98 @@ def execute_sql_query():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@main_bp.route('/batch', methods=['POST'])
+def run_batch():
+    """Answer a list of prompts concurrently and return everything together."""
+    try:
+        data = request.get_json()
+        prompts = data.get('prompts') if data else None
+        if not prompts or not isinstance(prompts, list) or not all(isinstance(p, str) for p in prompts):
+            return jsonify({'error': 'Provide a list of prompts'}), 400
+        if len(prompts) > MAX_BATCH_PROMPTS:
+            return jsonify({'error': f'At most {MAX_BATCH_PROMPTS} prompts per batch'}), 400
+
+        return jsonify(get_agent_coordinator().run_batch(prompts))
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main_bp.route('/dashboard', methods=['GET'])
+def get_dashboard():
+    """Serve all pinned queries from the precomputed result store."""
+    try:
+        etag = data_etag('dashboard', get_dashboard_service().get_version())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    result = get_dashboard_service().get_dashboard()
+    if not result['success']:
+        return jsonify({'error': result['error']}), 500
+    return cacheable(jsonify(result), etag)
+
+@main_bp.route('/dashboard/refresh', methods=['POST'])
+def refresh_dashboard():
+    """Recompute all pinned queries in the background."""
+    get_dashboard_service().schedule_refresh()
+    return jsonify({'message': 'Dashboard refresh scheduled'}), 202
+
+@main_bp.route('/saved_queries', methods=['GET'])
+def list_saved_queries():
+    result = get_dashboard_service().list_queries()
+    if not result['success']:
+        return jsonify({'error': result['error']}), 500
+    return jsonify(result['queries'])
+
+@main_bp.route('/saved_queries', methods=['POST'])
+def save_query():
+    """Pin a query to the dashboard."""
+    try:
+        data = request.get_json()
+        if not data or not data.get('name') or not data.get('query'):
+            return jsonify({'error': 'A name and a query are required'}), 400
+
+        result = get_dashboard_service().save_query(
+            data['name'],
+            data['query'],
+            chart_type=data.get('visualization_type'),
+            x_column=data.get('x_column'),
+            y_column=data.get('y_column'),
+            include_summary=bool(data.get('include_summary'))
+        )
+        if not result['success']:
+            return jsonify({'error': result['error']}), 400
+        return jsonify({'id': result['id']}), 201
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main_bp.route('/saved_queries/<int:saved_query_id>', methods=['DELETE'])
+def delete_saved_query(saved_query_id):
+    result = get_dashboard_service().delete_query(saved_query_id)
+    if not result['success']:
+        return jsonify({'error': result['error']}), 404
+    return jsonify({'success': True})
+
+@main_bp.route('/snapshots', methods=['GET'])
+def list_snapshots():
+    """List every upload with its load id, newest first."""
+    # Loads are only added or purged together with a data version bump
+    etag = data_etag('snapshots', get_db_service().get_data_version())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    result = get_db_service().execute_query("SELECT * FROM uploads ORDER BY id DESC", read_only=True)
+    if not result['success']:
+        return jsonify({'error': result['error']}), 500
+    return cacheable(jsonify({'snapshots': result['results']}), etag)
+
+@main_bp.route('/speculative/<ticket>', methods=['DELETE'])
+def discard_speculative(ticket):
+    """Throw away a speculative result the user declined."""
+    return jsonify({'discarded': speculative_executor.discard(ticket)})
+
 # @main_bp.route('/test_visualization')
 # def test_visualization():
 #     """Test route to verify visualization generation."""
@@ -176,29 +455,21 @@ def execute_sql_query():
 
 @main_bp.route('/get_oldest_file', methods=['GET'])
 def get_oldest_file():
-    """Get information about the oldest file in the datalake."""
+    """Get information about the oldest file in the datalake, from the upload manifest."""
     try:
-        oldest_file = None
-        oldest_time = None
-        folder_types = ['IW38', 'IW47', 'IW68']
-        
-        for folder in folder_types:
-            folder_path = os.path.join(UPLOAD_FOLDER, folder)
-            if os.path.exists(folder_path):
-                files = glob.glob(os.path.join(folder_path, '*.xlsx'))
-                for file in files:
-                    mod_time = os.path.getmtime(file)
-                    if oldest_time is None or mod_time < oldest_time:
-                        oldest_time = mod_time
-                        oldest_file = {
-                            'name': os.path.basename(file),
-                            'type': folder,
-                            'last_modified': datetime.fromtimestamp(mod_time).strftime('%Y-%m-%d %H:%M:%S'),
-                            'days_old': (datetime.now() - datetime.fromtimestamp(mod_time)).days
-                        }
-        
+        result = get_db_service().get_oldest_upload_file()
+        if not result['success']:
+            return jsonify({'error': result['error']}), 500
+
+        oldest_file = result['file']
         if oldest_file:
-            return jsonify(oldest_file)
+            uploaded_on = datetime.strptime(oldest_file['uploaded_on'], '%Y-%m-%d %H:%M:%S')
+            return jsonify({
+                'name': oldest_file['name'],
+                'type': oldest_file['file_type'],
+                'last_modified': oldest_file['uploaded_on'],
+                'days_old': (datetime.now() - uploaded_on).days
+            })
         return jsonify({'error': 'No files found'}), 404
         
     except Exception as e:
@@ -0,0 +1,42 @@
+import time
+
+from flask import Blueprint, Response, g, request
+
+from ..services.metrics import HTTP_REQUEST_SECONDS, REGISTRY
+from ..services.request_context import REQUEST_ID_HEADER, current_request_id, request_id_var, start_request
+
+observability_bp = Blueprint('observability', __name__)
+
+
+@observability_bp.before_app_request
+def start_request_tracking():
+    # Every log line written while answering carries this id
+    g.request_id_token = start_request(request.headers.get(REQUEST_ID_HEADER))
+    g.request_started = time.perf_counter()
+
+
+@observability_bp.after_app_request
+def finish_request_tracking(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # The route pattern, not the path, keeps the number of series bounded
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint,
+                                     method=request.method, status=response.status_code)
+    request_id = current_request_id()
+    if request_id:
+        response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
+
+@observability_bp.teardown_app_request
+def end_request_tracking(exc):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        request_id_var.reset(token)
+
+
+@observability_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Latency histograms and counters of this process in the Prometheus text format."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
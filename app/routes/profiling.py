@@ -0,0 +1,102 @@
+import contextlib
+import hmac
+import os
+
+from flask import Blueprint, abort, g, jsonify, request, send_file
+
+from ..services import profiling
+
+profiling_bp = Blueprint('profiling', __name__)
+
+# Profiling is off unless ADMIN_TOKEN is set; profiled requests and the
+# stored profiles need the token in X-Admin-Token or Authorization: Bearer
+PROFILES_DIR = os.path.join('datalake', 'profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))
+
+
+def is_admin() -> bool:
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token:
+        return False
+    supplied = request.headers.get('X-Admin-Token', '')
+    authorization = request.headers.get('Authorization', '')
+    if not supplied and authorization.startswith('Bearer '):
+        supplied = authorization[len('Bearer '):]
+    return hmac.compare_digest(supplied.encode(), admin_token.encode())
+
+
+def profiling_requested() -> bool:
+    flag = request.headers.get('X-Profile') or request.args.get('profile')
+    return bool(flag) and flag.lower() in ('1', 'true', 'yes') and is_admin()
+
+
+def profiler_name() -> str:
+    choice = os.getenv('PROFILER', 'auto').lower()
+    if choice == 'cprofile' or not profiling.sampling_profiler_available():
+        return 'cprofile'
+    return 'pyinstrument'
+
+
+@profiling_bp.before_app_request
+def start_profile():
+    if not profiling_requested():
+        return
+    session = profiling.ProfileSession(request.method, request.full_path.rstrip('?'), profiler_name())
+    g.profile_token = session.activate()
+    g.profile_session = session
+    g.profile_stack = contextlib.ExitStack()
+    g.profile_stack.enter_context(session.profile_thread())
+
+
+@profiling_bp.after_app_request
+def finish_profile(response):
+    session = g.pop('profile_session', None)
+    if session is None:
+        return response
+    g.pop('profile_stack').close()
+    session.save(PROFILES_DIR, response.status_code)
+    profiling.prune_profiles(PROFILES_DIR, PROFILE_KEEP)
+    response.headers['X-Profile-Id'] = session.profile_id
+    response.headers['Link'] = f'</profiles/{session.profile_id}>; rel="profile"'
+    return response
+
+
+@profiling_bp.teardown_app_request
+def end_profile(exc):
+    stack = g.pop('profile_stack', None)
+    if stack is not None:
+        stack.close()
+    token = g.pop('profile_token', None)
+    if token is not None:
+        profiling.deactivate(token)
+
+
+@profiling_bp.route('/profiles', methods=['GET'])
+def list_profiles():
+    if not is_admin():
+        abort(404)
+    return jsonify({'profiles': profiling.list_profiles(PROFILES_DIR)})
+
+
+@profiling_bp.route('/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """
+    A stored profile: the summary as JSON, ?format=text for the profiler
+    report or ?format=pstats for the cProfile data (snakeviz, pstats).
+    """
+    if not is_admin():
+        abort(404)
+    summary = profiling.load_summary(PROFILES_DIR, profile_id)
+    if summary is None:
+        abort(404)
+    path = os.path.join(PROFILES_DIR, profile_id)
+    output = request.args.get('format', 'json')
+    if output == 'text':
+        return send_file(os.path.abspath(os.path.join(path, 'profile.txt')), mimetype='text/plain')
+    if output == 'pstats':
+        pstats_path = os.path.abspath(os.path.join(path, 'profile.pstats'))
+        if not os.path.exists(pstats_path):
+            abort(404)
+        return send_file(pstats_path, mimetype='application/octet-stream', as_attachment=True,
+                         download_name=f'{profile_id}.pstats')
+    return jsonify(summary)
@@ -0,0 +1,142 @@
+import hashlib
+import os
+
+from flask import Blueprint, current_app, request
+
+from ..services.compression import COMPRESSIBLE_TYPES, Compressor, choose_encoding
+
+responses_bp = Blueprint('responses', __name__)
+
+# Responses of at least COMPRESS_MIN_BYTES are sent gzip or, with the brotli
+# package installed, brotli encoded; versioned static URLs are cached for a year
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_MAX_BYTES = int(os.getenv('COMPRESS_MAX_BYTES', str(32 * 1024 * 1024)))
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', str(365 * 24 * 3600)))
+ENCODING_SUFFIXES = ('-gzip', '-br')
+
+compressor = Compressor(
+    gzip_level=int(os.getenv('COMPRESS_LEVEL', '6')),
+    brotli_quality=int(os.getenv('BROTLI_QUALITY', '5'))
+)
+
+
+def _asset_version() -> str:
+    """Digest of the name, size and mtime of every static file and template."""
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha1()
+    for folder in ('static', 'templates'):
+        for root, dirs, files in os.walk(os.path.join(app_dir, folder)):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                digest.update(f"{os.path.relpath(path, app_dir)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:12]
+
+
+ASSET_VERSION = _asset_version()
+
+
+def data_etag(*parts) -> str:
+    """Strong ETag for a response built only from the given versions (and the deployed templates)."""
+    return hashlib.sha1(repr((ASSET_VERSION,) + parts).encode()).hexdigest()[:24]
+
+
+def _strip_coding(tag):
+    # A compressed response carried its coding as a suffix; the content is the same
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)]
+    return tag
+
+
+def _client_etags():
+    return {_strip_coding(tag) for tag in request.if_none_match.as_set()}
+
+
+def _replace_body(response, body):
+    # Close the file a send_file response would otherwise have streamed
+    close = getattr(response.response, 'close', None)
+    response.direct_passthrough = False
+    if close is not None:
+        close()
+    response.set_data(body)
+
+
+def not_modified(etag):
+    """
+    A 304 response when the client already holds this version, else None.
+
+    Views call this before building an expensive response:
+
+        etag = data_etag('dashboard', version)
+        return not_modified(etag) or cacheable(jsonify(...), etag)
+    """
+    if request.if_none_match.star_tag or etag in _client_etags():
+        response = current_app.response_class(status=304)
+        response.vary.add('Accept-Encoding')
+        return cacheable(response, etag)
+    return None
+
+
+def cacheable(response, etag):
+    """Tag a response with its ETag; browsers keep it and revalidate before every use."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@responses_bp.app_url_defaults
+def version_static_urls(endpoint, values):
+    # ?v= changes with every deployed asset change, so those URLs can be cached for good
+    if endpoint == 'static':
+        values.setdefault('v', ASSET_VERSION)
+
+
+@responses_bp.after_app_request
+def finish_response(response):
+    if request.endpoint == 'static' and response.status_code in (200, 304):
+        if request.args.get('v') == ASSET_VERSION and not current_app.debug:
+            response.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}, immutable'
+
+    if response.status_code == 200 and response.headers.get('ETag'):
+        etag, weak = response.get_etag()
+        if not weak and etag in _client_etags():
+            # Views tagged with cacheable() that did not check not_modified(), and static files
+            # whose If-None-Match carries a coding suffix
+            response.status_code = 304
+            _replace_body(response, b'')
+            response.headers.pop('Content-Length', None)
+            return response
+
+    return compress_response(response)
+
+
+def compress_response(response):
+    if (response.status_code != 200 or response.headers.get('Content-Encoding')
+            or response.mimetype not in COMPRESSIBLE_TYPES or request.method == 'HEAD'):
+        return response
+    if response.is_streamed and not response.direct_passthrough:
+        # Generators are sent as they produce; buffering them would defeat the point
+        return response
+    length = response.content_length
+    if length is None or not COMPRESS_MIN_BYTES <= length <= COMPRESS_MAX_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    coding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if coding is None:
+        return response
+
+    etag, weak = response.get_etag()
+    if response.direct_passthrough:
+        # send_file responses pass their file through; read it to encode it
+        body = b''.join(response.response)
+    else:
+        body = response.get_data()
+    _replace_body(response, compressor.compress(body, coding, None if weak else etag))
+    response.headers['Content-Encoding'] = coding
+    response.headers.pop('Accept-Ranges', None)
+    if etag:
+        # The encoded body is a different representation and needs its own tag
+        response.set_etag(f"{etag}-{coding}", weak=weak)
+    return response
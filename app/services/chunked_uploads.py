@@ -0,0 +1,427 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from .request_context import bind_context
+from .text_reports import is_text_report
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+SESSION_FILE = "session.json"
+STATUS_FILE = "status.json"
+COMPLETE_LOCK = "complete.lock"
+TAKEOVER_PREFIX = "takeover."
+DATA_FILE = "data.part"
+CHUNK_DIR = "chunks"
+HASH_CHUNK_BYTES = 1024 * 1024
+# Workbooks are zip archives; anything else with an Excel extension is rejected on the first chunk
+ZIP_SIGNATURE = b"PK\x03\x04"
+CHUNK_CHECKSUM_MISMATCH = "chunk_checksum_mismatch"
+
+
+class UploadError(Exception):
+    """
+    A request the upload session cannot accept.
+
+    status is the HTTP status to answer with; code, when set, tells clients
+    which errors are worth a retry (CHUNK_CHECKSUM_MISMATCH: the chunk was
+    damaged on the way and sending it again can succeed).
+    """
+
+    def __init__(self, message: str, status: int = 400, code: Optional[str] = None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    # Written next to the target and renamed, so readers never see half a file
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ChunkedUploadStore:
+    """
+    Resumable uploads, received as fixed-size chunks in any order.
+
+    A session is a directory under incoming_dir holding its parameters, a
+    sparse data file of the final size that every chunk is written into at
+    its own offset, and a marker file per verified chunk. All state is on
+    disk, so chunks of one upload may arrive at different worker processes
+    and a client that lost its connection asks which chunks are missing and
+    sends only those.
+
+    When the last chunk arrives the file is handed to the ingest callback
+    on a background thread; the session status then moves from
+    'uploading' to 'ingesting' and on to 'ingested' or 'failed'. The first
+    chunk is checked before the rest is uploaded: a workbook must start as
+    a zip archive and a text export must have a header line, so a wrong
+    file fails after one chunk instead of after the whole upload.
+
+    The ingest lock names the process that owns it and is touched every
+    lock_timeout / 4 seconds while the ingest is queued or running. A lock
+    whose owner died (a dead pid on this host, or no heartbeat for
+    lock_timeout seconds) is stale, and the next complete() hands the file
+    to an ingest of its own.
+    """
+
+    def __init__(self, incoming_dir: str, chunk_size: int = 8 * 1024 * 1024, max_size: int = 2 * 1024 ** 3,
+                 ttl_seconds: int = 24 * 3600, max_workers: int = 1, lock_timeout: int = 120):
+        self.incoming_dir = incoming_dir
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.lock_timeout = lock_timeout
+        # Ingests write to the same database and would only queue on its lock
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload-ingest")
+        # Ingest locks of this process and the thread that keeps them fresh
+        self._owned_locks = set()
+        self._owned_locks_lock = threading.Lock()
+        self._heartbeat = None
+
+    def _path(self, upload_id: str, *names: str) -> str:
+        if not UPLOAD_ID_PATTERN.match(upload_id):
+            raise UploadError("Unknown upload", 404)
+        return os.path.join(self.incoming_dir, upload_id, *names)
+
+    def _session(self, upload_id: str) -> Dict[str, Any]:
+        session = _read_json(self._path(upload_id, SESSION_FILE))
+        if session is None:
+            raise UploadError("Unknown upload", 404)
+        return session
+
+    def create(self, file_type: str, file_name: str, size: int, sha256: Optional[str] = None,
+               shard: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Start an upload session.
+
+        Args:
+            file_type: Report type the file is ingested as
+            file_name: Name of the file on the client, already made safe
+            size: File size in bytes
+            sha256: Hex digest of the whole file, checked before ingesting
+            shard: Upload tag passed on to the ingest
+
+        Returns:
+            The session status (see status())
+        """
+        if size <= 0:
+            raise UploadError("The file is empty")
+        if size > self.max_size:
+            raise UploadError(f"Files are limited to {self.max_size // 1024 ** 2} MB", 413)
+        if sha256 is not None and not re.match(r"^[0-9a-f]{64}$", sha256):
+            raise UploadError("sha256 must be a hex digest")
+        self.prune()
+
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self.incoming_dir, upload_id)
+        os.makedirs(os.path.join(path, CHUNK_DIR))
+        with open(os.path.join(path, DATA_FILE), "wb") as f:
+            f.truncate(size)
+        _write_json(os.path.join(path, SESSION_FILE), {
+            "upload_id": upload_id,
+            "file_type": file_type,
+            "file_name": file_name,
+            "size": size,
+            "sha256": sha256,
+            "shard": shard,
+            "chunk_size": self.chunk_size,
+            "total_chunks": -(-size // self.chunk_size),
+            "created_on": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        logger.info({
+            "agent": "ChunkedUploadStore",
+            "action": "upload_started",
+            "upload_id": upload_id,
+            "file_type": file_type,
+            "size": size
+        })
+        return self.status(upload_id)
+
+    def received_chunks(self, upload_id: str) -> List[int]:
+        try:
+            return sorted(int(name) for name in os.listdir(self._path(upload_id, CHUNK_DIR)) if name.isdigit())
+        except FileNotFoundError:
+            raise UploadError("Unknown upload", 404)
+
+    def status(self, upload_id: str) -> Dict[str, Any]:
+        """
+        Where an upload stands.
+
+        Returns:
+            Dict containing:
+            - upload_id, file_type, file_name, size, chunk_size, total_chunks
+            - received: indexes of the chunks stored so far
+            - status: uploading, ingesting, ingested or failed
+            - result: the ingest result once ingested or failed
+        """
+        session = self._session(upload_id)
+        status = _read_json(self._path(upload_id, STATUS_FILE)) or {"status": "uploading"}
+        return {
+            **{key: session[key] for key in
+               ("upload_id", "file_type", "file_name", "size", "chunk_size", "total_chunks")},
+            "received": self.received_chunks(upload_id),
+            **status
+        }
+
+    def write_chunk(self, upload_id: str, index: int, data: bytes, sha256: Optional[str],
+                    ingest: Callable[[str, str, Optional[str]], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Store one chunk after checking its length and checksum.
+
+        Chunks already stored are accepted again without rewriting, so a
+        client may retry freely. The chunk that completes the file starts
+        the ingest.
+
+        Args:
+            upload_id: The session
+            index: Zero-based chunk number; chunk i covers bytes i * chunk_size onwards
+            data: The chunk
+            sha256: Hex digest of the chunk, if the client sent one
+            ingest: Called as ingest(file_path, file_type, shard) once the file is complete
+
+        Returns:
+            The session status
+        """
+        session = self._session(upload_id)
+        if _read_json(self._path(upload_id, STATUS_FILE)):
+            return self.status(upload_id)
+        if not 0 <= index < session["total_chunks"]:
+            raise UploadError("Chunk index out of range", 416)
+        start = index * session["chunk_size"]
+        expected = min(session["chunk_size"], session["size"] - start)
+        if len(data) != expected:
+            raise UploadError(f"Chunk {index} must be {expected} bytes, got {len(data)}")
+        if sha256 is not None and hashlib.sha256(data).hexdigest() != sha256.lower():
+            raise UploadError(f"Checksum mismatch for chunk {index}", 422, CHUNK_CHECKSUM_MISMATCH)
+
+        marker = self._path(upload_id, CHUNK_DIR, str(index))
+        if not os.path.exists(marker):
+            if index == 0:
+                self._check_first_chunk(session, data)
+            fd = os.open(self._path(upload_id, DATA_FILE), os.O_WRONLY)
+            try:
+                os.pwrite(fd, data, start)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            with open(marker, "w") as f:
+                f.write(hashlib.sha256(data).hexdigest() if sha256 is None else sha256.lower())
+
+        if len(self.received_chunks(upload_id)) == session["total_chunks"]:
+            self._complete(session, ingest)
+        return self.status(upload_id)
+
+    def complete(self, upload_id: str, ingest: Callable[[str, str, Optional[str]], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Make sure a fully received upload gets ingested.
+
+        The last chunk normally starts the ingest already; this starts it
+        again only if the process that held the ingest lock died.
+
+        Returns:
+            The session status
+        """
+        session = self._session(upload_id)
+        if len(self.received_chunks(upload_id)) == session["total_chunks"]:
+            self._complete(session, ingest)
+        return self.status(upload_id)
+
+    def _check_first_chunk(self, session: Dict[str, Any], data: bytes) -> None:
+        file_name = session["file_name"].lower()
+        if file_name.endswith((".xlsx", ".xlsm")) and not data.startswith(ZIP_SIGNATURE):
+            raise UploadError("The file is not an Excel workbook", 422)
+        if is_text_report(file_name):
+            from .database_service import KNOWN_HEADERS
+            from .text_reports import TextReport
+
+            head_path = self._path(session["upload_id"], "head" + os.path.splitext(file_name)[1])
+            with open(head_path, "wb") as f:
+                f.write(data)
+            try:
+                TextReport.detect(head_path, KNOWN_HEADERS)
+            except ValueError as e:
+                raise UploadError(str(e), 422)
+            finally:
+                os.remove(head_path)
+
+    def _complete(self, session: Dict[str, Any], ingest) -> None:
+        upload_id = session["upload_id"]
+        lock_path = self._path(upload_id, COMPLETE_LOCK)
+        owner = {"pid": os.getpid(), "host": socket.gethostname(), "token": uuid.uuid4().hex}
+        try:
+            # Only the request that creates the lock hands the file over
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not self._take_over(upload_id, owner):
+                return
+        else:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(owner, f)
+        status = _read_json(self._path(upload_id, STATUS_FILE))
+        if not status or status["status"] != "ingesting":
+            _write_json(self._path(upload_id, STATUS_FILE), {"status": "ingesting"})
+        self._keep_alive(lock_path)
+        self._executor.submit(bind_context(self._ingest, session, ingest))
+
+    def _take_over(self, upload_id: str, owner: Dict[str, Any]) -> bool:
+        """Claim the ingest lock of an unfinished upload whose owner died."""
+        status = _read_json(self._path(upload_id, STATUS_FILE)) or {"status": "uploading"}
+        if status["status"] not in ("uploading", "ingesting"):
+            return False
+        lock_path = self._path(upload_id, COMPLETE_LOCK)
+        stale = _read_json(lock_path) or {}
+        if not self._is_stale(lock_path, stale):
+            return False
+        try:
+            # Of several requests that find the same stale lock, one takes it over
+            os.close(os.open(self._path(upload_id, TAKEOVER_PREFIX + str(stale.get("token"))),
+                             os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+        _write_json(lock_path, owner)
+        logger.warning({
+            "agent": "ChunkedUploadStore",
+            "action": "stale_ingest_resubmitted",
+            "upload_id": upload_id,
+            "previous_pid": stale.get("pid"),
+            "previous_host": stale.get("host")
+        })
+        return True
+
+    def _is_stale(self, lock_path: str, lock: Dict[str, Any]) -> bool:
+        try:
+            heartbeat = os.path.getmtime(lock_path)
+        except FileNotFoundError:
+            return False
+        if time.time() - heartbeat > self.lock_timeout:
+            return True
+        return (lock.get("host") == socket.gethostname() and isinstance(lock.get("pid"), int)
+                and not _process_alive(lock["pid"]))
+
+    def _keep_alive(self, lock_path: str) -> None:
+        with self._owned_locks_lock:
+            self._owned_locks.add(lock_path)
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, name="upload-heartbeat", daemon=True)
+                self._heartbeat.start()
+
+    def _beat(self) -> None:
+        while True:
+            time.sleep(self.lock_timeout / 4)
+            with self._owned_locks_lock:
+                lock_paths = list(self._owned_locks)
+            for lock_path in lock_paths:
+                try:
+                    os.utime(lock_path)
+                except OSError:
+                    pass
+
+    def _ingest(self, session: Dict[str, Any], ingest) -> None:
+        upload_id = session["upload_id"]
+        started = time.perf_counter()
+        try:
+            data_path = self._path(upload_id, DATA_FILE)
+            folder_path = os.path.join(os.path.dirname(os.path.abspath(self.incoming_dir)), session["file_type"])
+            moved = (_read_json(self._path(upload_id, STATUS_FILE)) or {}).get("filename")
+            if moved and not os.path.exists(data_path):
+                # A previous owner died after moving the file into the report folder
+                file_path = os.path.join(folder_path, moved)
+            else:
+                if session["sha256"]:
+                    digest = hashlib.sha256()
+                    with open(data_path, "rb") as f:
+                        for block in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+                            digest.update(block)
+                    if digest.hexdigest() != session["sha256"]:
+                        raise UploadError("Checksum mismatch for the whole file", 422)
+
+                os.makedirs(folder_path, exist_ok=True)
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                file_path = os.path.join(folder_path, f"{timestamp}_{session['file_name']}")
+                _write_json(self._path(upload_id, STATUS_FILE),
+                            {"status": "ingesting", "filename": os.path.basename(file_path)})
+                os.replace(data_path, file_path)
+            result = ingest(file_path, session["file_type"], session.get("shard"))
+            status = {
+                "status": "ingested" if result.get("success") else "failed",
+                "filename": os.path.basename(file_path),
+                "lastUpdated": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "result": result
+            }
+        except Exception as e:
+            status = {"status": "failed", "result": {"success": False, "error": str(e)}}
+
+        _write_json(self._path(upload_id, STATUS_FILE), status)
+        with self._owned_locks_lock:
+            self._owned_locks.discard(self._path(upload_id, COMPLETE_LOCK))
+        logger.info({
+            "agent": "ChunkedUploadStore",
+            "action": "upload_ingested",
+            "upload_id": upload_id,
+            "status": status["status"],
+            "error": status["result"].get("error"),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+        })
+
+    def prune(self) -> None:
+        """Delete sessions without activity for ttl_seconds, finished or not."""
+        if not os.path.isdir(self.incoming_dir):
+            return
+        cutoff = time.time() - self.ttl_seconds
+        for name in os.listdir(self.incoming_dir):
+            path = os.path.join(self.incoming_dir, name)
+            if UPLOAD_ID_PATTERN.match(name) and self._last_activity(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _last_activity(self, path: str) -> float:
+        """
+        When a session was last written to.
+
+        Writing a chunk or its marker does not change the mtime of the
+        session directory, so this is the newest of the session file (its
+        creation), the chunk markers, the status and the ingest heartbeat.
+        """
+        names = [SESSION_FILE, STATUS_FILE, COMPLETE_LOCK]
+        try:
+            names += [os.path.join(CHUNK_DIR, name) for name in os.listdir(os.path.join(path, CHUNK_DIR))]
+        except OSError:
+            pass
+        newest = 0.0
+        for name in names:
+            try:
+                newest = max(newest, os.path.getmtime(os.path.join(path, name)))
+            except OSError:
+                pass
+        return newest or os.path.getmtime(path)
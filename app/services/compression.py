@@ -0,0 +1,91 @@
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content types worth compressing; images and workbooks are compressed already
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/css", "text/plain", "text/csv", "text/javascript", "application/javascript",
+    "application/json", "image/svg+xml"
+}
+
+
+def brotli_available() -> bool:
+    return brotli is not None
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Codings of an Accept-Encoding header with their q values; q=0 means the coding is refused."""
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_encoding(header: Optional[str]) -> Optional[str]:
+    """br when brotli is installed and the client ranks it at least as high as gzip, else gzip, else None."""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0)
+    gzip_quality = accepted.get("gzip", wildcard)
+    br_quality = accepted.get("br", wildcard)
+    if brotli is not None and br_quality > 0 and br_quality >= gzip_quality:
+        return "br"
+    return "gzip" if gzip_quality > 0 else None
+
+
+class Compressor:
+    """
+    gzip and brotli encoding of response bodies.
+
+    Bodies that come with a strong ETag identify their content, so their
+    encoded form is kept in a small LRU cache under (ETag, coding):
+    static assets and revalidated pages are compressed once per version
+    rather than on every request.
+    """
+
+    def __init__(self, gzip_level: int = 6, brotli_quality: int = 5, cache_entries: int = 128,
+                 cache_max_body: int = 4 * 1024 * 1024):
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_entries = cache_entries
+        self.cache_max_body = cache_max_body
+        self._cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compress(self, body: bytes, coding: str, etag: Optional[str] = None) -> bytes:
+        key = (etag, coding) if etag and len(body) <= self.cache_max_body else None
+        if key is not None:
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    return cached
+
+        if coding == "br":
+            encoded = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            # mtime=0 keeps the output identical for identical bodies
+            encoded = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+        if key is not None:
+            with self._lock:
+                self._cache[key] = encoded
+                while len(self._cache) > self.cache_entries:
+                    self._cache.popitem(last=False)
+        return encoded
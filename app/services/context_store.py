@@ -0,0 +1,204 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+
+
+class ContextStore:
+    """
+    In-process, per-session conversation context.
+
+    Each session keeps a bounded, compacted history of (prompt, query) pairs.
+    Sessions are evicted least-recently-used once max_sessions is reached and
+    expire ttl_seconds after their last access.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: int = 3600,
+                 max_history: int = 5, max_prompt_chars: int = 500):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_history = max_history
+        self.max_prompt_chars = max_prompt_chars
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def get_history(self, session_id: str) -> List[Dict[str, Any]]:
+        """Return the compacted history for a session, oldest entry first."""
+        if not session_id:
+            return []
+        with self._lock:
+            return self._load(session_id)
+
+    def append(self, session_id: str, prompt: str, query: str) -> None:
+        """Record a generated query for a session and compact its history."""
+        if not session_id or not query:
+            return
+        with self._lock:
+            history = self._load(session_id)
+            history.append({
+                "prompt": prompt[:self.max_prompt_chars],
+                "query": " ".join(query.split()),
+                "created_at": time.time()
+            })
+            self._save(session_id, self._compact(history))
+
+    def get_previous_context(self, session_id: str) -> Optional[str]:
+        """
+        Render the session history as follow-up context for the SQL generator.
+
+        Returns:
+            Text listing earlier questions and their SQL, or None if the
+            session has no history
+        """
+        history = self.get_history(session_id)
+        if not history:
+            return None
+        lines = []
+        for i, entry in enumerate(history, 1):
+            lines.append(f"{i}. Question: {entry['prompt']}\n   SQL: {entry['query']}")
+        return "\n".join(lines)
+
+    def clear(self, session_id: str) -> None:
+        """Forget all context for a session."""
+        with self._lock:
+            self._delete(session_id)
+
+    def _compact(self, history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop repeated queries and keep only the most recent entries."""
+        compacted = []
+        for entry in history:
+            if compacted and compacted[-1]["query"] == entry["query"]:
+                compacted[-1] = entry
+            else:
+                compacted.append(entry)
+        return compacted[-self.max_history:]
+
+    def _load(self, session_id: str) -> List[Dict[str, Any]]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return []
+        if time.time() - entry["accessed_at"] > self.ttl_seconds:
+            self._sessions.pop(session_id, None)
+            return []
+        entry["accessed_at"] = time.time()
+        self._sessions.move_to_end(session_id)
+        return list(entry["history"])
+
+    def _save(self, session_id: str, history: List[Dict[str, Any]]) -> None:
+        self._sessions[session_id] = {"history": history, "accessed_at": time.time()}
+        self._sessions.move_to_end(session_id)
+        self._evict()
+
+    def _delete(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+    def _evict(self) -> None:
+        """Remove expired sessions from the LRU end, then enforce the size bound."""
+        cutoff = time.time() - self.ttl_seconds
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if oldest["accessed_at"] >= cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.pop(oldest_id)
+
+
+class SQLiteContextStore(ContextStore):
+    """
+    Context store shared by all worker processes through a SQLite file.
+
+    History is read from disk on every access so that a session served by
+    different workers always sees the same context.
+    """
+
+    def __init__(self, db_path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.db_path = db_path
+        self._writes = 0
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_context (
+                    session_id TEXT PRIMARY KEY,
+                    history TEXT,
+                    accessed_at REAL
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_session_context_accessed
+                ON session_context(accessed_at)
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _load(self, session_id: str) -> List[Dict[str, Any]]:
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT history, accessed_at FROM session_context WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+            if row is None:
+                return []
+            if time.time() - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM session_context WHERE session_id = ?", (session_id,))
+                return []
+            conn.execute(
+                "UPDATE session_context SET accessed_at = ? WHERE session_id = ?",
+                (time.time(), session_id)
+            )
+            return json.loads(row[0])
+
+    def _save(self, session_id: str, history: List[Dict[str, Any]]) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                INSERT INTO session_context (session_id, history, accessed_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    history = excluded.history,
+                    accessed_at = excluded.accessed_at
+            """, (session_id, json.dumps(history), time.time()))
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict_persisted(conn)
+
+    def _delete(self, session_id: str) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM session_context WHERE session_id = ?", (session_id,))
+
+    def _evict_persisted(self, conn) -> None:
+        """Purge expired sessions and trim the table to max_sessions."""
+        conn.execute(
+            "DELETE FROM session_context WHERE accessed_at < ?",
+            (time.time() - self.ttl_seconds,)
+        )
+        conn.execute("""
+            DELETE FROM session_context WHERE session_id IN (
+                SELECT session_id FROM session_context
+                ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_sessions,))
+
+
+def create_context_store(default_db_path: str) -> ContextStore:
+    """
+    Build the context store selected by the CONTEXT_STORE environment variable.
+
+    CONTEXT_STORE=sqlite shares context between worker processes through
+    CONTEXT_DB_PATH (defaults to default_db_path); anything else keeps it in
+    process memory.
+    """
+    options = {
+        "max_sessions": int(os.getenv("CONTEXT_MAX_SESSIONS", "1000")),
+        "ttl_seconds": int(os.getenv("CONTEXT_TTL_SECONDS", "3600")),
+        "max_history": int(os.getenv("CONTEXT_MAX_HISTORY", "5"))
+    }
+    if os.getenv("CONTEXT_STORE", "memory").lower() == "sqlite":
+        return SQLiteContextStore(os.getenv("CONTEXT_DB_PATH", default_db_path), **options)
+    return ContextStore(**options)
@@ -0,0 +1,229 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Dashboard tiles show summaries of pinned questions, not full extracts
+MAX_DASHBOARD_ROWS = 5000
+
+
+class DashboardService:
+    """
+    Saved-query registry with results precomputed after every ingest.
+
+    Chart columns are chosen once when a query is saved, so refreshing the
+    dashboard only costs SQL (plus a management summary for queries that ask
+    for one) and opening it costs a single read of the result store.
+    """
+
+    def __init__(self, db_service, coordinator, max_workers: int = 4):
+        self.db_service = db_service
+        self.coordinator = coordinator
+        self.max_workers = max_workers
+        self._refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dashboard")
+        self._refresh_lock = threading.Lock()
+        self._refresh_pending = False
+
+    def save_query(self, name: str, sql: str, chart_type: Optional[str] = None,
+                   x_column: Optional[str] = None, y_column: Optional[str] = None,
+                   include_summary: bool = False) -> Dict[str, Any]:
+        """Validate and pin a query, then compute its first result in the background."""
+        validation = self.db_service.validate_query(sql)
+        if not validation["success"]:
+            return {"success": False, "error": f"Invalid SQL: {validation['error']}"}
+
+        if chart_type and not (x_column and y_column):
+            columns = self.coordinator.sql_generator.get_visualization_columns(sql, chart_type)
+            if "error" not in columns:
+                x_column, y_column = columns.get("x"), columns.get("y")
+
+        try:
+            with closing(self.db_service.get_db_connection()) as conn, conn:
+                cursor = conn.execute("""
+                    INSERT INTO saved_queries (
+                        name, sql, chart_type, x_column, y_column, include_summary, created_on
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (name, sql, chart_type, x_column, y_column, int(bool(include_summary)),
+                      datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+                saved_query_id = cursor.lastrowid
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+        self.schedule_refresh()
+        return {"success": True, "id": saved_query_id}
+
+    def list_queries(self) -> Dict[str, Any]:
+        try:
+            with closing(self.db_service.get_db_connection()) as conn, conn:
+                conn.row_factory = _dict_row
+                queries = conn.execute("SELECT * FROM saved_queries ORDER BY id").fetchall()
+            return {"success": True, "queries": queries}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def delete_query(self, saved_query_id: int) -> Dict[str, Any]:
+        try:
+            with closing(self.db_service.get_db_connection()) as conn, conn:
+                conn.execute("DELETE FROM saved_query_results WHERE saved_query_id = ?", (saved_query_id,))
+                deleted = conn.execute("DELETE FROM saved_queries WHERE id = ?", (saved_query_id,)).rowcount
+            if not deleted:
+                return {"success": False, "error": "Saved query not found"}
+            return {"success": True}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def get_dashboard(self) -> Dict[str, Any]:
+        """Return every saved query with its precomputed result, without running anything."""
+        try:
+            with closing(self.db_service.get_db_connection()) as conn, conn:
+                conn.row_factory = _dict_row
+                tiles = conn.execute("""
+                    SELECT q.id, q.name, q.sql, q.chart_type, q.include_summary,
+                           r.data_version, r.refreshed_on, r.duration_ms, r.row_count,
+                           r.results, r.chart_spec, r.summary, r.error
+                    FROM saved_queries q
+                    LEFT JOIN saved_query_results r ON r.saved_query_id = q.id
+                    ORDER BY q.id
+                """).fetchall()
+            for tile in tiles:
+                tile["results"] = json.loads(tile["results"]) if tile["results"] else None
+                tile["chart_spec"] = json.loads(tile["chart_spec"]) if tile["chart_spec"] else None
+            return {"success": True, "data_version": self.db_service.get_data_version(), "tiles": tiles}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def get_version(self) -> str:
+        """
+        Identify the current dashboard without reading the stored results.
+
+        Changes when a query is saved or deleted and whenever a refresh
+        rewrites a result.
+        """
+        with closing(self.db_service.get_db_connection()) as conn, conn:
+            row = conn.execute("""
+                SELECT group_concat(q.id || ':' || IFNULL(r.refreshed_on, '') || ':' || IFNULL(r.duration_ms, ''))
+                FROM saved_queries q
+                LEFT JOIN saved_query_results r ON r.saved_query_id = q.id
+            """).fetchone()
+        return f"{self.db_service.get_data_version()}/{row[0] or ''}"
+
+    def schedule_refresh(self) -> None:
+        """
+        Queue a refresh of all saved queries.
+
+        Calls made while a refresh is already queued collapse into it, so a
+        burst of uploads triggers at most one extra refresh.
+        """
+        with self._refresh_lock:
+            if self._refresh_pending:
+                return
+            self._refresh_pending = True
+        self._refresh_executor.submit(self._run_scheduled_refresh)
+
+    def _run_scheduled_refresh(self) -> None:
+        with self._refresh_lock:
+            self._refresh_pending = False
+        self.refresh_all()
+
+    def refresh_all(self) -> Dict[str, Any]:
+        """Re-run every saved query in a worker pool and store the results."""
+        started = time.perf_counter()
+        listing = self.list_queries()
+        if not listing["success"]:
+            logger.error({
+                "agent": "DashboardService",
+                "action": "refresh_failed",
+                "error": listing["error"]
+            })
+            return listing
+
+        data_version = self.db_service.get_data_version()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dashboard-query") as pool:
+            outcomes = list(pool.map(lambda q: self._refresh_query(q, data_version), listing["queries"]))
+
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info({
+            "agent": "DashboardService",
+            "action": "refresh_complete",
+            "queries": len(outcomes),
+            "failed": outcomes.count(False),
+            "data_version": data_version,
+            "elapsed_ms": elapsed_ms
+        })
+        return {"success": True, "refreshed": len(outcomes), "failed": outcomes.count(False), "elapsed_ms": elapsed_ms}
+
+    def _refresh_query(self, saved_query: Dict[str, Any], data_version: int) -> bool:
+        started = time.perf_counter()
+        results = chart_spec = summary = error = None
+        row_count = 0
+
+        query_result = self.db_service.execute_query(saved_query["sql"], read_only=True)
+        if query_result["success"]:
+            rows = query_result["results"]
+            row_count = len(rows)
+            results = rows[:MAX_DASHBOARD_ROWS]
+            if saved_query["chart_type"] and rows:
+                viz_result = self.coordinator.viz_processor.generate_visualization(
+                    rows,
+                    {
+                        "type": saved_query["chart_type"],
+                        "columns": {"x": saved_query["x_column"], "y": saved_query["y_column"]}
+                    },
+                    output="spec"
+                )
+                if viz_result["success"]:
+                    chart_spec = viz_result["spec"]
+            if saved_query["include_summary"] and rows:
+                summary_result = self.coordinator.summary_generator.generate_management_summary(
+                    results, saved_query["sql"]
+                )
+                summary = summary_result.get("management_summary")
+        else:
+            error = query_result["error"]
+
+        try:
+            with closing(self.db_service.get_db_connection()) as conn, conn:
+                conn.execute("""
+                    INSERT INTO saved_query_results (
+                        saved_query_id, data_version, refreshed_on, duration_ms,
+                        row_count, results, chart_spec, summary, error
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(saved_query_id) DO UPDATE SET
+                        data_version = excluded.data_version,
+                        refreshed_on = excluded.refreshed_on,
+                        duration_ms = excluded.duration_ms,
+                        row_count = excluded.row_count,
+                        results = excluded.results,
+                        chart_spec = excluded.chart_spec,
+                        summary = excluded.summary,
+                        error = excluded.error
+                """, (
+                    saved_query["id"],
+                    data_version,
+                    datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    round((time.perf_counter() - started) * 1000, 1),
+                    row_count,
+                    json.dumps(results, default=str) if results is not None else None,
+                    chart_spec,
+                    summary,
+                    error
+                ))
+        except Exception as e:
+            logger.error({
+                "agent": "DashboardService",
+                "action": "store_result_failed",
+                "saved_query_id": saved_query["id"],
+                "error": str(e)
+            })
+            return False
+        return error is None
+
+
+def _dict_row(cursor, row) -> Dict[str, Any]:
+    return {description[0]: value for description, value in zip(cursor.description, row)}
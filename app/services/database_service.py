@@ -1,142 +1,397 @@
 import sqlite3
-import pandas as pd
 import os
-from typing import Dict, Any
+import itertools
+import logging
+import time
+from contextlib import closing
+from urllib.request import pathname2url
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple, TYPE_CHECKING
+from .rollups import RollupMaintainer
+from .link_index import LinkIndexMaintainer
+from .text_index import TextIndexMaintainer, TEXT_INDEX_TABLES
+from .snapshots import SnapshotManager, CURRENT_VIEWS
+from .staging import StagingStore, normalize_frame
+from .text_reports import TextReport, is_text_report
+from .upload_manifest import MANIFEST_TABLE, UploadManifest
+from .metrics import observe_ingest, observe_query
+from . import profiling
+from .dictionary_encoding import (
+    DictionaryEncoder, STORAGE_TABLES, create_dimensions, create_views, detach_legacy_tables, copy_legacy_rows,
+    prompt_notes as encoding_prompt_notes
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Authorizer actions a read-only query may perform
+READ_ONLY_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    getattr(sqlite3, 'SQLITE_RECURSIVE', 33)
+}
+
+# Application bookkeeping tables that hold no SAP data
+INTERNAL_TABLES = {'db_meta', 'saved_queries', 'saved_query_results', MANIFEST_TABLE}
+
+# Bookkeeping, encoded storage, full-text index and snapshot views: neither users nor
+# the model are shown these; the prompt notes describe what the model needs of them
+HIDDEN_TABLES = INTERNAL_TABLES | STORAGE_TABLES | TEXT_INDEX_TABLES | CURRENT_VIEWS
+
+
+def is_hidden_table(name: str) -> bool:
+    return name.startswith('sqlite_') or name in HIDDEN_TABLES
+
+# Excel header for each column, in table order
+COMMON_COLUMNS = [
+    ('order_number', 'Order'),
+    ('notification_number', 'Notification'),
+    ('breakdown', 'Breakdown'),
+    ('functional_location', 'Functional Loc.')
+]
+
+REPORT_COLUMNS = {
+    'IW38': [
+        ('created_on', 'Created on'),
+        ('basic_start_date', 'Bas. start date'),
+        ('equipment', 'Equipment'),
+        ('description', 'Description'),
+        ('plant_section', 'Plant section'),
+        ('total_actual_costs', 'Total act.costs'),
+        ('order_type', 'Order Type'),
+        ('main_workcenter', 'Main WorkCtr'),
+        ('maintenance_plan', 'MaintenancePlan'),
+        ('actual_finish', 'Actual finish'),
+        ('cost_center', 'Cost Center'),
+        ('basic_finish_date', 'Basic fin. date'),
+        ('breakdown_duration', 'Breakdown dur.')
+    ],
+    'IW68': [
+        ('code_group', 'Code group'),
+        ('problem_group_text', 'Prob. grp. text'),
+        ('damage_code', 'Damage Code'),
+        ('problem_code_text', 'Prob. code text'),
+        ('item_text', 'Text'),
+        ('cause_code', 'Cause code'),
+        ('cause_group_text', 'Cause grp. text'),
+        ('cause_text', 'Cause text'),
+        ('effect', 'Effect'),
+        ('reported_by', 'Reported by')
+    ],
+    'IW47': [
+        ('created_on', 'Created On'),
+        ('created_by', 'Created By'),
+        ('actual_finish_date', 'Act.finish date'),
+        ('confirmation_number', 'Confirmation'),
+        ('employees', 'Employee(s)'),
+        ('personnel_number', 'Personnel no.'),
+        ('confirmation_text', 'Confirm. text'),
+        ('planned_work', 'Work (planned)'),
+        ('actual_work', 'Actual work'),
+        ('system_status', 'System Status'),
+        ('work_center', 'Work ctr (act.)'),
+        ('actual_start_time', 'Act. start time')
+    ]
+}
+
+# Headers that identify the header line of a text export
+KNOWN_HEADERS = {header for _, header in COMMON_COLUMNS} | {
+    header for columns in REPORT_COLUMNS.values() for _, header in columns
+}
+
+# Rows per executemany while ingesting
+INGEST_BATCH_ROWS = 5000
+
+def read_report(file_path: str, staging: Optional[StagingStore] = None) -> "pd.DataFrame":
+    """
+    Read an uploaded report with datetime columns as text.
+
+    With a staging store the workbook is only parsed the first time; the
+    rows are staged then and later reads load the staged columns. SAP text
+    exports are read with TextReport and not staged, as they parse quickly.
+    """
+    if is_text_report(file_path):
+        import pandas as pd
+
+        report = TextReport.detect(file_path, KNOWN_HEADERS)
+        return pd.DataFrame(list(report.rows()), columns=report.headers)
+
+    if staging:
+        df = staging.load(file_path)
+        if df is not None:
+            return df
+
+    # pandas and openpyxl load with the first workbook, not at startup
+    import pandas as pd
+
+    df = pd.read_excel(file_path)
+    for column in df.select_dtypes(include=['datetime64[ns]']).columns:
+        df[column] = df[column].dt.strftime('%Y-%m-%d %H:%M:%S')
+    df = normalize_frame(df)
+
+    if staging and not df.empty:
+        try:
+            staging.stage(file_path, df)
+        except Exception as e:
+            # The upload itself does not depend on its staging copy
+            logger.warning({
+                "agent": "DatabaseService",
+                "action": "staging_failed",
+                "file": file_path,
+                "error": str(e)
+            })
+    return df
+
+def _read_only_authorizer(action, arg1, arg2, db_name, trigger):
+    # Opening an FTS5 table declares its schema and checks PRAGMA data_version,
+    # reported as an update of sqlite_master; the connection is opened
+    # read-only so nothing is written
+    if action == sqlite3.SQLITE_UPDATE and arg1 == 'sqlite_master':
+        return sqlite3.SQLITE_OK
+    if action == sqlite3.SQLITE_PRAGMA and arg1 == 'data_version':
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_OK if action in READ_ONLY_ACTIONS else sqlite3.SQLITE_DENY
+
+def _not_number_sql(column: str) -> str:
+    """
+    SQL that is true for a value that is not a plain or exponent-notation number.
+
+    Dates are made of the same characters (2023-01-05, 05.01.2023), so a
+    number also has at most one '.' and one exponent, and a sign only at
+    the start or right after the e/E.
+    """
+    value = f'"{column}"'
+    without_exponent_signs = value
+    for exponent in ("e+", "e-", "E+", "E-"):
+        without_exponent_signs = f"replace({without_exponent_signs}, '{exponent}', 'e')"
+    return (f"({value} GLOB '*[^0-9.eE+-]*' OR {value} NOT GLOB '*[0-9]*' OR {value} GLOB '*.*.*' "
+            f"OR {value} GLOB '*[eE]*[eE]*' OR {without_exponent_signs} GLOB '?*[+-]*')")
 
 class DatabaseService:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, staging_dir: Optional[str] = None):
         self.db_path = db_path
+        # Columnar copies of every upload, read by re-ingests and rebuilds
+        self.staging = StagingStore(staging_dir or os.path.join(os.path.dirname(db_path), 'staging'))
+        self.rollups = RollupMaintainer()
+        self.link_index = LinkIndexMaintainer()
+        self.text_index = TextIndexMaintainer()
+        self.snapshots = SnapshotManager()
+        self.upload_manifest = UploadManifest()
+        # get_table_info() result and the schema version it was read at
+        self._table_info = None
         
     def get_db_connection(self):
         """Create a database connection."""
-        return sqlite3.connect(self.db_path)
+        return profiling.connect(self.db_path)
+
+    def get_read_only_connection(self):
+        """Create a connection that can only read, enforced by SQLite itself."""
+        uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+        conn = profiling.connect(uri, uri=True)
+        conn.set_authorizer(_read_only_authorizer)
+        return conn
 
-    def process_excel_file(self, file_path: str, file_type: str) -> Dict[str, Any]:
-        """Process Excel file and insert data into database."""
+    def process_excel_file(self, file_path: str, file_type: str, shard: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Process an uploaded report and insert its rows into the database.
+
+        Workbooks are read into a frame first; SAP text exports (.csv, .tsv,
+        .txt) are streamed into the loader row by row. shard is the upload
+        tag ShardedDatabaseService routes on; a single database ignores it.
+        The file and the outcome of its ingest are recorded in the upload
+        manifest.
+        """
+        started = time.perf_counter()
         try:
-            # Read Excel file
-            df = pd.read_excel(file_path)
-            
-            # Convert all datetime columns to string format
-            for column in df.select_dtypes(include=['datetime64[ns]']).columns:
-                df[column] = df[column].dt.strftime('%Y-%m-%d %H:%M:%S')
-            if df.empty:
-                return {"success": False, "error": "No data found in file"}
+            with closing(self.get_db_connection()) as conn, conn:
+                entry_id = self.upload_manifest.begin(conn, file_path, file_type)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+            observe_ingest(file_type, time.perf_counter() - started, result)
+            return result
+
+        result = self._ingest_upload(file_path, file_type, shard)
+        seconds = time.perf_counter() - started
+        try:
+            with closing(self.get_db_connection()) as conn, conn:
+                self.upload_manifest.finish(conn, entry_id, result, seconds)
+        except Exception as e:
+            logger.error({
+                "agent": "DatabaseService",
+                "action": "upload_manifest_failed",
+                "file": os.path.basename(file_path),
+                "error": str(e)
+            })
+        observe_ingest(file_type, seconds, result)
+        return result
+
+    def _ingest_upload(self, file_path: str, file_type: str, shard: Optional[str]) -> Dict[str, Any]:
+        try:
+            if is_text_report(file_path):
+                load_id, rows = self.ingest_text_report(file_path, file_type)
+                result = {"success": True, "load_id": load_id, "rows": rows}
+            else:
+                df = read_report(file_path, self.staging)
+                if df.empty:
+                    result = {"success": False, "error": "No data found in file"}
+                else:
+                    load_id = self.ingest_dataframe(df, file_type, os.path.basename(file_path))
+                    result = {"success": True, "load_id": load_id, "rows": len(df)}
+
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        return result
+
+    def ingest_dataframe(self, df: "pd.DataFrame", file_type: str, file_name: str) -> int:
+        """Insert the rows of a report as one load in a single transaction and return the load id."""
+        load_id, _ = self.ingest_rows(list(df.columns), df.itertuples(index=False, name=None), file_type, file_name)
+        return load_id
+
+    def ingest_text_report(self, file_path: str, file_type: str) -> Tuple[int, int]:
+        """Stream the rows of a SAP text export into one load; returns the load id and row count."""
+        report = TextReport.detect(file_path, KNOWN_HEADERS)
+        logger.info({
+            "agent": "DatabaseService",
+            "action": "text_report_detected",
+            "file": os.path.basename(file_path),
+            **report.describe()
+        })
+        return self.ingest_rows(report.headers, report.rows(), file_type, os.path.basename(file_path))
+
+    def ingest_rows(self, headers: List[str], rows: Iterable[Sequence[Any]], file_type: str,
+                    file_name: str) -> Tuple[int, int]:
+        """
+        Insert report rows as one load in a single transaction.
+
+        Rows are value sequences aligned with headers and are consumed in
+        batches, so an iterator is never held in memory as a whole. Columns
+        the report lacks are stored as ''.
+
+        Returns:
+            The load id and the number of rows
+
+        Raises:
+            ValueError: if there are no rows; nothing is written then
+        """
+        position = {str(header): i for i, header in enumerate(headers)}
+        common_positions = [position.get(header) for _, header in COMMON_COLUMNS]
+        specific_columns = REPORT_COLUMNS.get(file_type, [])
+        specific_positions = [position.get(header) for _, header in specific_columns]
+        common_names = ["file_type", "load_id"] + [column for column, _ in COMMON_COLUMNS]
+        specific_names = ["common_id", "load_id"] + [column for column, _ in specific_columns]
+
+        count = 0
+        with closing(self.get_db_connection()) as conn, conn:
+            encoder = DictionaryEncoder(conn)
+            load_id = self.snapshots.begin_load(conn, file_type, file_name)
+            iterator = iter(rows)
+            while True:
+                batch = list(itertools.islice(iterator, INGEST_BATCH_ROWS))
+                if not batch:
+                    break
+                first_id = encoder.insert_many('common_fields', common_names, [
+                    [file_type, load_id] + ['' if i is None else row[i] for i in common_positions] for row in batch
+                ])
+                if specific_columns:
+                    encoder.insert_many(file_type, specific_names, [
+                        [first_id + offset, load_id] + ['' if i is None else row[i] for i in specific_positions]
+                        for offset, row in enumerate(batch)
+                    ])
+                count += len(batch)
+
+            if not count:
+                raise ValueError("No data found in file")
+            self.snapshots.finish_load(conn, load_id, count)
+            self._update_derived_tables(conn)
+            self._bump_data_version(conn)
+        return load_id, count
+
+    def apply_retention(self, keep: int = 1) -> Dict[str, Any]:
+        """
+        Purge all but the newest snapshots of each report and reclaim their space.
+
+        Derived tables drop the purged rows in the same transaction, then an
+        incremental vacuum returns the freed pages to the file system (on
+        databases without incremental auto-vacuum they stay free for reuse).
+
+        Args:
+            keep: Number of snapshots to keep per report
+
+        Returns:
+            Dict containing:
+            - success: boolean
+            - purged_loads: ids of the purged uploads
+            - deleted_rows: deleted row count per table
+            - pages_freed: database pages released by the vacuum
+        """
+        try:
+            with closing(self.get_db_connection()) as conn:
+                with conn:
+                    load_ids = self.snapshots.superseded_loads(conn, max(1, keep))
+                    if not load_ids:
+                        return {"success": True, "purged_loads": [], "deleted_rows": {}, "pages_freed": 0}
+                    self.link_index.delete_loads(conn, load_ids)
+                    self.text_index.delete_loads(conn, load_ids)
+                    self.rollups.delete_loads(conn, load_ids)
+                    deleted = self.snapshots.purge(conn, load_ids)
+                    self._bump_data_version(conn)
+
+                pages_freed = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                # execute() would step the pragma once and free a single page;
+                # executescript() runs it to completion
+                conn.executescript("PRAGMA incremental_vacuum;")
+
+            logger.info({
+                "agent": "DatabaseService",
+                "action": "retention_applied",
+                "purged_loads": load_ids,
+                "deleted_rows": deleted,
+                "pages_freed": pages_freed
+            })
+            return {"success": True, "purged_loads": load_ids, "deleted_rows": deleted, "pages_freed": pages_freed}
 
-            # Insert data into database
-            with self.get_db_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Process each row
-                for _, row in df.iterrows():
-                    # First, insert common fields
-                    common_query = """
-                        INSERT INTO common_fields (
-                            file_type, order_number, notification_number,
-                            breakdown, functional_location
-                        ) VALUES (?, ?, ?, ?, ?)
-                    """
-                    common_values = [
-                        file_type,
-                        row.get('Order', ''),
-                        row.get('Notification', ''),
-                        row.get('Breakdown', ''),
-                        row.get('Functional Loc.', '')
-                    ]
-                    cursor.execute(common_query, common_values)
-                    common_id = cursor.lastrowid
-                    
-                    # Then insert type-specific fields
-                    if file_type == 'IW38':
-                        specific_query = """
-                            INSERT INTO IW38 (
-                                common_id, created_on, basic_start_date,
-                                equipment, description, plant_section,
-                                total_actual_costs, order_type, main_workcenter,
-                                maintenance_plan, actual_finish, cost_center,
-                                basic_finish_date, breakdown_duration
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """
-                        specific_values = [
-                            common_id,
-                            row.get('Created on', ''),
-                            row.get('Bas. start date', ''),
-                            row.get('Equipment', ''),
-                            row.get('Description', ''),
-                            row.get('Plant section', ''),
-                            row.get('Total act.costs', ''),
-                            row.get('Order Type', ''),
-                            row.get('Main WorkCtr', ''),
-                            row.get('MaintenancePlan', ''),
-                            row.get('Actual finish', ''),
-                            row.get('Cost Center', ''),
-                            row.get('Basic fin. date', ''),
-                            row.get('Breakdown dur.', '')
-                        ]
-                        cursor.execute(specific_query, specific_values)
-                        
-                    elif file_type == 'IW68':
-                        specific_query = """
-                            INSERT INTO IW68 (
-                                common_id, code_group, problem_group_text,
-                                damage_code, problem_code_text, item_text,
-                                cause_code, cause_group_text, cause_text,
-                                effect, reported_by
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """
-                        specific_values = [
-                            common_id,
-                            row.get('Code group', ''),
-                            row.get('Prob. grp. text', ''),
-                            row.get('Damage Code', ''),
-                            row.get('Prob. code text', ''),
-                            row.get('Text', ''),
-                            row.get('Cause code', ''),
-                            row.get('Cause grp. text', ''),
-                            row.get('Cause text', ''),
-                            row.get('Effect', ''),
-                            row.get('Reported by', '')
-                        ]
-                        cursor.execute(specific_query, specific_values)
-                        
-                    elif file_type == 'IW47':
-                        specific_query = """
-                            INSERT INTO IW47 (
-                                common_id, created_on, created_by,
-                                actual_finish_date, confirmation_number,
-                                employees, personnel_number, confirmation_text,
-                                planned_work, actual_work, system_status,
-                                work_center, actual_start_time
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """
-                        specific_values = [
-                            common_id,
-                            row.get('Created On', ''),
-                            row.get('Created By', ''),
-                            row.get('Act.finish date', ''),
-                            row.get('Confirmation', ''),
-                            row.get('Employee(s)', ''),
-                            row.get('Personnel no.', ''),
-                            row.get('Confirm. text', ''),
-                            row.get('Work (planned)', ''),
-                            row.get('Actual work', ''),
-                            row.get('System Status', ''),
-                            row.get('Work ctr (act.)', ''),
-                            row.get('Act. start time', '')
-                        ]
-                        cursor.execute(specific_query, specific_values)
-                
-                conn.commit()
-            
-            return {"success": True}
-            
         except Exception as e:
             return {"success": False, "error": str(e)}
 
-    def execute_query(self, query: str) -> Dict[str, Any]:
-        """Execute a SQL query and return the results."""
+    def discard_loads(self, load_ids: List[int]) -> Dict[str, int]:
+        """
+        Remove loads that must not count, with their rows and derived entries.
+
+        Unlike retention the loads leave no trace in uploads, so the previous
+        snapshot of their report is current again.
+
+        Returns:
+            Deleted row count per table
+
+        Raises:
+            sqlite3.Error: if the loads could not be removed; nothing is changed then
+        """
+        with closing(self.get_db_connection()) as conn, conn:
+            self.link_index.delete_loads(conn, load_ids)
+            self.text_index.delete_loads(conn, load_ids)
+            self.rollups.delete_loads(conn, load_ids)
+            deleted = self.snapshots.discard(conn, load_ids)
+            self._bump_data_version(conn)
+        return deleted
+
+    def execute_query(self, query: str, read_only: bool = False) -> Dict[str, Any]:
+        """
+        Execute a SQL query and return the results.
+
+        With read_only=True the query runs on a connection that SQLite
+        prevents from writing, for queries nobody has approved yet.
+        """
+        started = time.perf_counter()
+        result = self._execute_query(query, read_only)
+        observe_query(time.perf_counter() - started, result, read_only)
+        return result
+
+    def _execute_query(self, query: str, read_only: bool) -> Dict[str, Any]:
         try:
-            with self.get_db_connection() as conn:
+            connection = self.get_read_only_connection() if read_only else self.get_db_connection()
+            with closing(connection) as conn, conn:
                 cursor = conn.cursor()
                 cursor.execute(query)
                 
@@ -160,14 +415,59 @@ class DatabaseService:
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def validate_query(self, query: str) -> Dict[str, Any]:
+        """
+        Compile a query against the live schema without running it.
+
+        Uses EXPLAIN on a read-only connection, so unknown tables or columns,
+        misused aggregates, multiple statements and writes are all reported
+        with SQLite's own error message.
+        """
+        try:
+            conn = self.get_read_only_connection()
+            try:
+                conn.execute(f"EXPLAIN {query}")
+            finally:
+                conn.close()
+            return {"success": True}
+
+        except (sqlite3.Error, sqlite3.Warning) as e:
+            return {"success": False, "error": str(e)}
+
+    def get_query_connection(self):
+        """Connection the schema and statistics helpers read the report tables through."""
+        return self.get_db_connection()
+
     def get_table_info(self) -> Dict[str, Any]:
-        """Get information about database tables and their structure."""
+        """Get information about database tables and their structure, cached until the schema changes."""
+        schema_version = self.get_schema_version()
+        cached = self._table_info
+        if cached is not None and cached[0] == schema_version:
+            return cached[1]
+        result = self._read_table_info()
+        if result["success"]:
+            self._table_info = (schema_version, result)
+        return result
+
+    def get_visible_table_info(self) -> Dict[str, Any]:
+        """get_table_info() limited to the tables and views users query."""
+        result = self.get_table_info()
+        if not result["success"]:
+            return result
+        return {"success": True,
+                "tables": {name: info for name, info in result["tables"].items() if not is_hidden_table(name)}}
+
+    def _read_table_info(self) -> Dict[str, Any]:
         try:
-            with self.get_db_connection() as conn:
+            with closing(self.get_query_connection()) as conn:
                 cursor = conn.cursor()
                 
-                # Get list of tables
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+                # Get list of tables and views (the report tables are views over encoded storage,
+                # temporary views when the query connection combines shards)
+                cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') "
+                    "UNION ALL SELECT name FROM sqlite_temp_master WHERE type IN ('table', 'view')"
+                )
                 tables = cursor.fetchall()
                 
                 info = {}
@@ -185,50 +485,272 @@ class DatabaseService:
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def list_upload_files(self, file_type: str, before: Optional[int] = None, per_page: int = 20) -> Dict[str, Any]:
+        """
+        A page of the files uploaded for a report, newest first.
+
+        Args:
+            file_type: Report type
+            before: id of the last file of the previous page; None for the first page
+            per_page: Files per page
+
+        Returns:
+            Dict containing:
+            - success: boolean
+            - files: id, name, size_bytes, status, row_count, ingest_ms and uploaded_on per file
+            - total: number of files of the report
+            - has_more: whether older files follow this page
+            - per_page: the page size
+        """
+        try:
+            with closing(self.get_db_connection()) as conn:
+                listing = self.upload_manifest.list_files(conn, file_type, per_page, before)
+            return {"success": True, "per_page": per_page, **listing}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def get_oldest_upload_file(self) -> Dict[str, Any]:
+        """The file uploaded longest ago, or file None when nothing was uploaded."""
+        try:
+            with closing(self.get_db_connection()) as conn:
+                return {"success": True, "file": self.upload_manifest.oldest_file(conn)}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def get_upload_version(self) -> str:
+        """Return a value that changes whenever a file is uploaded or finishes ingesting."""
+        try:
+            with closing(self.get_db_connection()) as conn:
+                return self.upload_manifest.version(conn)
+        except sqlite3.Error:
+            return ""
+
+    def get_data_version(self) -> int:
+        """Return a counter that increases every time ingested data changes."""
+        try:
+            with closing(self.get_db_connection()) as conn:
+                row = conn.execute(
+                    "SELECT value FROM db_meta WHERE key = 'data_version'"
+                ).fetchone()
+                return int(row[0]) if row else 0
+        except sqlite3.Error:
+            return 0
+
+    def get_schema_version(self) -> int:
+        """Return SQLite's schema cookie, which changes whenever a table or view is altered."""
+        try:
+            with closing(self.get_db_connection()) as conn:
+                return conn.execute("PRAGMA schema_version").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def get_prompt_notes(self) -> List[str]:
+        """Hints about derived tables for the SQL generation prompt."""
+        return (
+            encoding_prompt_notes()
+            + self.snapshots.prompt_notes()
+            + self.link_index.prompt_notes()
+            + self.rollups.prompt_notes()
+            + self.text_index.prompt_notes()
+        )
+
+    def _update_derived_tables(self, conn) -> None:
+        """Bring tables derived from the ingested rows up to date, inside the ingest transaction."""
+        self.link_index.update(conn)
+        self.rollups.update(conn)
+        self.text_index.update(conn)
+
+    def _bump_data_version(self, conn) -> None:
+        conn.execute("""
+            INSERT INTO db_meta (key, value) VALUES ('data_version', 1)
+            ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+        """)
+
+    def _set_auto_vacuum(self) -> None:
+        """Create new databases in incremental auto-vacuum mode, so retention can hand freed pages back."""
+        with closing(self.get_db_connection()) as conn:
+            # The mode only takes effect before the first table is created;
+            # existing databases are converted by enable_incremental_vacuum()
+            if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    def incremental_vacuum_enabled(self) -> bool:
+        with closing(self.get_db_connection()) as conn:
+            return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    def enable_incremental_vacuum(self) -> Dict[str, Any]:
+        """
+        Switch an existing database to incremental auto-vacuum.
+
+        This rewrites the whole file with a full VACUUM, which holds an
+        exclusive lock and needs as much free disk again as the database
+        takes; it is a one-off maintenance step (apply_retention --convert),
+        never run at startup.
+
+        Returns:
+            Dict containing:
+            - success: boolean
+            - converted: False when the database was already incremental
+        """
+        try:
+            if self.incremental_vacuum_enabled():
+                return {"success": True, "converted": False}
+            with closing(self.get_db_connection()) as conn:
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+            logger.info({
+                "agent": "DatabaseService",
+                "action": "incremental_vacuum_enabled",
+                "db_path": self.db_path
+            })
+            return {"success": True, "converted": True}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def get_column_statistics(self, table_name: str, columns: List[str],
+                              top_n: int = 5, max_categorical: int = 50) -> Dict[str, Any]:
+        """
+        Summarize the values of a table's columns for the SQL generator.
+
+        Args:
+            table_name: Table to scan
+            columns: Columns to summarize
+            top_n: Number of most frequent values to report for categorical columns
+            max_categorical: Columns with at most this many distinct values count as categorical
+
+        Returns:
+            Dict containing:
+            - success: boolean
+            - row_count: number of rows in the table
+            - columns: per column distinct count, min/max, whether values are
+              numeric and, for categorical columns, the top values with counts
+        """
+        try:
+            with closing(self.get_query_connection()) as conn:
+                # One scan for the row count, every distinct count and range, and whether
+                # all non-empty values of a column are numbers
+                aggregates = ", ".join(
+                    f'COUNT(DISTINCT "{col}"), MIN("{col}"), MAX("{col}"), '
+                    f'SUM("{col}" != \'\'), SUM("{col}" != \'\' AND {_not_number_sql(col)}), '
+                    f'MIN(CASE WHEN "{col}" != \'\' THEN CAST("{col}" AS REAL) END), '
+                    f'MAX(CASE WHEN "{col}" != \'\' THEN CAST("{col}" AS REAL) END)'
+                    for col in columns
+                )
+                row = conn.execute(f'SELECT COUNT(*), {aggregates} FROM "{table_name}"').fetchone()
+                stats = {"success": True, "row_count": row[0], "columns": {}}
+
+                for i, col in enumerate(columns):
+                    (distinct, minimum, maximum, present, not_numbers,
+                     numeric_min, numeric_max) = row[1 + i * 7:8 + i * 7]
+                    numeric = bool(present) and not not_numbers
+                    if numeric:
+                        minimum, maximum = numeric_min, numeric_max
+                    column_stats = {
+                        "distinct": distinct,
+                        "min": minimum,
+                        "max": maximum,
+                        "numeric": numeric
+                    }
+                    if not numeric and 0 < distinct <= max_categorical:
+                        column_stats["top_values"] = conn.execute(
+                            f'SELECT "{col}", COUNT(*) FROM "{table_name}" GROUP BY "{col}" '
+                            f'ORDER BY COUNT(*) DESC LIMIT ?', (top_n,)
+                        ).fetchall()
+                    stats["columns"][col] = column_stats
+
+                return stats
+
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
     def initialize_database(self):
         """Initialize database with predefined structure based on Excel headers."""
         try:
+            self._set_auto_vacuum()
             with self.get_db_connection() as conn:
+                # Bookkeeping such as the data version used to invalidate caches
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS db_meta (
+                        key TEXT PRIMARY KEY,
+                        value TEXT
+                    )
+                """)
+
+                # Pinned dashboard queries and their precomputed results
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS saved_queries (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        name TEXT NOT NULL,
+                        sql TEXT NOT NULL,
+                        chart_type TEXT,
+                        x_column TEXT,
+                        y_column TEXT,
+                        include_summary INTEGER DEFAULT 0,
+                        created_on TEXT
+                    )
+                """)
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS saved_query_results (
+                        saved_query_id INTEGER PRIMARY KEY,
+                        data_version INTEGER,
+                        refreshed_on TEXT,
+                        duration_ms REAL,
+                        row_count INTEGER,
+                        results TEXT,
+                        chart_spec TEXT,
+                        summary TEXT,
+                        error TEXT,
+                        FOREIGN KEY (saved_query_id) REFERENCES saved_queries(id)
+                    )
+                """)
+
+                # Report tables from before dictionary encoding are migrated below
+                legacy_tables = detach_legacy_tables(conn)
+                create_dimensions(conn)
+
                 # Create common fields table
                 conn.execute("""
-                    CREATE TABLE IF NOT EXISTS common_fields (
+                    CREATE TABLE IF NOT EXISTS common_fields_data (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        load_id INTEGER REFERENCES uploads(id),
                         file_type TEXT,
                         order_number TEXT,
                         notification_number TEXT,
                         breakdown TEXT,
-                        functional_location TEXT
+                        functional_location_id INTEGER REFERENCES dim_functional_location(id)
                     )
                 """)
                 
                 # Create IW38 Orders table
                 conn.execute("""
-                    CREATE TABLE IF NOT EXISTS IW38 (
+                    CREATE TABLE IF NOT EXISTS IW38_data (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         common_id INTEGER,
+                        load_id INTEGER REFERENCES uploads(id),
                         created_on TEXT,
                         basic_start_date TEXT,
                         equipment TEXT,
                         description TEXT,
-                        plant_section TEXT,
+                        plant_section_id INTEGER REFERENCES dim_plant_section(id),
                         total_actual_costs TEXT,
-                        order_type TEXT,
-                        main_workcenter TEXT,
+                        order_type_id INTEGER REFERENCES dim_order_type(id),
+                        main_workcenter_id INTEGER REFERENCES dim_work_center(id),
                         maintenance_plan TEXT,
                         actual_finish TEXT,
-                        cost_center TEXT,
+                        cost_center_id INTEGER REFERENCES dim_cost_center(id),
                         basic_finish_date TEXT,
                         breakdown_duration TEXT,
-                        FOREIGN KEY (common_id) REFERENCES common_fields(id)
+                        FOREIGN KEY (common_id) REFERENCES common_fields_data(id)
                     )
                 """)
                 
                 # Create IW68 Notification Items table
                 conn.execute("""
-                    CREATE TABLE IF NOT EXISTS IW68 (
+                    CREATE TABLE IF NOT EXISTS IW68_data (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         common_id INTEGER,
-                        code_group TEXT,
+                        load_id INTEGER REFERENCES uploads(id),
+                        code_group_id INTEGER REFERENCES dim_code_group(id),
                         problem_group_text TEXT,
                         damage_code TEXT,
                         problem_code_text TEXT,
@@ -238,15 +760,16 @@ class DatabaseService:
                         cause_text TEXT,
                         effect TEXT,
                         reported_by TEXT,
-                        FOREIGN KEY (common_id) REFERENCES common_fields(id)
+                        FOREIGN KEY (common_id) REFERENCES common_fields_data(id)
                     )
                 """)
                 
                 # Create IW47 Confirmations table
                 conn.execute("""
-                    CREATE TABLE IF NOT EXISTS IW47 (
+                    CREATE TABLE IF NOT EXISTS IW47_data (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         common_id INTEGER,
+                        load_id INTEGER REFERENCES uploads(id),
                         created_on TEXT,
                         created_by TEXT,
                         actual_finish_date TEXT,
@@ -256,12 +779,26 @@ class DatabaseService:
                         confirmation_text TEXT,
                         planned_work TEXT,
                         actual_work TEXT,
-                        system_status TEXT,
-                        work_center TEXT,
+                        system_status_id INTEGER REFERENCES dim_system_status(id),
+                        work_center_id INTEGER REFERENCES dim_work_center(id),
                         actual_start_time TEXT,
-                        FOREIGN KEY (common_id) REFERENCES common_fields(id)
+                        FOREIGN KEY (common_id) REFERENCES common_fields_data(id)
                     )
                 """)
+
+                # Views with the original column layout, used by queries and derived tables
+                copy_legacy_rows(conn, legacy_tables)
+                self.snapshots.create(conn)
+                self.upload_manifest.create(conn, os.path.dirname(os.path.abspath(self.db_path)))
+                create_views(conn)
+                self.snapshots.create_views(conn)
+
+                # Order link index, pre-aggregated rollups and full-text indexes,
+                # backfilled from any rows already loaded
+                self.link_index.create(conn)
+                self.rollups.create(conn)
+                self.text_index.create(conn)
+                self._update_derived_tables(conn)
                 
             return {"success": True}
             
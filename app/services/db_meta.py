@@ -0,0 +1,20 @@
+from typing import Optional
+
+
+def get_meta(conn, key: str, default: Optional[str] = None) -> Optional[str]:
+    """Read a value from the db_meta bookkeeping table."""
+    row = conn.execute("SELECT value FROM db_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_meta(conn, key: str, value) -> None:
+    """Write a value to the db_meta bookkeeping table."""
+    conn.execute("""
+        INSERT INTO db_meta (key, value) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    """, (key, str(value)))
+
+
+def delete_meta(conn, prefix: str) -> None:
+    """Remove every db_meta entry whose key starts with prefix."""
+    conn.execute("DELETE FROM db_meta WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
@@ -0,0 +1,205 @@
+import math
+from typing import Any, Dict, List, Optional
+
+# Repetitive text columns stored as integer keys into a shared dimension table.
+# IW38.main_workcenter and IW47.work_center share one dimension.
+ENCODED_COLUMNS = {
+    "common_fields": {"functional_location": "functional_location"},
+    "IW38": {
+        "plant_section": "plant_section",
+        "order_type": "order_type",
+        "main_workcenter": "work_center",
+        "cost_center": "cost_center"
+    },
+    "IW47": {"work_center": "work_center", "system_status": "system_status"},
+    "IW68": {"code_group": "code_group"}
+}
+
+DIMENSIONS = sorted({dimension for columns in ENCODED_COLUMNS.values() for dimension in columns.values()})
+
+
+def storage_table(table: str) -> str:
+    """Name of the table holding the encoded rows behind a report view."""
+    return f"{table}_data"
+
+
+def dimension_table(dimension: str) -> str:
+    return f"dim_{dimension}"
+
+
+# Physical tables that sit behind the report views
+STORAGE_TABLES = {storage_table(table) for table in ENCODED_COLUMNS} | {dimension_table(d) for d in DIMENSIONS}
+
+
+def create_dimensions(conn) -> None:
+    for dimension in DIMENSIONS:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {dimension_table(dimension)} (
+                id INTEGER PRIMARY KEY,
+                value TEXT NOT NULL UNIQUE
+            )
+        """)
+
+
+def create_views(conn) -> None:
+    """
+    Create a view per report table with the original denormalized columns.
+
+    Each <column>_id of the storage table is decoded under the original
+    column name by a scalar subquery, which SQLite only evaluates for
+    columns a query actually uses. SQLite never drops an unused LEFT JOIN
+    from an aggregate query, so views decoding with joins make COUNT(*) or
+    SUM over a report pay a lookup per dimension per row (about 20x slower
+    at 200k rows, see app.utils.measure_encoding); they only win on filters
+    on the text, by a third. The price of the subqueries is that grouping
+    or filtering on the text is slower than on a plain TEXT table, so the
+    key stays visible next to the value and the prompt notes steer the SQL
+    generator to group and filter on the key, which is faster than the
+    plain layout. Views are recreated on every call so they follow columns
+    added to the storage.
+    """
+    for table, encoded in ENCODED_COLUMNS.items():
+        select = []
+        for (column,) in conn.execute(f"SELECT name FROM pragma_table_info('{storage_table(table)}')").fetchall():
+            name = column[:-3] if column.endswith("_id") else None
+            if name in encoded:
+                select.append(f"(SELECT value FROM {dimension_table(encoded[name])} WHERE id = t.{column}) AS {name}")
+            select.append(f"t.{column}")
+        conn.execute(f"DROP VIEW IF EXISTS {table}")
+        conn.execute(f"""
+            CREATE VIEW {table} AS
+            SELECT {', '.join(select)}
+            FROM {storage_table(table)} t
+        """)
+
+
+def prompt_notes() -> List[str]:
+    columns = ", ".join(f"{table}.{column}" for table, encoded in ENCODED_COLUMNS.items() for column in encoded)
+    dimensions = ", ".join(
+        f"{table}.{column} in {dimension_table(dimension)}"
+        for table, encoded in ENCODED_COLUMNS.items() for column, dimension in encoded.items()
+    )
+    return [
+        f"{columns} are stored as integer keys, exposed next to the text as <column>_id. When grouping "
+        "by one of them, GROUP BY the <column>_id and select the text column, e.g. SELECT plant_section, "
+        "COUNT(*) FROM IW38 GROUP BY plant_section_id; display the text column as usual.",
+        "To filter on one of those columns, look the key up in its dimension table (id, value) instead of "
+        "comparing the text, e.g. WHERE order_type_id = (SELECT id FROM dim_order_type WHERE value = 'PM01') "
+        "or WHERE functional_location_id IN (SELECT id FROM dim_functional_location WHERE value LIKE 'PLANT-1%'). "
+        f"Dimension tables: {dimensions}."
+    ]
+
+
+def detach_legacy_tables(conn) -> List[str]:
+    """
+    Move report tables from the unencoded layout out of the way.
+
+    Returns:
+        The report tables that were renamed to <table>_legacy and still need
+        copy_legacy_rows once the storage tables exist
+    """
+    legacy = []
+    for table in ENCODED_COLUMNS:
+        row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+        if row and row[0] == "table":
+            conn.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+            legacy.append(table)
+    return legacy
+
+
+def copy_legacy_rows(conn, tables: List[str]) -> None:
+    """Encode the rows of renamed legacy tables into the storage tables, keeping their ids."""
+    for table in tables:
+        legacy = f"{table}_legacy"
+        encoded = ENCODED_COLUMNS[table]
+        for column, dimension in encoded.items():
+            conn.execute(f"""
+                INSERT OR IGNORE INTO {dimension_table(dimension)} (value)
+                SELECT DISTINCT {column} FROM {legacy} WHERE {column} IS NOT NULL
+            """)
+
+        legacy_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({legacy})")}
+        columns, values = [], []
+        for (column,) in conn.execute(f"SELECT name FROM pragma_table_info('{storage_table(table)}')").fetchall():
+            name = column[:-3] if column.endswith("_id") else None
+            if name in encoded:
+                columns.append(column)
+                values.append(f"(SELECT id FROM {dimension_table(encoded[name])} WHERE value = l.{name})")
+            elif column in legacy_columns:
+                columns.append(column)
+                values.append(f"l.{column}")
+        conn.execute(f"""
+            INSERT INTO {storage_table(table)} ({', '.join(columns)})
+            SELECT {', '.join(values)} FROM {legacy} l
+        """)
+        conn.execute(f"DROP TABLE {legacy}")
+
+
+class DictionaryEncoder:
+    """
+    Inserts report rows into their storage tables, interning encoded columns.
+
+    Dimension ids are cached for the lifetime of the encoder, which should not
+    outlive the transaction it writes in.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._ids: Dict[str, Dict[str, int]] = {}
+        self._statements: Dict[tuple, str] = {}
+
+    def _statement(self, table: str, columns: tuple) -> str:
+        encoded = ENCODED_COLUMNS.get(table, {})
+        key = (table, columns)
+        statement = self._statements.get(key)
+        if statement is None:
+            names = [f"{column}_id" if column in encoded else column for column in columns]
+            statement = (
+                f"INSERT INTO {storage_table(table)} ({', '.join(names)}) "
+                f"VALUES ({', '.join('?' * len(names))})"
+            )
+            self._statements[key] = statement
+        return statement
+
+    def insert(self, table: str, values: Dict[str, Any]) -> int:
+        """Insert one row given by report column names and return its id."""
+        encoded = ENCODED_COLUMNS.get(table, {})
+        statement = self._statement(table, tuple(values))
+        params = [
+            self.encode(encoded[column], value) if column in encoded else value
+            for column, value in values.items()
+        ]
+        return self.conn.execute(statement, params).lastrowid
+
+    def insert_many(self, table: str, columns: List[str], rows: List[List[Any]]) -> int:
+        """
+        Insert rows of values for the given report columns with one executemany and return the first id.
+
+        The rows are encoded in place. They get consecutive ids, since the
+        ingest transaction is the only writer of the table.
+        """
+        encoded = ENCODED_COLUMNS.get(table, {})
+        positions = [(i, encoded[column]) for i, column in enumerate(columns) if column in encoded]
+        for row in rows:
+            for i, dimension in positions:
+                row[i] = self.encode(dimension, row[i])
+        self.conn.executemany(self._statement(table, tuple(columns)), rows)
+        last_id = self.conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return last_id - len(rows) + 1
+
+    def encode(self, dimension: str, value: Any) -> Optional[int]:
+        """Return the id of a value in a dimension, adding it when new. Missing values stay NULL."""
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return None
+        # Same text a TEXT column would have stored for the raw value
+        value = str(value)
+        ids = self._ids.get(dimension)
+        if ids is None:
+            ids = self._ids[dimension] = dict(
+                self.conn.execute(f"SELECT value, id FROM {dimension_table(dimension)}").fetchall()
+            )
+        if value not in ids:
+            ids[value] = self.conn.execute(
+                f"INSERT INTO {dimension_table(dimension)} (value) VALUES (?)", (value,)
+            ).lastrowid
+        return ids[value]
@@ -0,0 +1,158 @@
+import logging
+from typing import Dict, Any, List
+
+from .db_meta import get_meta, set_meta, delete_meta
+from .dictionary_encoding import storage_table
+
+logger = logging.getLogger(__name__)
+
+TYPE_TABLES = ["IW38", "IW47", "IW68"]
+
+
+class LinkIndexMaintainer:
+    """
+    Keeps an order-centric index over the type tables.
+
+    order_dim gives every order number an integer order_id, order_notification
+    maps notifications to orders and order_link points from an order to the
+    rows of IW38, IW47 and IW68 that belong to it. Rows that only carry a
+    notification number (typically IW68) are linked through
+    order_notification, also when the order arrives in a later upload.
+    """
+
+    def create(self, conn) -> None:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS order_dim (
+                order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_number TEXT NOT NULL UNIQUE
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS order_notification (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id INTEGER NOT NULL,
+                notification_number TEXT NOT NULL,
+                UNIQUE (notification_number, order_id),
+                FOREIGN KEY (order_id) REFERENCES order_dim(order_id)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS order_link (
+                order_id INTEGER NOT NULL,
+                file_type TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                PRIMARY KEY (order_id, file_type, row_id),
+                FOREIGN KEY (order_id) REFERENCES order_dim(order_id)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_order_link_row ON order_link(file_type, row_id)")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_common_fields_notification "
+            f"ON {storage_table('common_fields')}(notification_number)"
+        )
+        for table in TYPE_TABLES:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table.lower()}_common ON {storage_table(table)}(common_id)")
+
+    def update(self, conn) -> Dict[str, Any]:
+        """Index the type table rows added since the last update."""
+        linked = {}
+        for table in TYPE_TABLES:
+            watermark_key = f"link_watermark:{table}"
+            low = int(get_meta(conn, watermark_key, 0))
+            high = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {storage_table(table)}").fetchone()[0]
+            if high <= low:
+                continue
+
+            # 1. New orders and order -> notification pairs
+            conn.execute(f"""
+                INSERT OR IGNORE INTO order_dim (order_number)
+                SELECT DISTINCT c.order_number
+                FROM {table} t JOIN common_fields c ON c.id = t.common_id
+                WHERE t.id > ? AND t.id <= ? AND COALESCE(c.order_number, '') != ''
+            """, (low, high))
+            conn.execute(f"""
+                INSERT OR IGNORE INTO order_notification (order_id, notification_number)
+                SELECT DISTINCT d.order_id, c.notification_number
+                FROM {table} t
+                JOIN common_fields c ON c.id = t.common_id
+                JOIN order_dim d ON d.order_number = c.order_number
+                WHERE t.id > ? AND t.id <= ? AND COALESCE(c.notification_number, '') != ''
+            """, (low, high))
+
+            # 2. Rows that carry an order number link directly
+            cursor = conn.execute(f"""
+                INSERT OR IGNORE INTO order_link (order_id, file_type, row_id)
+                SELECT d.order_id, '{table}', t.id
+                FROM {table} t
+                JOIN common_fields c ON c.id = t.common_id
+                JOIN order_dim d ON d.order_number = c.order_number
+                WHERE t.id > ? AND t.id <= ?
+            """, (low, high))
+            linked[table] = cursor.rowcount
+
+            # 3. Rows with only a notification link through a known order
+            cursor = conn.execute(f"""
+                INSERT OR IGNORE INTO order_link (order_id, file_type, row_id)
+                SELECT n.order_id, '{table}', t.id
+                FROM {table} t
+                JOIN common_fields c ON c.id = t.common_id
+                JOIN order_notification n ON n.notification_number = c.notification_number
+                WHERE t.id > ? AND t.id <= ? AND COALESCE(c.order_number, '') = ''
+            """, (low, high))
+            linked[table] += cursor.rowcount
+            set_meta(conn, watermark_key, high)
+
+        # 4. Notifications that became known in this update resolve rows loaded earlier
+        low = int(get_meta(conn, "link_watermark:order_notification", 0))
+        high = conn.execute("SELECT COALESCE(MAX(id), 0) FROM order_notification").fetchone()[0]
+        if high > low:
+            for table in TYPE_TABLES:
+                cursor = conn.execute(f"""
+                    INSERT OR IGNORE INTO order_link (order_id, file_type, row_id)
+                    SELECT n.order_id, '{table}', t.id
+                    FROM order_notification n
+                    JOIN common_fields c ON c.notification_number = n.notification_number
+                    JOIN {table} t ON t.common_id = c.id
+                    WHERE n.id > ? AND n.id <= ? AND COALESCE(c.order_number, '') = ''
+                """, (low, high))
+                if cursor.rowcount:
+                    linked[table] = linked.get(table, 0) + cursor.rowcount
+            set_meta(conn, "link_watermark:order_notification", high)
+
+        if linked:
+            logger.info({
+                "agent": "LinkIndexMaintainer",
+                "action": "order_links_updated",
+                "rows_linked": linked
+            })
+        return linked
+
+    def rebuild(self, conn) -> None:
+        """Rebuild the index from scratch, e.g. after source rows were deleted."""
+        conn.execute("DELETE FROM order_link")
+        conn.execute("DELETE FROM order_notification")
+        conn.execute("DELETE FROM order_dim")
+        delete_meta(conn, "link_watermark:")
+        self.update(conn)
+
+    def delete_loads(self, conn, load_ids: List[int]) -> None:
+        """Unlink the rows of snapshots about to be purged. Orders stay in order_dim."""
+        placeholders = ", ".join("?" * len(load_ids))
+        for table in TYPE_TABLES:
+            conn.execute(f"""
+                DELETE FROM order_link
+                WHERE file_type = '{table}'
+                AND row_id IN (SELECT id FROM {storage_table(table)} WHERE load_id IN ({placeholders}))
+            """, load_ids)
+
+    def prompt_notes(self) -> List[str]:
+        return [
+            "order_dim assigns each order_number an integer order_id; order_notification maps "
+            "notification_number to order_id; order_link(order_id, file_type, row_id) points to the "
+            "rows of each report, where row_id is IW38.id, IW47.id or IW68.id for file_type 'IW38', "
+            "'IW47' or 'IW68'.",
+            "For questions that combine reports per order, join through order_link instead of matching "
+            "common_fields.order_number text, e.g. FROM order_dim d JOIN order_link l ON l.order_id = d.order_id "
+            "AND l.file_type = 'IW47' JOIN IW47 ON IW47.id = l.row_id. Aggregate each report in its own "
+            "subquery per order_id before joining them, so rows are not multiplied."
+        ]
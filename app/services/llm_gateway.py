@@ -0,0 +1,301 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import observe_llm_call
+from .request_context import bind_context
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "claude-3-sonnet-20240229"
+
+# Substrings of each agent's system prompt, used to tell the LLM stages apart
+STAGE_MARKERS = [
+    ("classify", "requesting SQL data or asking a general question"),
+    ("visualization_columns", "determine appropriate columns for visualization"),
+    ("management_summary", "brief management summary"),
+    ("comprehensive_summary", "comprehensive analysis"),
+    ("generate_sql", "Convert this message to a SQL query")
+]
+
+
+def request_stage(request: Dict[str, Any]) -> str:
+    """Name the pipeline stage a messages.create request belongs to."""
+    system = request.get("system") or ""
+    if not isinstance(system, str):
+        system = " ".join(block.get("text", "") for block in system)
+    for stage, marker in STAGE_MARKERS:
+        if marker in system:
+            return stage
+    return "other"
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting how many requests start per minute."""
+
+    def __init__(self, requests_per_minute: float, capacity: Optional[float] = None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, requests_per_minute / 6.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take one token and return how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def penalize(self, seconds: float) -> None:
+        """Hold back every caller for the given time, e.g. after a 429 response."""
+        with self._lock:
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+    def acquire(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+
+class AnthropicBackend:
+    """Sends requests to the Anthropic API through one pooled HTTP client."""
+
+    def __init__(self, max_connections: int = 20, timeout: float = 60.0):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    from anthropic import Anthropic, DefaultHttpxClient
+                    http_client = DefaultHttpxClient(limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections
+                    ))
+                    # Retries are handled by the gateway so that they share its rate limit
+                    self._client = Anthropic(http_client=http_client, max_retries=0, timeout=self.timeout)
+        return self._client
+
+    def create(self, **kwargs) -> Any:
+        return self.client.messages.create(**kwargs)
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        """
+        Decide whether a failed request may be retried.
+
+        Returns:
+            None if the error is permanent, otherwise the delay requested by
+            the server in seconds (0 when it did not ask for one)
+        """
+        import anthropic
+        if isinstance(error, (anthropic.APIConnectionError, anthropic.APITimeoutError)):
+            return 0.0
+        if isinstance(error, anthropic.APIStatusError):
+            if error.status_code == 429 or error.status_code >= 500:
+                try:
+                    return float(error.response.headers.get("retry-after", 0))
+                except (TypeError, ValueError):
+                    return 0.0
+        return None
+
+
+class LocalBackend:
+    """
+    Offline stand-in for the Anthropic API.
+
+    The responder receives the request keyword arguments and returns the
+    response text; by default the last user message is echoed back.
+    """
+
+    def __init__(self, responder: Optional[Callable[[Dict[str, Any]], str]] = None, latency: float = 0.0):
+        self.responder = responder or self._echo
+        self.latency = latency
+
+    def _echo(self, request: Dict[str, Any]) -> str:
+        return request["messages"][-1]["content"]
+
+    def _message(self, request: Dict[str, Any]) -> Any:
+        text = self.responder(request)
+        return local_message(text, request.get("model", DEFAULT_MODEL),
+                             input_tokens=len(json.dumps(request.get("messages", []))) // 4,
+                             output_tokens=len(text) // 4)
+
+    def create(self, **kwargs) -> Any:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._message(kwargs)
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        return None
+
+
+def local_message(text: str, model: str = DEFAULT_MODEL, input_tokens: int = 0, output_tokens: int = 0) -> Any:
+    """Build an object shaped like an Anthropic Message for offline backends."""
+    return SimpleNamespace(
+        content=[SimpleNamespace(type="text", text=text)],
+        model=model,
+        role="assistant",
+        stop_reason="end_turn",
+        usage=SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens)
+    )
+
+
+class LLMGateway:
+    """
+    Shared entry point for every LLM call made by the agents.
+
+    Bounds the number of in-flight requests, spaces request starts with a
+    token bucket, retries transient failures with jittered exponential
+    backoff and lets identical concurrent requests share one API call.
+    """
+
+    def __init__(self, backend: Any = None, max_concurrency: int = 8, requests_per_minute: float = 50,
+                 max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.backend = backend or AnthropicBackend(max_connections=max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_concurrency = max_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._bucket = TokenBucket(requests_per_minute)
+        self._in_flight: Dict[str, Future] = {}
+        self._in_flight_lock = threading.Lock()
+        # Only runs leaf model calls, so a full pool only delays, never deadlocks
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm-call")
+
+    def create_message(self, **kwargs) -> Any:
+        """Blocking equivalent of client.messages.create(**kwargs)."""
+        key = self._request_key(kwargs)
+        future, is_leader = self._join(key)
+        if not is_leader:
+            return future.result()
+        try:
+            future.set_result(self._call_with_retries(kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            self._leave(key)
+        return future.result()
+
+    def submit_message(self, **kwargs) -> Future:
+        """
+        Start create_message(**kwargs) on the gateway's threads and return its future.
+
+        For model calls that do not depend on each other, such as the two
+        summaries: the caller makes one itself and submits the others, so
+        they take one round trip instead of several.
+        """
+        return self._executor.submit(bind_context(self.create_message, **kwargs))
+
+    def backoff_delay(self, attempt: int, retry_after: float = 0.0) -> float:
+        """Full-jitter exponential backoff, never shorter than the server's retry-after."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        return max(delay, retry_after)
+
+    def _call_with_retries(self, kwargs: Dict[str, Any]) -> Any:
+        attempt = 0
+        while True:
+            self._bucket.acquire()
+            with self._semaphore:
+                started = time.perf_counter()
+                try:
+                    message = self.backend.create(**kwargs)
+                    observe_llm_call(request_stage(kwargs), time.perf_counter() - started, message)
+                    return message
+                except Exception as e:
+                    observe_llm_call(request_stage(kwargs), time.perf_counter() - started, error=e)
+                    delay = self._retry_delay(e, attempt)
+            time.sleep(delay)
+            attempt += 1
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Return how long to wait before retrying, or re-raise if the error is final."""
+        retry_after = self.backend.retry_after(error)
+        if retry_after is None or attempt >= self.max_retries:
+            raise error
+        delay = self.backoff_delay(attempt, retry_after)
+        if retry_after:
+            self._bucket.penalize(retry_after)
+        logger.warning({
+            "agent": "LLMGateway",
+            "action": "retrying_request",
+            "attempt": attempt + 1,
+            "delay": round(delay, 2),
+            "error": str(error)
+        })
+        return delay
+
+    def _request_key(self, kwargs: Dict[str, Any]) -> str:
+        payload = json.dumps(kwargs, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _join(self, key: str):
+        """Return the future for a request and whether this caller must execute it."""
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+            return future, True
+
+    def _leave(self, key: str) -> None:
+        with self._in_flight_lock:
+            self._in_flight.pop(key, None)
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """
+    Return the process-wide gateway, creating it from the environment on first use.
+
+    LLM_MAX_CONCURRENCY and LLM_REQUESTS_PER_MINUTE size the limits;
+    LLM_BACKEND=local selects the offline stand-in backend. LLM_RECORD_PATH
+    saves every response to a cassette file and LLM_REPLAY_PATH answers
+    from one instead of calling the API.
+    """
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                backend = LocalBackend() if os.getenv("LLM_BACKEND", "anthropic").lower() == "local" else None
+                if os.getenv("LLM_REPLAY_PATH"):
+                    from .llm_replay import ReplayBackend
+                    backend = ReplayBackend(os.getenv("LLM_REPLAY_PATH"), fallback=backend)
+                elif os.getenv("LLM_RECORD_PATH"):
+                    from .llm_replay import RecordingBackend
+                    backend = RecordingBackend(backend or AnthropicBackend(), os.getenv("LLM_RECORD_PATH"))
+                _gateway = LLMGateway(
+                    backend=backend,
+                    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+                    requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "50")),
+                    max_retries=int(os.getenv("LLM_MAX_RETRIES", "4"))
+                )
+    return _gateway
+
+
+def set_llm_gateway(gateway: Optional[LLMGateway]) -> None:
+    """Replace the process-wide gateway, e.g. with one using a LocalBackend."""
+    global _gateway
+    with _gateway_lock:
+        _gateway = gateway
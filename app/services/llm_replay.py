@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .llm_gateway import STAGE_MARKERS, local_message, request_stage  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+
+def request_keys(request: Dict[str, Any]) -> tuple:
+    """
+    Return (exact, loose) lookup keys for a request.
+
+    The exact key covers every argument. The loose key only covers the stage
+    and the final user message, so recordings survive changes to the system
+    prompt such as a refreshed schema description.
+    """
+    exact = json.dumps(request, sort_keys=True, default=str)
+    loose = json.dumps([request_stage(request), request.get("messages", [{}])[-1].get("content")],
+                       default=str)
+    return (hashlib.sha256(exact.encode("utf-8")).hexdigest(),
+            hashlib.sha256(loose.encode("utf-8")).hexdigest())
+
+
+class LatencyModel:
+    """
+    Synthetic API latency: a fixed base plus a per-output-token cost,
+    multiplied by log-normal jitter.
+    """
+
+    def __init__(self, base: float = 0.4, per_output_token: float = 0.01, jitter: float = 0.25,
+                 scale: float = 1.0, seed: Optional[int] = None):
+        self.base = base
+        self.per_output_token = per_output_token
+        self.jitter = jitter
+        self.scale = scale
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self, output_tokens: int) -> float:
+        with self._lock:
+            factor = self._random.lognormvariate(0, self.jitter) if self.jitter else 1.0
+        return (self.base + self.per_output_token * output_tokens) * factor * self.scale
+
+
+class ReplayMissError(KeyError):
+    """Raised when a replayed request has no recording and no fallback backend."""
+
+
+class RecordingBackend:
+    """Passes requests to another backend and saves every response to a cassette file."""
+
+    def __init__(self, backend: Any, cassette_path: str):
+        self.backend = backend
+        self.cassette_path = cassette_path
+        self._lock = threading.Lock()
+        self._entries = _load_cassette(cassette_path)
+
+    def create(self, **kwargs) -> Any:
+        started = time.perf_counter()
+        message = self.backend.create(**kwargs)
+        self._record(kwargs, message, time.perf_counter() - started)
+        return message
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        return self.backend.retry_after(error)
+
+    def _record(self, request: Dict[str, Any], message: Any, elapsed: float) -> None:
+        exact, loose = request_keys(request)
+        entry = {
+            "stage": request_stage(request),
+            "text": message.content[0].text,
+            "model": getattr(message, "model", request.get("model")),
+            "input_tokens": getattr(message.usage, "input_tokens", 0),
+            "output_tokens": getattr(message.usage, "output_tokens", 0),
+            "latency": round(elapsed, 4)
+        }
+        with self._lock:
+            self._entries["exact"][exact] = entry
+            self._entries["loose"][loose] = entry
+            _save_cassette(self.cassette_path, self._entries)
+
+
+class ReplayBackend:
+    """
+    Answers requests from a cassette recorded by RecordingBackend.
+
+    Misses are sent to the fallback backend if one is given. Every response
+    is delayed according to the latency model; without one the recorded
+    latency is replayed.
+    """
+
+    def __init__(self, cassette_path: Optional[str] = None, latency_model: Optional[LatencyModel] = None,
+                 fallback: Any = None):
+        self._entries = _load_cassette(cassette_path)
+        self.latency_model = latency_model
+        self.fallback = fallback
+        self.hits = 0
+        self.misses = 0
+
+    def create(self, **kwargs) -> Any:
+        message, delay = self._lookup(kwargs)
+        if delay:
+            time.sleep(delay)
+        return message
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        return None
+
+    def _lookup(self, request: Dict[str, Any]) -> tuple:
+        exact, loose = request_keys(request)
+        entry = self._entries["exact"].get(exact) or self._entries["loose"].get(loose)
+        if entry is not None:
+            self.hits += 1
+            message = local_message(entry["text"], entry.get("model") or request.get("model"),
+                                    entry.get("input_tokens", 0), entry.get("output_tokens", 0))
+            recorded = entry.get("latency", 0.0)
+        elif self.fallback is not None:
+            self.misses += 1
+            message = self.fallback.create(**request)
+            recorded = 0.0
+        else:
+            raise ReplayMissError(f"No recording for {request_stage(request)} request")
+        if self.latency_model is not None:
+            return message, self.latency_model.sample(message.usage.output_tokens)
+        return message, recorded
+
+
+def _load_cassette(path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {"exact": {}, "loose": {}}
+
+
+def _save_cassette(path: str, entries: Dict[str, Dict[str, Any]]) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=1)
+    os.replace(tmp_path, path)
@@ -0,0 +1,166 @@
+import copy
+import fnmatch
+import hashlib
+import logging
+import logging.handlers
+import random
+from typing import Any, Dict, Optional
+
+from .request_context import current_request_id
+
+# Per-call progress events that a later *_complete or *_error event repeats;
+# one in ten is kept unless LOG_SAMPLING says otherwise
+DEFAULT_SAMPLING = {
+    "PromptClassifier.starting_classification": 0.1,
+    "PromptClassifier.analyzing_prompt": 0.1,
+    "SQLGenerator.starting_sql_generation": 0.1,
+    "SQLGenerator.generating_sql": 0.1,
+    "SQLGenerator.detecting_visualization_columns": 0.1,
+    "SummaryGenerator.starting_summary_generation": 0.1,
+    "VisualizationProcessor.starting_visualization": 0.1,
+    "VisualizationProcessor.column_selection": 0.1,
+    "VisualizationProcessor.creating_figure": 0.1,
+}
+
+
+def parse_sampling(spec: Optional[str]) -> Dict[str, float]:
+    """
+    Parse LOG_SAMPLING, e.g. "SQLGenerator.*=0.2,SummaryGenerator.summary_complete=0".
+
+    Keys are Agent.action patterns (fnmatch), values the share of events kept.
+    They are applied on top of DEFAULT_SAMPLING.
+    """
+    rates = dict(DEFAULT_SAMPLING)
+    for item in (spec or "").split(","):
+        if "=" in item:
+            pattern, rate = item.rsplit("=", 1)
+            rates[pattern.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a share of the records of chatty structured events.
+
+    Records are matched on "<agent>.<action>" of their dict message; the
+    most specific matching pattern wins. Warnings and errors are never
+    sampled, and neither is anything that is not a structured event.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.exact = {key: rate for key, rate in rates.items() if not any(c in key for c in "*?[")}
+        # Longest pattern first, so "SQLGenerator.generating_*" beats "SQLGenerator.*"
+        self.patterns = sorted(((key, rate) for key, rate in rates.items() if key not in self.exact),
+                               key=lambda item: -len(item[0]))
+        self._resolved: Dict[str, float] = {}
+
+    def rate(self, event: str) -> float:
+        rate = self._resolved.get(event)
+        if rate is None:
+            rate = self.exact.get(event)
+            if rate is None:
+                rate = next((rate for pattern, rate in self.patterns if fnmatch.fnmatchcase(event, pattern)), 1.0)
+            self._resolved[event] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not isinstance(record.msg, dict):
+            return True
+        rate = self.rate(f"{record.msg.get('agent')}.{record.msg.get('action')}")
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+class PayloadFilter(logging.Filter):
+    """
+    Shorten large fields of structured log messages.
+
+    Prompts, SQL, model responses and summaries are logged on every call;
+    strings longer than max_chars are cut down ("truncate") or replaced by a
+    digest ("hash"), both carrying the original length and a sha256 prefix so
+    identical payloads can still be correlated. "full" leaves them alone.
+    Applied by StructuredQueueListener, off the request path.
+    """
+
+    def __init__(self, mode: str = "truncate", max_chars: int = 300):
+        super().__init__()
+        self.mode = mode
+        self.max_chars = max_chars
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.mode != "full" and isinstance(record.msg, dict):
+            record.msg = self._shorten(record.msg)
+        return True
+
+    def _shorten(self, value: Any) -> Any:
+        if isinstance(value, str):
+            if len(value) <= self.max_chars:
+                return value
+            digest = hashlib.sha256(value.encode("utf-8", "replace")).hexdigest()[:12]
+            if self.mode == "hash":
+                return f"<{len(value)} chars sha256:{digest}>"
+            return f"{value[:self.max_chars]}...<{len(value)} chars sha256:{digest}>"
+        if isinstance(value, dict):
+            return {key: self._shorten(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._shorten(item) for item in value]
+        return value
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the id of the request they were logged for."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Runs on the logging thread, where the request's context is visible
+        request_id = current_request_id()
+        if request_id is not None:
+            record.request_id = request_id
+        return True
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves dict messages intact for the JSON formatter.
+
+    The stock prepare() formats every record on the calling thread, which
+    is exactly the work the queue should move away, and turns dict messages
+    into their repr. Only what cannot wait is done here: %-args are merged
+    and tracebacks rendered while the exception is still current.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if isinstance(record.msg, dict):
+            # The caller may reuse the dict after logging it
+            record.msg = dict(record.msg)
+        elif record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class StructuredQueueListener(logging.handlers.QueueListener):
+    """QueueListener that applies a filter once per record, before any handler sees it."""
+
+    def __init__(self, queue, *handlers, record_filter: Optional[logging.Filter] = None,
+                 respect_handler_level: bool = False):
+        super().__init__(queue, *handlers, respect_handler_level=respect_handler_level)
+        self.record_filter = record_filter
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if self.record_filter is not None:
+            self.record_filter.filter(record)
+        return record
+
+
+def create_file_handler(path: str, max_bytes: int, backup_count: int,
+                        when: Optional[str] = None) -> logging.Handler:
+    """Rotating log file: by time if `when` is set (e.g. "midnight"), otherwise by size."""
+    if when:
+        return logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backup_count,
+                                                         encoding="utf-8", delay=True)
+    return logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                encoding="utf-8", delay=True)
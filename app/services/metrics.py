@@ -0,0 +1,203 @@
+import functools
+import math
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; LLM calls and uploads run far past the usual web buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+RATE_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic count per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # One count per bucket, then sum and count
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            snapshot = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in snapshot:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """The metrics of this process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "reportchat_http_request_seconds", "Time to answer an HTTP request.", ("endpoint", "method", "status"))
+STAGE_SECONDS = REGISTRY.histogram(
+    "reportchat_stage_seconds", "Time spent in a phase of the question pipeline.", ("stage", "outcome"))
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "reportchat_llm_request_seconds", "Time of one LLM API call, per pipeline stage.", ("stage", "outcome"))
+LLM_TOKENS = REGISTRY.counter(
+    "reportchat_llm_tokens_total", "Tokens billed by the LLM API.", ("stage", "kind"))
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "reportchat_db_query_seconds", "Time to run a SQL query and fetch its rows.", ("mode", "outcome"))
+DB_QUERY_ROWS = REGISTRY.histogram(
+    "reportchat_db_query_rows", "Rows returned by a SQL query.", ("mode",), ROW_BUCKETS)
+INGEST_SECONDS = REGISTRY.histogram(
+    "reportchat_ingest_seconds", "Time to read and ingest an uploaded report.", ("file_type", "outcome"))
+INGEST_ROWS = REGISTRY.counter(
+    "reportchat_ingest_rows_total", "Report rows ingested.", ("file_type",))
+INGEST_ROWS_PER_SECOND = REGISTRY.histogram(
+    "reportchat_ingest_rows_per_second", "Ingest throughput of an upload.", ("file_type",), RATE_BUCKETS)
+
+
+def _outcome(result: Any) -> str:
+    if isinstance(result, dict) and ("error" in result or result.get("success") is False):
+        return "error"
+    return "ok"
+
+
+def timed_stage(stage: str):
+    """
+    Record the duration of a pipeline method in reportchat_stage_seconds.
+
+    Methods that report failure in their result dict (an "error" key or
+    success=False) count as outcome="error", ones that raise as
+    outcome="exception".
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "exception"
+            try:
+                result = func(*args, **kwargs)
+                outcome = _outcome(result)
+                return result
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage, outcome=outcome)
+        return wrapper
+    return decorate
+
+
+def observe_llm_call(stage: str, seconds: float, message: Any = None, error: Optional[Exception] = None) -> None:
+    """Record one LLM API call and the tokens it used."""
+    LLM_REQUEST_SECONDS.observe(seconds, stage=stage, outcome="error" if error is not None else "ok")
+    usage = getattr(message, "usage", None)
+    if usage is None:
+        return
+    for kind in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"):
+        tokens = getattr(usage, kind, None)
+        if tokens:
+            LLM_TOKENS.inc(tokens, stage=stage, kind=kind.replace("_tokens", ""))
+
+
+def observe_query(seconds: float, result: Dict[str, Any], read_only: bool) -> None:
+    mode = "read_only" if read_only else "read_write"
+    DB_QUERY_SECONDS.observe(seconds, mode=mode, outcome=_outcome(result))
+    if result.get("success"):
+        DB_QUERY_ROWS.observe(len(result["results"]), mode=mode)
+
+
+def observe_ingest(file_type: str, seconds: float, result: Dict[str, Any]) -> None:
+    INGEST_SECONDS.observe(seconds, file_type=file_type, outcome=_outcome(result))
+    rows = result.get("rows")
+    if result.get("success") and rows:
+        INGEST_ROWS.inc(rows, file_type=file_type)
+        INGEST_ROWS_PER_SECOND.observe(rows / max(seconds, 1e-9), file_type=file_type)
@@ -0,0 +1,229 @@
+import contextlib
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+_session: contextvars.ContextVar[Optional["ProfileSession"]] = contextvars.ContextVar("profile_session", default=None)
+_thread_state = threading.local()
+
+
+def current_session() -> Optional["ProfileSession"]:
+    return _session.get()
+
+
+def deactivate(token: contextvars.Token) -> None:
+    """End the session a ProfileSession.activate() token belongs to."""
+    _session.reset(token)
+
+
+def sampling_profiler_available() -> bool:
+    try:
+        import pyinstrument  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def normalize_statement(statement: str) -> str:
+    """Statement text with literals replaced, so executions of one statement group together."""
+    statement = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    statement = re.sub(r"\b\d+(?:\.\d+)?\b", "?", statement)
+    return " ".join(statement.split())[:500]
+
+
+class ProfileSession:
+    """
+    Profile of a single request.
+
+    The request thread is profiled from the start of the request. Work the
+    request hands to other threads (the LLM gateway pool, chart rendering)
+    runs through profile_call() and is profiled in that thread for its
+    duration. All parts are merged when the
+    profile is saved. SQLite statements run on connections opened while the
+    session is active are timed by TracedConnection.
+    """
+
+    def __init__(self, method: str, path: str, profiler: str = "cprofile"):
+        self.profile_id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.profiler = profiler
+        self.created_on = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.started = time.perf_counter()
+        self._parts: List[Any] = []
+        self._statements: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def activate(self) -> contextvars.Token:
+        return _session.set(self)
+
+    @contextlib.contextmanager
+    def profile_thread(self):
+        """Profile the current thread until the block ends, unless it is profiled already."""
+        if getattr(_thread_state, "profiling", False):
+            yield
+            return
+        _thread_state.profiling = True
+        thread_name = threading.current_thread().name
+        if self.profiler == "pyinstrument":
+            from pyinstrument import Profiler
+            profiler = Profiler(async_mode="disabled")
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if self.profiler == "pyinstrument":
+                profiler.stop()
+            else:
+                profiler.disable()
+            _thread_state.profiling = False
+            with self._lock:
+                self._parts.append((thread_name, profiler))
+
+    def record_statement(self, statement: str, seconds: float) -> None:
+        key = normalize_statement(statement)
+        with self._lock:
+            entry = self._statements.setdefault(key, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def save(self, profiles_dir: str, status: int, top: int = 40) -> Dict[str, Any]:
+        """Write the merged profile and a summary to profiles_dir/<id>/ and return the summary."""
+        path = os.path.join(profiles_dir, self.profile_id)
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            parts = list(self._parts)
+            statements = dict(self._statements)
+
+        summary = {
+            "id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "created_on": self.created_on,
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "profiler": self.profiler,
+            "threads": sorted({thread_name for thread_name, _ in parts}),
+            # Time from a statement's start to the next statement or close on its
+            # connection, so it includes fetching rows and the caller's work in between
+            "sql": [
+                {"statement": statement, "count": count, "total_ms": round(seconds * 1000, 2)}
+                for statement, (count, seconds) in sorted(statements.items(), key=lambda item: -item[1][1])
+            ],
+            "sql_total_ms": round(sum(seconds for _, seconds in statements.values()) * 1000, 2)
+        }
+
+        if self.profiler == "pyinstrument":
+            text = "\n".join(f"=== {thread_name}\n{profiler.output_text(unicode=True)}" for thread_name, profiler in parts)
+        else:
+            text = ""
+            if parts:
+                stats = pstats.Stats(parts[0][1])
+                for _, profiler in parts[1:]:
+                    stats.add(profiler)
+                stats.dump_stats(os.path.join(path, "profile.pstats"))
+                stream = io.StringIO()
+                stats.stream = stream
+                stats.sort_stats("cumulative").print_stats(top)
+                text = stream.getvalue()
+        with open(os.path.join(path, "profile.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+        with open(os.path.join(path, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+
+def profile_call(fn, *args, **kwargs):
+    """Call fn, profiling this thread if the calling context belongs to a profiled request."""
+    session = _session.get()
+    if session is None:
+        return fn(*args, **kwargs)
+    with session.profile_thread():
+        return fn(*args, **kwargs)
+
+
+class TracedConnection(sqlite3.Connection):
+    """
+    Connection that reports each statement and its duration to a profile.
+
+    The trace callback fires when a statement starts; it is timed until the
+    next statement starts on the connection or the connection is closed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session = _session.get()
+        self._statement = None
+        self._statement_started = 0.0
+        self.set_trace_callback(self._trace)
+
+    def _trace(self, statement: str) -> None:
+        now = time.perf_counter()
+        self._finish(now)
+        self._statement = statement
+        self._statement_started = now
+
+    def _finish(self, now: float) -> None:
+        if self._statement is not None and self._session is not None:
+            self._session.record_statement(self._statement, now - self._statement_started)
+        self._statement = None
+
+    def close(self) -> None:
+        self._finish(time.perf_counter())
+        super().close()
+
+
+def connect(database: str, **kwargs) -> sqlite3.Connection:
+    """sqlite3.connect(), with statement tracing while a profiled request is running."""
+    if _session.get() is not None:
+        kwargs["factory"] = TracedConnection
+    return sqlite3.connect(database, **kwargs)
+
+
+def list_profiles(profiles_dir: str, limit: int = 50) -> List[Dict[str, Any]]:
+    """Summaries of the stored profiles, newest first."""
+    summaries = []
+    if os.path.isdir(profiles_dir):
+        for profile_id in os.listdir(profiles_dir):
+            summary = load_summary(profiles_dir, profile_id)
+            if summary:
+                summaries.append({key: summary[key] for key in
+                                  ("id", "method", "path", "status", "created_on", "elapsed_ms", "sql_total_ms")})
+    summaries.sort(key=lambda summary: summary["created_on"], reverse=True)
+    return summaries[:limit]
+
+
+def load_summary(profiles_dir: str, profile_id: str) -> Optional[Dict[str, Any]]:
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(profiles_dir, profile_id, "summary.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def prune_profiles(profiles_dir: str, keep: int) -> None:
+    """Delete all but the newest `keep` stored profiles."""
+    if not os.path.isdir(profiles_dir):
+        return
+    entries = [os.path.join(profiles_dir, name) for name in os.listdir(profiles_dir) if PROFILE_ID_PATTERN.match(name)]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for path in entries[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
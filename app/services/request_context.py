@@ -0,0 +1,34 @@
+import contextvars
+import functools
+import re
+import uuid
+from typing import Callable, Optional
+
+from .profiling import profile_call
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# Accept a caller's id (e.g. from a proxy) only if it is short and plain
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+
+def start_request(incoming: Optional[str] = None) -> contextvars.Token:
+    """Set the request id for the current context, reusing a well-formed incoming one."""
+    request_id = incoming if incoming and REQUEST_ID_PATTERN.match(incoming) else uuid.uuid4().hex
+    return request_id_var.set(request_id)
+
+
+def current_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+def bind_context(fn: Callable, *args, **kwargs) -> Callable[[], object]:
+    """
+    Return fn(*args, **kwargs) as a callable that runs in a copy of the current context.
+
+    Thread pools do not carry context variables over, so work handed to one
+    would log without the request id of the request that started it, and
+    would be missing from the request's profile.
+    """
+    return functools.partial(contextvars.copy_context().run, profile_call, fn, *args, **kwargs)
@@ -0,0 +1,190 @@
+import logging
+from typing import Dict, Any, List
+
+from .db_meta import get_meta, set_meta, delete_meta
+from .dictionary_encoding import storage_table
+
+logger = logging.getLogger(__name__)
+
+
+def sap_day(column: str) -> str:
+    """
+    SQL expression turning an ISO or SAP (DD.MM.YYYY) date text into YYYY-MM-DD, or ''.
+
+    Texts shaped like a date that are not one, such as SAP's 00.00.0000
+    placeholder or 2024-13-01, give '' as well.
+    """
+    iso = f"substr({column}, 1, 10)"
+    sap = f"substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || substr({column}, 1, 2)"
+    # date() is NULL for an impossible month; with a modifier it also rolls 2024-02-30
+    # over to March, so a valid date is one that comes back unchanged
+    return f"""CASE
+        WHEN {column} GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*' AND date({iso}, '+0 days') = {iso} THEN {iso}
+        WHEN {column} GLOB '[0-9][0-9].[0-9][0-9].[0-9][0-9][0-9][0-9]*' AND date({sap}, '+0 days') = {sap} THEN {sap}
+        ELSE ''
+    END"""
+
+
+# Each rollup groups one type table (alias t, joined to common_fields as c) by
+# snapshot (load_id), a few low-cardinality dimensions and the week of a date,
+# and keeps only additive measures, so a batch of new rows can be folded in
+# with an upsert instead of recomputing the whole table. Functional
+# locations, people and days are left out on purpose: at that grain a rollup
+# has about as many rows as its source and is no faster to query.
+ROLLUPS = [
+    {
+        "name": "rollup_iw38_costs",
+        "source": "IW38",
+        "description": "IW38 order counts and costs per plant section, order type and creation week",
+        "dimensions": [
+            ("plant_section", "t.plant_section"),
+            ("order_type", "t.order_type")
+        ],
+        "date": sap_day("t.created_on"),
+        "measures": [
+            ("order_count", "COUNT(*)", "1"),
+            ("total_actual_costs", "SUM", "CAST(t.total_actual_costs AS REAL)"),
+            ("breakdown_duration", "SUM", "CAST(t.breakdown_duration AS REAL)")
+        ]
+    },
+    {
+        "name": "rollup_iw47_work",
+        "source": "IW47",
+        "description": "IW47 confirmation counts and planned/actual work per work center and finish week",
+        "dimensions": [
+            ("work_center", "t.work_center")
+        ],
+        "date": f"COALESCE(NULLIF({sap_day('t.actual_finish_date')}, ''), {sap_day('t.created_on')})",
+        "measures": [
+            ("confirmation_count", "COUNT(*)", "1"),
+            ("actual_work", "SUM", "CAST(t.actual_work AS REAL)"),
+            ("planned_work", "SUM", "CAST(t.planned_work AS REAL)")
+        ]
+    },
+    {
+        "name": "rollup_iw68_codes",
+        "source": "IW68",
+        "description": "IW68 notification item counts per code group, damage code and cause code",
+        "dimensions": [
+            ("code_group", "t.code_group"),
+            ("damage_code", "t.damage_code"),
+            ("cause_code", "t.cause_code")
+        ],
+        "date": None,
+        "measures": [
+            ("item_count", "COUNT(*)", "1")
+        ]
+    }
+]
+
+
+class RollupMaintainer:
+    """
+    Keeps the rollup tables in step with the type tables.
+
+    A per-rollup watermark in db_meta records the highest source row id
+    already folded in; update() aggregates only the rows above it.
+    """
+
+    def create(self, conn) -> None:
+        for spec in ROLLUPS:
+            keys = self._key_columns(spec)
+            columns = ["load_id INTEGER NOT NULL DEFAULT 0"]
+            columns += [f"{name} TEXT NOT NULL DEFAULT ''" for name in keys[1:]]
+            columns += [f"{name} REAL NOT NULL DEFAULT 0" if agg == "SUM" else f"{name} INTEGER NOT NULL DEFAULT 0"
+                        for name, agg, _ in spec["measures"]]
+
+            # A rollup whose layout changed is dropped and refilled from the source
+            existing = [row[1] for row in conn.execute(f"PRAGMA table_info({spec['name']})")]
+            if existing and existing != [column.split()[0] for column in columns]:
+                conn.execute(f"DROP TABLE {spec['name']}")
+                delete_meta(conn, f"rollup_watermark:{spec['name']}")
+
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {spec['name']} (
+                    {', '.join(columns)},
+                    PRIMARY KEY ({', '.join(keys)})
+                ) WITHOUT ROWID
+            """)
+            if spec["date"]:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{spec['name']}_week ON {spec['name']}(week)")
+
+    def update(self, conn) -> Dict[str, Any]:
+        """Fold source rows added since the last update into every rollup."""
+        folded = {}
+        for spec in ROLLUPS:
+            watermark_key = f"rollup_watermark:{spec['name']}"
+            low = int(get_meta(conn, watermark_key, 0))
+            high = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {storage_table(spec['source'])}").fetchone()[0]
+            if high <= low:
+                continue
+            conn.execute(self._upsert_sql(spec), (low, high))
+            set_meta(conn, watermark_key, high)
+            folded[spec["name"]] = high - low
+        if folded:
+            logger.info({
+                "agent": "RollupMaintainer",
+                "action": "rollups_updated",
+                "rows_folded": folded
+            })
+        return folded
+
+    def rebuild(self, conn) -> None:
+        """Recompute every rollup from scratch, e.g. after source rows were deleted."""
+        for spec in ROLLUPS:
+            conn.execute(f"DELETE FROM {spec['name']}")
+        delete_meta(conn, "rollup_watermark:")
+        self.update(conn)
+
+    def delete_loads(self, conn, load_ids: List[int]) -> None:
+        """Drop the contribution of purged snapshots; load_id is part of every rollup key."""
+        placeholders = ", ".join("?" * len(load_ids))
+        for spec in ROLLUPS:
+            conn.execute(f"DELETE FROM {spec['name']} WHERE load_id IN ({placeholders})", load_ids)
+
+    def prompt_notes(self) -> List[str]:
+        notes = [
+            f"{spec['name']}: pre-aggregated {spec['description']}." for spec in ROLLUPS
+        ]
+        notes.append(
+            "Prefer the rollup_* tables for counts and sums grouped by their columns or by week (SUM the "
+            "measures); they hold one row per snapshot, dimension values and week, far fewer than the base "
+            "tables. week is the Monday of the week as YYYY-MM-DD. Use the base tables for daily figures, "
+            "COUNT(DISTINCT ...), row-level detail or filters on columns a rollup lacks. Empty strings in "
+            "rollup dimensions and week mean the source value was missing or not a date."
+        )
+        return notes
+
+    def _key_columns(self, spec: Dict[str, Any]) -> List[str]:
+        return ["load_id"] + [name for name, _ in spec["dimensions"]] + (["week"] if spec["date"] else [])
+
+    def _upsert_sql(self, spec: Dict[str, Any]) -> str:
+        keys = self._key_columns(spec)
+        inner = ["COALESCE(t.load_id, 0) AS load_id"]
+        inner += [f"COALESCE({expr}, '') AS {name}" for name, expr in spec["dimensions"]]
+        if spec["date"]:
+            inner.append(f"{spec['date']} AS day")
+        inner += [f"{expr} AS {name}" for name, _, expr in spec["measures"]]
+
+        outer = [key for key in keys if key != "week"]
+        if spec["date"]:
+            outer.append("COALESCE(CASE WHEN day != '' THEN date(day, '-6 days', 'weekday 1') END, '') AS week")
+        outer += [f"COUNT(*)" if agg == "COUNT(*)" else f"COALESCE(SUM({name}), 0)"
+                  for name, agg, _ in spec["measures"]]
+
+        insert_columns = keys + [name for name, _, _ in spec["measures"]]
+        updates = [f"{name} = {name} + excluded.{name}" for name, _, _ in spec["measures"]]
+
+        return f"""
+            INSERT INTO {spec['name']} ({', '.join(insert_columns)})
+            SELECT {', '.join(outer)}
+            FROM (
+                SELECT {', '.join(inner)}
+                FROM {spec['source']} t
+                LEFT JOIN common_fields c ON c.id = t.common_id
+                WHERE t.id > ? AND t.id <= ?
+            )
+            WHERE true
+            GROUP BY {', '.join(keys)}
+            ON CONFLICT({', '.join(keys)}) DO UPDATE SET {', '.join(updates)}
+        """
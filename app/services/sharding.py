@@ -0,0 +1,553 @@
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Dict, Any, List, Optional, Tuple, TYPE_CHECKING
+from urllib.request import pathname2url
+
+from .database_service import (
+    DatabaseService, INTERNAL_TABLES, _read_only_authorizer, read_report
+)
+from .db_meta import get_meta, set_meta
+from . import profiling
+from .dictionary_encoding import STORAGE_TABLES
+from .text_index import TEXT_INDEX_TABLES
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Ids of shard n start above n * SHARD_ID_SPAN, so report, upload and order
+# ids stay unique when the shards are read as one database
+SHARD_ID_SPAN = 10 ** 12
+
+PLANT_HEADER = 'Plant section'
+ORDER_HEADER = 'Order'
+NOTIFICATION_HEADER = 'Notification'
+
+# The union views attach every shard to one connection, and SQLite attaches
+# at most 10 databases (SQLITE_MAX_ATTACHED); plant sections without a shard
+# of their own go to the default shard once the limit is reached
+MAX_SHARDS = 10
+
+# Aggregates whose per-shard results combine into the overall result, and how
+MERGEABLE_AGGREGATES = {"SUM": "SUM", "TOTAL": "TOTAL", "COUNT": "SUM", "MIN": "MIN", "MAX": "MAX"}
+
+
+class ShardRouter:
+    """
+    Decides which shard an uploaded row belongs to.
+
+    An explicit upload tag wins; otherwise rows are routed on their plant
+    section, optionally grouped into families by a plant section -> shard map
+    (SHARD_MAP="A10=north,A20=north,B10=south"). Rows without a plant
+    section go to the default shard.
+    """
+
+    def __init__(self, mapping: Optional[Dict[str, str]] = None, default_shard: str = "default"):
+        self.mapping = {key: self.normalize(value) for key, value in (mapping or {}).items()}
+        self.default_shard = default_shard
+
+    @classmethod
+    def from_env(cls) -> "ShardRouter":
+        mapping = {}
+        for pair in os.getenv('SHARD_MAP', '').split(','):
+            if '=' in pair:
+                plant_section, shard = pair.split('=', 1)
+                mapping[plant_section.strip()] = shard.strip()
+        return cls(mapping, os.getenv('SHARD_DEFAULT', 'default'))
+
+    def normalize(self, name: str) -> str:
+        """Shard names double as file names."""
+        return re.sub(r'[^a-z0-9_-]+', '_', str(name).strip().lower()).strip('_') or self.default_shard
+
+    def shard_for(self, plant_section: Any) -> str:
+        if plant_section is None or (isinstance(plant_section, float) and math.isnan(plant_section)):
+            return self.default_shard
+        plant_section = str(plant_section).strip()
+        if not plant_section:
+            return self.default_shard
+        return self.mapping.get(plant_section) or self.normalize(plant_section)
+
+
+class ShardedDatabaseService(DatabaseService):
+    """
+    DatabaseService over one SQLite file per plant (or plant family).
+
+    Every shard is a complete database with its own snapshots and derived
+    tables, so an ingest only locks the shard it writes. db_path is the
+    default shard and also holds the dashboard and bookkeeping tables.
+
+    Queries see the shards as one database: the report views, rollups and
+    order index of every shard are attached to an in-memory connection and
+    combined with UNION ALL, with an extra shard column. Queries whose
+    result can be assembled from per-shard results (plain row selects and
+    SUM/COUNT/MIN/MAX aggregates) are instead run on all shards in parallel
+    and merged, which spreads the work over several cores. There are at
+    most MAX_SHARDS shards; with more plant sections than that, group them
+    with SHARD_MAP.
+    """
+
+    def __init__(self, db_path: str, shard_dir: str, router: Optional[ShardRouter] = None,
+                 max_workers: Optional[int] = None):
+        super().__init__(db_path)
+        self.shard_dir = shard_dir
+        self.router = router or ShardRouter()
+        self.shards: Dict[str, DatabaseService] = {self.router.default_shard: DatabaseService(db_path)}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers or min(8, os.cpu_count() or 1), thread_name_prefix="shard-query"
+        )
+
+    def initialize_database(self):
+        """Initialize the default shard and every shard file found in shard_dir."""
+        result = super().initialize_database()
+        if not result["success"]:
+            return result
+        try:
+            self._enable_wal(self)
+            os.makedirs(self.shard_dir, exist_ok=True)
+            for file_name in sorted(os.listdir(self.shard_dir)):
+                if file_name.endswith(".db"):
+                    self._open_shard(file_name[:-3])
+            return {"success": True, "shards": sorted(self.shards)}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def _ingest_upload(self, file_path: str, file_type: str, shard: Optional[str]) -> Dict[str, Any]:
+        """
+        Route the rows of an upload to their shards and ingest each part as a load there.
+
+        Args:
+            file_path: Uploaded report
+            file_type: Report type (IW38, IW47 or IW68)
+            shard: Upload tag naming the shard for all rows; routed per row when omitted
+
+        Returns:
+            Dict containing:
+            - success: boolean
+            - loads: load id per shard written
+            - rows: rows ingested
+        """
+        try:
+            df = read_report(file_path, self.staging)
+            if df.empty:
+                return {"success": False, "error": "No data found in file"}
+
+            keys = self._shard_keys(df, shard)
+            overflow = self._overflow_shards(keys)
+            if overflow and shard:
+                return {"success": False, "error": f"Cannot open shard {keys.iloc[0]}: "
+                                                   f"at most {MAX_SHARDS} shards, group them with SHARD_MAP"}
+            if overflow:
+                keys = keys.where(~keys.isin(overflow), self.router.default_shard)
+                logger.warning({
+                    "agent": "ShardedDatabaseService",
+                    "action": "shard_limit_reached",
+                    "max_shards": MAX_SHARDS,
+                    "routed_to_default": overflow
+                })
+            loads = {}
+            try:
+                for name, part in df.groupby(keys, sort=False):
+                    loads[name] = self._open_shard(name).ingest_dataframe(part, file_type,
+                                                                          os.path.basename(file_path))
+            except Exception:
+                # Each shard commits on its own; without the other parts a load must not count as a snapshot
+                self._discard_loads(loads)
+                raise
+            logger.info({
+                "agent": "ShardedDatabaseService",
+                "action": "upload_routed",
+                "file_type": file_type,
+                "rows_per_shard": {name: int(count) for name, count in keys.value_counts().items()}
+            })
+            return {"success": True, "loads": loads, "rows": len(df)}
+
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def _discard_loads(self, loads: Dict[str, int]) -> None:
+        """Remove the loads an upload already wrote to some shards before another shard failed."""
+        for name, load_id in loads.items():
+            try:
+                self.shards[name].discard_loads([load_id])
+            except sqlite3.Error as e:
+                logger.error({
+                    "agent": "ShardedDatabaseService",
+                    "action": "partial_load_not_removed",
+                    "shard": name,
+                    "load_id": load_id,
+                    "error": str(e)
+                })
+        if loads:
+            logger.warning({
+                "agent": "ShardedDatabaseService",
+                "action": "partial_upload_rolled_back",
+                "loads": loads
+            })
+
+    def apply_retention(self, keep: int = 1) -> Dict[str, Any]:
+        """Apply snapshot retention in every shard; results are keyed by shard."""
+        results = {name: service.apply_retention(keep) for name, service in self.shards.items()}
+        errors = {name: result["error"] for name, result in results.items() if not result["success"]}
+        if errors:
+            return {"success": False, "error": "; ".join(f"{name}: {error}" for name, error in errors.items())}
+        return {
+            "success": True,
+            "purged_loads": [load for result in results.values() for load in result["purged_loads"]],
+            "deleted_rows": {name: result["deleted_rows"] for name, result in results.items()},
+            "pages_freed": sum(result["pages_freed"] for result in results.values())
+        }
+
+    def get_read_only_connection(self):
+        conn = self._union_connection()
+        conn.set_authorizer(_read_only_authorizer)
+        return conn
+
+    def get_query_connection(self):
+        return self._union_connection()
+
+    def _execute_query(self, query: str, read_only: bool) -> Dict[str, Any]:
+        """
+        Run a query over all shards.
+
+        Queries are always read-only here: a write has no single shard to
+        go to, uploads are the only way data enters a shard.
+        """
+        plan = plan_fan_out(query) if len(self.shards) > 1 else None
+        if plan:
+            result = self._fan_out(plan)
+            if result:
+                return result
+        return super()._execute_query(query, read_only=True)
+
+    def get_data_version(self) -> int:
+        return sum(service.get_data_version() for service in list(self.shards.values()))
+
+    def get_schema_version(self) -> int:
+        # Schema cookies only grow, and a new shard adds its own
+        return sum(service.get_schema_version() for service in list(self.shards.values()))
+
+    def get_prompt_notes(self) -> List[str]:
+        """Notes for the union views; dictionary keys and full-text indexes stay inside the shards."""
+        return [
+            f"The data is split into shards ({', '.join(sorted(self.shards))}) by plant section. Every table "
+            "has a shard column naming the shard of the row, and ids are unique across shards. Each shard "
+            "keeps its own snapshots: the _current views and current_loads hold the latest upload per shard, "
+            "and an as-of filter is load_id IN (SELECT MAX(id) FROM uploads WHERE file_type = 'IW38' AND "
+            "purged_on IS NULL AND loaded_on <= '2024-06-30 23:59:59' GROUP BY shard)."
+        ] + self.snapshots.prompt_notes()[:1] + self.link_index.prompt_notes() + self.rollups.prompt_notes()
+
+    def _shard_keys(self, df: "pd.DataFrame", shard: Optional[str]) -> "pd.Series":
+        """Shard name per row: the upload tag, the plant section, or the shard that knows the order."""
+        import pandas as pd
+
+        if shard:
+            return pd.Series(self.router.normalize(shard), index=df.index)
+        if PLANT_HEADER in df.columns:
+            return df[PLANT_HEADER].map(self.router.shard_for)
+
+        # Confirmations and notification items carry no plant section and
+        # follow the order (or notification) into the shard that has it
+        keys = pd.Series(None, index=df.index, dtype=object)
+        for header, sql in [
+            (ORDER_HEADER, "SELECT order_number FROM order_dim WHERE order_number IN (SELECT value FROM json_each(?))"),
+            (NOTIFICATION_HEADER, "SELECT notification_number FROM order_notification "
+                                  "WHERE notification_number IN (SELECT value FROM json_each(?))")
+        ]:
+            if header not in df.columns:
+                continue
+            values = df[header].map(lambda value: None if pd.isna(value) else str(value))
+            wanted = json.dumps(sorted(set(values[keys.isna()].dropna())))
+            owner = {}
+            for name, service in list(self.shards.items()):
+                with closing(service.get_read_only_connection()) as conn:
+                    for (value,) in conn.execute(sql, (wanted,)):
+                        owner.setdefault(value, name)
+            keys = keys.fillna(values.map(owner))
+        return keys.fillna(self.router.default_shard)
+
+    def _overflow_shards(self, keys: "pd.Series") -> List[str]:
+        """New shards the keys ask for beyond MAX_SHARDS, the last ones first seen."""
+        new = [name for name in keys.unique() if name not in self.shards]
+        return new[max(0, MAX_SHARDS - len(self.shards)):]
+
+    def _open_shard(self, name: str) -> DatabaseService:
+        """Return the service of a shard, creating its database file on first use."""
+        with self._lock:
+            if name in self.shards:
+                return self.shards[name]
+            service = DatabaseService(os.path.join(self.shard_dir, f"{name}.db"))
+            result = service.initialize_database()
+            if not result["success"]:
+                raise sqlite3.OperationalError(f"Cannot initialize shard {name}: {result['error']}")
+            self._enable_wal(service)
+
+            with closing(self.get_db_connection()) as conn, conn:
+                index = get_meta(conn, f"shard_index:{name}")
+                if index is None:
+                    index = 1 + conn.execute(
+                        "SELECT COALESCE(MAX(CAST(value AS INTEGER)), 0) FROM db_meta WHERE key LIKE 'shard_index:%'"
+                    ).fetchone()[0]
+                    set_meta(conn, f"shard_index:{name}", index)
+            with closing(service.get_db_connection()) as conn, conn:
+                offset_ids(conn, int(index) * SHARD_ID_SPAN)
+
+            self.shards[name] = service
+            logger.info({
+                "agent": "ShardedDatabaseService",
+                "action": "shard_opened",
+                "shard": name,
+                "index": int(index)
+            })
+            return service
+
+    def _enable_wal(self, service: DatabaseService) -> None:
+        """Readers of a shard then never wait for an ingest into it."""
+        with closing(service.get_db_connection()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+
+    def _union_connection(self):
+        """In-memory connection with every shard attached and a UNION ALL view per table."""
+        conn = profiling.connect(":memory:", uri=True)
+        shards = sorted(self.shards.items())
+        for i, (name, service) in enumerate(shards):
+            uri = f"file:{pathname2url(os.path.abspath(service.db_path))}?mode=ro"
+            conn.execute(f"ATTACH DATABASE ? AS shard{i}", (uri,))
+
+        hidden = INTERNAL_TABLES | STORAGE_TABLES | TEXT_INDEX_TABLES
+        for (table,) in conn.execute(
+            "SELECT name FROM shard0.sqlite_master WHERE type IN ('table', 'view') "
+            "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        ).fetchall():
+            if table in hidden:
+                continue
+            columns = [row[1] for row in conn.execute(f'PRAGMA shard0.table_info("{table}")')]
+            # Dictionary keys differ per shard and are left out
+            columns = [c for c in columns if not (c.endswith("_id") and c[:-3] in columns)]
+            select = ", ".join(f'"{column}"' for column in columns)
+            conn.execute(f'CREATE TEMP VIEW "{table}" AS ' + " UNION ALL ".join(
+                f"SELECT {select}, '{name}' AS shard FROM shard{i}.\"{table}\""
+                for i, (name, _) in enumerate(shards)
+            ))
+        return conn
+
+    def _fan_out(self, plan: "FanOutPlan") -> Optional[Dict[str, Any]]:
+        """Run the per-shard part of a plan in parallel and merge it; None if that is not possible."""
+        try:
+            partials = list(self._pool.map(
+                lambda service: run_on_shard(service, plan.shard_query), list(self.shards.values())
+            ))
+            columns = partials[0][0]
+            with closing(sqlite3.connect(":memory:")) as conn:
+                conn.execute(f"CREATE TABLE partials ({', '.join(_quote(c) for c in columns)})")
+                for _, rows in partials:
+                    conn.executemany(f"INSERT INTO partials VALUES ({', '.join('?' * len(columns))})", rows)
+                cursor = conn.execute(plan.merge_query(columns))
+                merged_columns = [description[0] for description in cursor.description]
+                results = [dict(zip(merged_columns, row)) for row in cursor.fetchall()]
+            return {"success": True, "columns": merged_columns, "results": results}
+        except sqlite3.Error as e:
+            logger.info({
+                "agent": "ShardedDatabaseService",
+                "action": "fan_out_skipped",
+                "reason": str(e)
+            })
+            return None
+
+
+def offset_ids(conn, offset: int) -> None:
+    """Start the AUTOINCREMENT ids of every table of a shard above offset."""
+    for (table,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE '%AUTOINCREMENT%'"
+    ).fetchall():
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ? AND seq < ?", (offset, table, offset))
+        conn.execute(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT ?, ? "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)",
+            (table, offset, table)
+        )
+
+
+def run_on_shard(service: DatabaseService, query: str) -> Tuple[List[str], List[tuple]]:
+    with closing(service.get_read_only_connection()) as conn:
+        cursor = conn.execute(query)
+        return [description[0] for description in cursor.description], cursor.fetchall()
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class FanOutPlan:
+    """
+    How to answer a query from per-shard results.
+
+    shard_query runs on every shard; merge_query combines the rows they
+    return, loaded into a table named partials with the same column names.
+    """
+
+    def __init__(self, shard_query: str, aggregates: List[Optional[str]], grouped: bool, tail: str):
+        self.shard_query = shard_query
+        self.aggregates = aggregates
+        self.grouped = grouped
+        self.tail = tail
+
+    def merge_query(self, columns: List[str]) -> str:
+        if not any(self.aggregates):
+            return f"SELECT * FROM partials {self.tail}"
+        select = [
+            f"{MERGEABLE_AGGREGATES[aggregate]}({_quote(column)}) AS {_quote(column)}" if aggregate
+            else _quote(column)
+            for column, aggregate in zip(columns, self.aggregates)
+        ]
+        keys = [_quote(column) for column, aggregate in zip(columns, self.aggregates) if not aggregate]
+        group_by = f"GROUP BY {', '.join(keys)}" if self.grouped else ""
+        return f"SELECT {', '.join(select)} FROM partials {group_by} {self.tail}"
+
+
+_AGGREGATE_CALL = re.compile(r'^(\w+)\s*\((.*)\)$', re.S)
+_ANY_AGGREGATE = re.compile(r'\b(SUM|TOTAL|COUNT|MIN|MAX|AVG|GROUP_CONCAT)\s*\(', re.I)
+_UNSUPPORTED = re.compile(r'\b(UNION|INTERSECT|EXCEPT|DISTINCT|OVER|WINDOW|HAVING|OFFSET)\b|\(\s*SELECT\b', re.I)
+
+
+def _mask(query: str) -> str:
+    """Blank out comments, string literals and quoted names so keywords and brackets inside them are ignored."""
+    def blank(match):
+        text = match.group(0)
+        if text.startswith(("--", "/*")):
+            return " " * len(text)
+        return text[0] + " " * (len(text) - 2) + text[-1]
+    return re.sub(r"--[^\n]*|/\*.*?(?:\*/|$)|'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\]",
+                  blank, query, flags=re.S)
+
+
+def _top_level(masked: str, pattern: str) -> List[Tuple[int, int]]:
+    """Spans of a pattern outside any brackets."""
+    depths, depth = [], 0
+    for char in masked:
+        depth += char == "("
+        depths.append(depth)
+        depth -= char == ")"
+    return [match.span() for match in re.finditer(pattern, masked, re.I) if depths[match.start()] == 0]
+
+
+def _split_top_level(masked: str, text: str) -> List[str]:
+    parts, start = [], 0
+    for comma, _ in _top_level(masked, ","):
+        parts.append(text[start:comma])
+        start = comma + 1
+    return [part.strip() for part in parts + [text[start:]]]
+
+
+def _normalize(expression: str) -> str:
+    return re.sub(r"\s+", "", expression).upper()
+
+
+def _aggregate_of(masked: str) -> Optional[str]:
+    """The aggregate an output column is, if it is exactly one mergeable aggregate call."""
+    match = _AGGREGATE_CALL.match(masked)
+    if not match or match.group(1).upper() not in MERGEABLE_AGGREGATES:
+        return None
+    if _top_level(masked[match.end(1):].strip()[1:-1], r"\)"):
+        return None  # e.g. SUM(a) / COUNT(b): the brackets close before the end
+    if match.group(1).upper() in ("MIN", "MAX") and _top_level(match.group(2), ","):
+        return None  # two-argument MIN/MAX is a scalar function
+    return match.group(1).upper()
+
+
+def plan_fan_out(query: str) -> Optional[FanOutPlan]:
+    """
+    Plan a query for per-shard execution, or None when only the union views can answer it.
+
+    Supported are single SELECTs without subqueries whose output columns
+    are either all plain expressions or group keys plus SUM/TOTAL/COUNT/
+    MIN/MAX calls, with ORDER BY and LIMIT applied after merging. Queries
+    over more than one table go through the union views: the rows they
+    join need not be in the same shard, e.g. confirmations uploaded before
+    their orders stay in the default shard.
+    """
+    text = query.strip().rstrip(";").strip()
+    masked = _mask(text)
+    if not re.match(r"SELECT\b", masked, re.I) or ";" in masked or _UNSUPPORTED.search(masked):
+        return None
+
+    clauses = {}
+    for keyword in ["FROM", r"GROUP\s+BY", r"ORDER\s+BY", "LIMIT"]:
+        spans = _top_level(masked, rf"\b{keyword}\b")
+        if len(spans) > 1:
+            return None
+        if spans:
+            clauses[keyword.split("\\")[0]] = spans[0]
+    if "FROM" not in clauses:
+        return None
+    if _top_level(masked, r"\bJOIN\b"):
+        return None
+    from_end = min([span[0] for span in _top_level(masked, r"\bWHERE\b")]
+                   + [clauses[c][0] for c in ("GROUP", "ORDER", "LIMIT") if c in clauses] + [len(masked)])
+    if _top_level(masked[clauses["FROM"][1]:from_end], ","):
+        return None
+
+    select_start, select_end = len("SELECT"), clauses["FROM"][0]
+    items = _split_top_level(masked[select_start:select_end], text[select_start:select_end])
+    masked_items = _split_top_level(masked[select_start:select_end], masked[select_start:select_end])
+
+    aggregates, expressions = [], []
+    for item, masked_item in zip(items, masked_items):
+        alias = re.match(r"^(.*\S)\s+(\"[^\"]*\"|\w+)$", masked_item, re.S)
+        if alias and re.search(r"[\w\")]$", alias.group(1)):
+            end = len(re.sub(r"\s+AS$", "", alias.group(1), flags=re.I))
+            item, masked_item = item[:end], masked_item[:end]
+        aggregate = _aggregate_of(masked_item)
+        if aggregate is None and _ANY_AGGREGATE.search(masked_item):
+            return None
+        aggregates.append(aggregate)
+        expressions.append(_normalize(item))
+
+    grouped = "GROUP" in clauses
+    tail_start = min([clauses[c][0] for c in ("ORDER", "LIMIT") if c in clauses] or [len(text)])
+    if grouped:
+        group_terms = _split_top_level(
+            masked[clauses["GROUP"][1]:tail_start], text[clauses["GROUP"][1]:tail_start]
+        )
+        keys = [aggregate for aggregate in aggregates if aggregate is None]
+        if not any(aggregates) or len(group_terms) != len(keys):
+            return None
+    elif any(aggregates) and not all(aggregates):
+        return None
+
+    tail = ""
+    limit_start = clauses["LIMIT"][0] if "LIMIT" in clauses else len(text)
+    if "ORDER" in clauses:
+        # Aggregates in ORDER BY would re-aggregate the partial rows, so
+        # they are replaced by the position of the same output column
+        terms = []
+        for term, masked_term in zip(
+            _split_top_level(masked[clauses["ORDER"][1]:limit_start], text[clauses["ORDER"][1]:limit_start]),
+            _split_top_level(masked[clauses["ORDER"][1]:limit_start], masked[clauses["ORDER"][1]:limit_start])
+        ):
+            if _ANY_AGGREGATE.search(masked_term):
+                direction = re.search(r"(\s+(ASC|DESC))?(\s+NULLS\s+(FIRST|LAST))?$", masked_term, re.I)
+                expression = _normalize(term[:direction.start()])
+                if expression not in expressions:
+                    return None
+                term = str(expressions.index(expression) + 1) + term[direction.start():]
+            terms.append(term)
+        tail = "ORDER BY " + ", ".join(terms)
+    if "LIMIT" in clauses:
+        if "," in masked[limit_start:]:
+            return None  # LIMIT offset, count
+        tail += " " + text[limit_start:]
+
+    if any(aggregates):
+        # Orders and limits only apply to the merged groups
+        return FanOutPlan(text[:tail_start], aggregates, grouped, tail)
+    # Each shard's first rows in the same order contain the overall first rows
+    return FanOutPlan(text, aggregates, grouped, tail)
@@ -0,0 +1,163 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .dictionary_encoding import ENCODED_COLUMNS, storage_table
+
+logger = logging.getLogger(__name__)
+
+REPORT_TYPES = ["IW38", "IW47", "IW68"]
+
+
+def current_view(table: str) -> str:
+    return f"{table}_current"
+
+
+# Views holding only the latest snapshot, described to the model in the notes
+CURRENT_VIEWS = {current_view(table) for table in ENCODED_COLUMNS} | {"current_loads"}
+
+
+class SnapshotManager:
+    """
+    Tracks every upload as a snapshot (a load) of its report.
+
+    Each ingest registers a row in uploads and stamps its load_id on the rows
+    it writes. An upload of a report replaces the previous one as the current
+    snapshot, older loads stay queryable by load_id until retention purges
+    them.
+    """
+
+    def create(self, conn) -> None:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS uploads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_type TEXT NOT NULL,
+                file_name TEXT,
+                loaded_on TEXT NOT NULL,
+                row_count INTEGER,
+                purged_on TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_uploads_file_type ON uploads(file_type, id)")
+
+        # Databases from before snapshot tracking get load_id added, and one
+        # load per report for the rows they already hold
+        for table in ENCODED_COLUMNS:
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({storage_table(table)})")]
+            if "load_id" not in columns:
+                conn.execute(f"ALTER TABLE {storage_table(table)} ADD COLUMN load_id INTEGER REFERENCES uploads(id)")
+        for file_type, row_count in conn.execute(f"""
+            SELECT file_type, COUNT(*) FROM {storage_table('common_fields')}
+            WHERE load_id IS NULL GROUP BY file_type
+        """).fetchall():
+            load_id = self.begin_load(conn, file_type, "(loaded before snapshot tracking)")
+            self._stamp_unassigned(conn, file_type, load_id)
+            self.finish_load(conn, load_id, row_count)
+
+        for table in ENCODED_COLUMNS:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table.lower()}_load ON {storage_table(table)}(load_id)")
+
+    def create_views(self, conn) -> None:
+        """(Re)create the current-snapshot views; call after the report views exist."""
+        conn.execute("DROP VIEW IF EXISTS current_loads")
+        conn.execute("""
+            CREATE VIEW current_loads AS
+            SELECT file_type, MAX(id) AS load_id, MAX(loaded_on) AS loaded_on
+            FROM uploads WHERE purged_on IS NULL
+            GROUP BY file_type
+        """)
+        for table in REPORT_TYPES:
+            conn.execute(f"DROP VIEW IF EXISTS {current_view(table)}")
+            conn.execute(f"""
+                CREATE VIEW {current_view(table)} AS
+                SELECT * FROM {table}
+                WHERE load_id = (SELECT MAX(id) FROM uploads WHERE file_type = '{table}' AND purged_on IS NULL)
+            """)
+        conn.execute(f"DROP VIEW IF EXISTS {current_view('common_fields')}")
+        conn.execute(f"""
+            CREATE VIEW {current_view('common_fields')} AS
+            SELECT * FROM common_fields
+            WHERE load_id IN (SELECT load_id FROM current_loads)
+        """)
+
+    def begin_load(self, conn, file_type: str, file_name: str) -> int:
+        """Register a new load inside the ingest transaction and return its id."""
+        return conn.execute(
+            "INSERT INTO uploads (file_type, file_name, loaded_on) VALUES (?, ?, ?)",
+            (file_type, file_name, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        ).lastrowid
+
+    def finish_load(self, conn, load_id: int, row_count: int) -> None:
+        conn.execute("UPDATE uploads SET row_count = ? WHERE id = ?", (row_count, load_id))
+
+    def load_as_of(self, conn, file_type: str, as_of: Optional[str] = None) -> Optional[int]:
+        """
+        Return the snapshot of a report that was current at a point in time.
+
+        Args:
+            file_type: Report type (IW38, IW47 or IW68)
+            as_of: Timestamp as 'YYYY-MM-DD[ HH:MM:SS]'; None for the current snapshot
+
+        Returns:
+            The load id, or None if no unpurged load existed at that time
+        """
+        row = conn.execute(
+            "SELECT MAX(id) FROM uploads WHERE file_type = ? AND purged_on IS NULL AND loaded_on <= ?",
+            (file_type, as_of or "9999")
+        ).fetchone()
+        return row[0]
+
+    def superseded_loads(self, conn, keep: int) -> List[int]:
+        """Loads beyond the newest keep snapshots of each report that still hold rows."""
+        return [load_id for (load_id,) in conn.execute("""
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY file_type ORDER BY id DESC) AS age
+                FROM uploads WHERE purged_on IS NULL
+            ) WHERE age > ?
+        """, (keep,)).fetchall()]
+
+    def purge(self, conn, load_ids: List[int]) -> Dict[str, int]:
+        """Delete the rows of the given loads from the report tables and mark the loads purged."""
+        deleted = self._delete_rows(conn, load_ids)
+        conn.execute(
+            f"UPDATE uploads SET purged_on = ? WHERE id IN ({', '.join('?' * len(load_ids))})",
+            [datetime.now().strftime('%Y-%m-%d %H:%M:%S')] + load_ids
+        )
+        return deleted
+
+    def discard(self, conn, load_ids: List[int]) -> Dict[str, int]:
+        """Delete the given loads and their rows as if they had never been ingested."""
+        deleted = self._delete_rows(conn, load_ids)
+        conn.execute(f"DELETE FROM uploads WHERE id IN ({', '.join('?' * len(load_ids))})", load_ids)
+        return deleted
+
+    def _delete_rows(self, conn, load_ids: List[int]) -> Dict[str, int]:
+        placeholders = ", ".join("?" * len(load_ids))
+        return {
+            table: conn.execute(
+                f"DELETE FROM {storage_table(table)} WHERE load_id IN ({placeholders})", load_ids
+            ).rowcount
+            for table in ENCODED_COLUMNS
+        }
+
+    def prompt_notes(self) -> List[str]:
+        return [
+            "Every upload is a snapshot recorded in uploads (id, file_type, file_name, loaded_on); all report "
+            "tables and rollups carry its id as load_id. IW38_current, IW47_current, IW68_current and "
+            "common_fields_current have the same columns as their base tables but only the latest snapshot "
+            "of each report, and current_loads(file_type, load_id, loaded_on) lists those snapshots. Use the "
+            "_current views (and load_id IN (SELECT load_id FROM current_loads) on rollups) unless the "
+            "question is about history or comparing refreshes.",
+            "For a snapshot as of a date filter on load_id = (SELECT MAX(id) FROM uploads WHERE file_type = "
+            "'IW38' AND purged_on IS NULL AND loaded_on <= '2024-06-30 23:59:59'); compare refreshes by "
+            "grouping or joining on load_id."
+        ]
+
+    def _stamp_unassigned(self, conn, file_type: str, load_id: int) -> None:
+        common = storage_table("common_fields")
+        conn.execute(f"UPDATE {common} SET load_id = ? WHERE load_id IS NULL AND file_type = ?", (load_id, file_type))
+        if file_type in REPORT_TYPES:
+            conn.execute(f"""
+                UPDATE {storage_table(file_type)} SET load_id = ?
+                WHERE load_id IS NULL AND common_id IN (SELECT id FROM {common} WHERE load_id = ?)
+            """, (load_id, load_id))
@@ -0,0 +1,95 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .request_context import bind_context
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculativeExecutor:
+    """
+    Runs work in the background before the user asks for it.
+
+    Each submission is parked under a ticket id for ttl_seconds. A later
+    claim with the same ticket and key takes the (possibly still running)
+    result; unclaimed tickets are cancelled or thrown away when they expire.
+    """
+
+    def __init__(self, max_workers: int = 4, ttl_seconds: int = 120, max_tickets: int = 200):
+        self.ttl_seconds = ttl_seconds
+        self.max_tickets = max_tickets
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self._tickets: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # Claims that got a result, and claims with a ticket that did not
+        self.hits = 0
+        self.misses = 0
+
+    def submit(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> str:
+        """Start fn(*args, **kwargs) in the background and return its ticket id."""
+        ticket = uuid.uuid4().hex
+        future = self._executor.submit(bind_context(fn, *args, **kwargs))
+        with self._lock:
+            self._expire()
+            self._tickets[ticket] = {"key": key, "future": future, "created_at": time.monotonic()}
+        return ticket
+
+    def claim(self, ticket: Optional[str], key: str, timeout: Optional[float] = None) -> Optional[Any]:
+        """
+        Take the result of a ticket, waiting for it if it is still running.
+
+        Returns:
+            The result, or None if the ticket is unknown, expired, belongs to a
+            different key or its work failed
+        """
+        if not ticket:
+            return None
+        result = self._claim(ticket, key, timeout)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def _claim(self, ticket: str, key: str, timeout: Optional[float]) -> Optional[Any]:
+        with self._lock:
+            entry = self._tickets.pop(ticket, None)
+        if entry is None or entry["key"] != key:
+            if entry is not None:
+                entry["future"].cancel()
+            return None
+        if time.monotonic() - entry["created_at"] > self.ttl_seconds:
+            entry["future"].cancel()
+            return None
+        try:
+            return entry["future"].result(timeout=timeout)
+        except Exception as e:
+            logger.warning({
+                "agent": "SpeculativeExecutor",
+                "action": "speculative_result_unusable",
+                "error": str(e)
+            })
+            return None
+
+    def discard(self, ticket: str) -> bool:
+        """Drop a ticket whose result will never be claimed."""
+        with self._lock:
+            entry = self._tickets.pop(ticket, None)
+        if entry is None:
+            return False
+        entry["future"].cancel()
+        return True
+
+    def _expire(self) -> None:
+        """Drop expired tickets, then the oldest ones beyond max_tickets. Caller holds the lock."""
+        cutoff = time.monotonic() - self.ttl_seconds
+        for ticket in [t for t, entry in self._tickets.items() if entry["created_at"] < cutoff]:
+            self._tickets.pop(ticket)["future"].cancel()
+        while len(self._tickets) >= self.max_tickets:
+            oldest = min(self._tickets, key=lambda t: self._tickets[t]["created_at"])
+            self._tickets.pop(oldest)["future"].cancel()
@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+# numpy, pandas and pyarrow are imported when the first upload is staged or
+# loaded, not when the app starts
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+
+@lru_cache(maxsize=None)
+def staging_format() -> str:
+    try:
+        import pyarrow  # noqa: F401
+        return "parquet"
+    except ImportError:
+        # Without pyarrow every column is kept as a NumPy array that loads memory-mapped
+        return "npy"
+
+
+def normalize_frame(df: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    Give a report frame the column types staging can store exactly.
+
+    Numeric and boolean columns keep their dtype; every other column becomes
+    text with None for missing values, which is also what SQLite's TEXT
+    affinity makes of mixed Excel cells.
+    """
+    import pandas as pd
+
+    df = df.copy()
+    df.columns = [str(column) for column in df.columns]
+    for column in df.columns:
+        if df[column].dtype.kind not in "biuf":
+            df[column] = [None if pd.isna(value) else str(value) for value in df[column]]
+    return df
+
+
+class StagingStore:
+    """
+    Columnar copies of uploaded workbooks.
+
+    Every upload is parsed from Excel once and stored next to a manifest
+    with its headers, dtypes, row count and the size and mtime of the
+    workbook it came from. Later reads of the same workbook, and rebuilds
+    after the workbook is gone, load the staged columns instead.
+
+    Layout: <staging_dir>/<folder of the workbook>/<workbook name>/manifest.json
+    plus data.parquet, or per column <n>.npy for numbers and, for text,
+    <n>.txt holding the values as one UTF-8 string with their end offsets
+    in <n>.offsets.npy and missing values in <n>.null.npy. (A fixed-width
+    NumPy string array would pad every value to the longest one.)
+    """
+
+    def __init__(self, staging_dir: str):
+        self.staging_dir = staging_dir
+
+    def path_for(self, source_path: str) -> str:
+        folder = os.path.basename(os.path.dirname(os.path.abspath(source_path)))
+        name = os.path.splitext(os.path.basename(source_path))[0]
+        return os.path.join(self.staging_dir, folder, name)
+
+    def manifest(self, source_path: str) -> Optional[Dict[str, Any]]:
+        """The manifest of a workbook, if it was staged from the workbook as it is now."""
+        try:
+            with open(os.path.join(self.path_for(source_path), MANIFEST)) as f:
+                manifest = json.load(f)
+            stat = os.stat(source_path)
+        except (OSError, ValueError):
+            return None
+        if (manifest["source_size"], manifest["source_mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        return manifest
+
+    def manifests(self) -> List[Dict[str, Any]]:
+        """Every staged upload in upload order, whether or not its workbook still exists."""
+        manifests = []
+        for root, _, files in os.walk(self.staging_dir):
+            if MANIFEST in files:
+                with open(os.path.join(root, MANIFEST)) as f:
+                    manifest = json.load(f)
+                manifest["path"] = root
+                manifests.append(manifest)
+        return sorted(manifests, key=lambda m: (m["source_mtime_ns"], m["source"]))
+
+    def headers(self, source_path: str) -> Optional[Dict[str, List[str]]]:
+        """Headers per sheet from the manifest, without opening the workbook."""
+        manifest = self.manifest(source_path)
+        return manifest["sheets"] if manifest else None
+
+    def load(self, source_path: str) -> Optional["pd.DataFrame"]:
+        """The staged rows of a workbook, or None if it has no up-to-date staging copy."""
+        manifest = self.manifest(source_path)
+        if manifest is None:
+            return None
+        manifest["path"] = self.path_for(source_path)
+        return self.load_manifest(manifest)
+
+    def load_manifest(self, manifest: Dict[str, Any]) -> "pd.DataFrame":
+        import numpy as np
+        import pandas as pd
+
+        path = manifest["path"]
+        if manifest["format"] == "parquet":
+            return pd.read_parquet(os.path.join(path, "data.parquet"))
+
+        data = {}
+        for i, column in enumerate(manifest["columns"]):
+            if column.get("offsets"):
+                values = _load_text(os.path.join(path, str(i)))
+            else:
+                values = np.load(os.path.join(path, f"{i}.npy"), mmap_mode="r")
+            if column["text"]:
+                nulls = np.load(os.path.join(path, f"{i}.null.npy"), mmap_mode="r")
+                values = np.where(nulls, None, values.astype(object))
+            data[column["name"]] = values
+        return pd.DataFrame(data, columns=[column["name"] for column in manifest["columns"]])
+
+    def stage(self, source_path: str, df: "pd.DataFrame", file_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Store the rows of a workbook read with read_report() and write its manifest.
+
+        Args:
+            source_path: Workbook the rows were read from
+            df: Frame as returned by normalize_frame()
+            file_type: Report type; defaults to the folder of the workbook
+
+        Returns:
+            The manifest
+        """
+        import numpy as np
+
+        path = self.path_for(source_path)
+        os.makedirs(path, exist_ok=True)
+        if staging_format() == "parquet":
+            df.to_parquet(os.path.join(path, "data.parquet"), index=False)
+        else:
+            for i, column in enumerate(df.columns):
+                values = df[column]
+                if values.dtype.kind in "biuf":
+                    np.save(os.path.join(path, f"{i}.npy"), values.to_numpy())
+                else:
+                    np.save(os.path.join(path, f"{i}.null.npy"), values.isna().to_numpy())
+                    _save_text(os.path.join(path, str(i)), values.fillna("").tolist())
+
+        stat = os.stat(source_path)
+        manifest = {
+            "source": os.path.basename(source_path),
+            "file_type": file_type or os.path.basename(os.path.dirname(os.path.abspath(source_path))),
+            "format": staging_format(),
+            "staged_on": datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'),
+            "source_size": stat.st_size,
+            "source_mtime_ns": stat.st_mtime_ns,
+            "rows": len(df),
+            "columns": [
+                {"name": column, "dtype": str(df[column].dtype), "text": df[column].dtype.kind not in "biuf",
+                 "offsets": staging_format() == "npy" and df[column].dtype.kind not in "biuf"}
+                for column in df.columns
+            ],
+            "sheets": read_sheet_headers(source_path)
+        }
+        # The manifest goes last, so a staging copy without one is never used
+        with open(os.path.join(path, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+
+def _save_text(prefix: str, values: List[str]) -> None:
+    import numpy as np
+
+    # Offsets count characters, so loading decodes the column once and slices it
+    np.save(f"{prefix}.offsets.npy", np.cumsum([len(value) for value in values], dtype=np.int64))
+    with open(f"{prefix}.txt", "wb") as f:
+        f.write("".join(values).encode("utf-8", "surrogatepass"))
+
+
+def _load_text(prefix: str) -> "np.ndarray":
+    import numpy as np
+
+    with open(f"{prefix}.txt", "rb") as f:
+        text = f.read().decode("utf-8", "surrogatepass")
+    ends = np.load(f"{prefix}.offsets.npy").tolist()
+    values = np.empty(len(ends), dtype=object)
+    values[:] = [text[start:end] for start, end in zip([0] + ends[:-1], ends)]
+    return values
+
+
+def read_sheet_headers(file_path: str) -> Dict[str, List[str]]:
+    """Headers of every sheet of a workbook, reading only the header rows."""
+    import pandas as pd
+
+    with pd.ExcelFile(file_path) as excel_file:
+        return {
+            sheet_name: [str(column) for column in pd.read_excel(excel_file, sheet_name=sheet_name, nrows=0).columns]
+            for sheet_name in excel_file.sheet_names
+        }
@@ -0,0 +1,104 @@
+import logging
+from typing import Dict, Any, List
+
+from .db_meta import get_meta, set_meta
+from .dictionary_encoding import storage_table
+
+logger = logging.getLogger(__name__)
+
+# Free-text columns per report table
+TEXT_COLUMNS = {
+    "IW38": ["description"],
+    "IW47": ["confirmation_text"],
+    "IW68": ["item_text", "cause_text"]
+}
+
+FTS_SHADOW_SUFFIXES = ["_data", "_idx", "_docsize", "_config", "_content"]
+
+
+def fts_table(table: str) -> str:
+    return f"{table}_fts"
+
+
+# Full-text tables and the shadow tables FTS5 creates for them
+TEXT_INDEX_TABLES = {fts_table(table) for table in TEXT_COLUMNS} | {
+    fts_table(table) + suffix for table in TEXT_COLUMNS for suffix in FTS_SHADOW_SUFFIXES
+}
+
+
+class TextIndexMaintainer:
+    """
+    Keeps FTS5 indexes over the free-text columns of the report tables.
+
+    The indexes are external-content tables over the storage tables, so the
+    text is stored once and the FTS rowid equals the report row id. New rows
+    are indexed from a per-table id watermark; rows deleted other than through
+    delete_loads() require rebuild().
+    """
+
+    def create(self, conn) -> None:
+        for table, columns in TEXT_COLUMNS.items():
+            conn.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table(table)} USING fts5(
+                    {', '.join(columns)},
+                    content='{storage_table(table)}',
+                    content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='3'
+                )
+            """)
+
+    def update(self, conn) -> Dict[str, Any]:
+        """Index the text of rows added since the last update."""
+        indexed = {}
+        for table, columns in TEXT_COLUMNS.items():
+            watermark_key = f"fts_watermark:{table}"
+            low = int(get_meta(conn, watermark_key, 0))
+            high = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {storage_table(table)}").fetchone()[0]
+            if high <= low:
+                continue
+            conn.execute(f"""
+                INSERT INTO {fts_table(table)} (rowid, {', '.join(columns)})
+                SELECT id, {', '.join(columns)} FROM {storage_table(table)}
+                WHERE id > ? AND id <= ?
+            """, (low, high))
+            set_meta(conn, watermark_key, high)
+            indexed[table] = high - low
+        if indexed:
+            logger.info({
+                "agent": "TextIndexMaintainer",
+                "action": "text_index_updated",
+                "rows_indexed": indexed
+            })
+        return indexed
+
+    def rebuild(self, conn) -> None:
+        """Re-index every row, e.g. after report rows were deleted."""
+        for table in TEXT_COLUMNS:
+            conn.execute(f"INSERT INTO {fts_table(table)} ({fts_table(table)}) VALUES ('rebuild')")
+            high = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {storage_table(table)}").fetchone()[0]
+            set_meta(conn, f"fts_watermark:{table}", high)
+
+    def delete_loads(self, conn, load_ids: List[int]) -> None:
+        """Remove the text of snapshots about to be purged; must run while their rows still exist."""
+        placeholders = ", ".join("?" * len(load_ids))
+        for table, columns in TEXT_COLUMNS.items():
+            conn.execute(f"""
+                INSERT INTO {fts_table(table)} ({fts_table(table)}, rowid, {', '.join(columns)})
+                SELECT 'delete', id, {', '.join(columns)} FROM {storage_table(table)}
+                WHERE load_id IN ({placeholders})
+            """, load_ids)
+
+    def prompt_notes(self) -> List[str]:
+        indexes = "; ".join(
+            f"{fts_table(table)}({', '.join(columns)}) with rowid = {table}.id"
+            for table, columns in TEXT_COLUMNS.items()
+        )
+        return [
+            f"Full-text indexes: {indexes}.",
+            "For word or phrase searches in these text columns use MATCH on the index instead of LIKE, e.g. "
+            "SELECT IW38.* FROM IW38_fts JOIN IW38 ON IW38.id = IW38_fts.rowid WHERE IW38_fts MATCH "
+            "'\"pump seal\"' ORDER BY IW38_fts.rank. Restrict to one column with 'cause_text: corrosion', "
+            "match word beginnings with a trailing * (corro*), combine terms with AND/OR/NOT. Use LIKE "
+            "only for fragments inside words."
+        ]
@@ -0,0 +1,199 @@
+import codecs
+import csv
+import re
+from collections import Counter
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Extensions SAP's local file export writes (System > List > Save > Local File)
+TEXT_EXTENSIONS = ('.csv', '.tsv', '.txt')
+SEPARATORS = ('\t', ';', ',', '|')
+# Title lines, selection criteria and blank lines SAP may put above the header
+HEADER_SEARCH_LINES = 50
+SAMPLE_BYTES = 256 * 1024
+SAMPLE_ROWS = 500
+
+# SAP user date formats (SU3); DD/MM/YYYY is not one of them, so none is ambiguous
+DATE_FORMATS = [
+    (re.compile(r"^(\d{2})\.(\d{2})\.(\d{4})$"), (3, 2, 1)),
+    (re.compile(r"^(\d{2})/(\d{2})/(\d{4})$"), (3, 1, 2)),
+    (re.compile(r"^(\d{2})-(\d{2})-(\d{4})$"), (3, 1, 2)),
+    (re.compile(r"^(\d{4})[./-](\d{2})[./-](\d{2})$"), (1, 2, 3))
+]
+NUMBER_LIKE = re.compile(r"^-?[\d.,]*\d[\d.,]*-?$")
+
+
+def is_text_report(file_path: str) -> bool:
+    return file_path.lower().endswith(TEXT_EXTENSIONS)
+
+
+def detect_encoding(sample: bytes) -> str:
+    """UTF-8 or UTF-16 when the export says so or decodes as such, else the Windows code page."""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        # Not final: the sample may end inside a multi-byte character
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp1252'
+
+
+def split_line(line: str, separator: str) -> List[str]:
+    if separator == '|':
+        # The framed list layout: |Order     |Notification|...|
+        return [cell.strip() for cell in line.strip().strip('|').split('|')]
+    return [cell.strip() for cell in next(csv.reader([line], delimiter=separator), [])]
+
+
+class TextReport:
+    """
+    Layout of a SAP list export saved as text, and a streaming reader for its rows.
+
+    detect() finds the encoding, the header line below any title lines,
+    the separator, the decimal separator and the date format from the
+    start of the file. rows() then yields one list per data row, aligned
+    with the headers, with numbers as plain decimals (1.234,56- becomes
+    -1234.56) and dates as 'YYYY-MM-DD 00:00:00', which is what the
+    workbook path stores for the same report.
+    """
+
+    def __init__(self, file_path: str, encoding: str, separator: str, header_line: int, headers: List[str],
+                 decimal: str = '.', date_format: Optional[Tuple[re.Pattern, Tuple[int, int, int]]] = None):
+        self.file_path = file_path
+        self.encoding = encoding
+        self.separator = separator
+        self.header_line = header_line
+        self.headers = headers
+        self.decimal = decimal
+        self.group = ',' if decimal == '.' else '.'
+        self.date_format = date_format
+        grouped = re.escape(self.group)
+        self.number_pattern = re.compile(
+            rf"^-?(?:\d{{1,3}}(?:{grouped}\d{{3}})+|\d+)(?:{re.escape(decimal)}\d+)?-?$"
+        )
+
+    @classmethod
+    def detect(cls, file_path: str, known_headers: Iterable[str], encoding: Optional[str] = None) -> "TextReport":
+        """
+        Work out the layout of an export from its first lines.
+
+        Args:
+            file_path: The export
+            known_headers: Column headers of the reports; the header line is
+                the one among the first lines with the most of them
+            encoding: Skips encoding detection when given
+
+        Raises:
+            ValueError: if no header line with at least two known headers is found
+        """
+        with open(file_path, 'rb') as f:
+            sample = f.read(SAMPLE_BYTES)
+        encoding = encoding or detect_encoding(sample)
+        known = set(known_headers)
+
+        best = None
+        with open(file_path, encoding=encoding, errors='replace', newline='') as f:
+            for number, line in enumerate(f):
+                if number >= HEADER_SEARCH_LINES:
+                    break
+                for separator in SEPARATORS:
+                    if separator not in line:
+                        continue
+                    cells = split_line(line, separator)
+                    matches = sum(1 for cell in cells if cell in known)
+                    if matches >= 2 and (best is None or matches > best[0]):
+                        best = (matches, number, separator, cells)
+        if best is None:
+            raise ValueError(f"No header row with report columns in the first {HEADER_SEARCH_LINES} lines")
+        _, header_line, separator, headers = best
+
+        report = cls(file_path, encoding, separator, header_line, headers)
+        decimal, date_format = report._detect_formats()
+        return cls(file_path, encoding, separator, header_line, headers, decimal, date_format)
+
+    def _detect_formats(self):
+        """Decimal separator and date format by majority over the first data rows."""
+        decimals, dates = Counter(), Counter()
+        for number, row in enumerate(self._raw_rows()):
+            if number >= SAMPLE_ROWS:
+                break
+            for value in row:
+                if not value or not value[0].isdigit() and value[0] != '-':
+                    continue
+                for index, (pattern, _) in enumerate(DATE_FORMATS):
+                    if pattern.match(value):
+                        dates[index] += 1
+                        break
+                else:
+                    if not NUMBER_LIKE.match(value):
+                        continue
+                    # The last separator is the decimal one if both occur, or if it
+                    # is not followed by exactly three digits (1.234 could be either)
+                    position = max(value.rfind('.'), value.rfind(','))
+                    if position < 0:
+                        continue
+                    digits = len(value[position + 1:].rstrip('-'))
+                    if ('.' in value and ',' in value) or digits != 3:
+                        decimals[value[position]] += 1
+        if decimals:
+            decimal = decimals.most_common(1)[0][0]
+        else:
+            decimal = ',' if self.separator == ';' else '.'
+        date_format = DATE_FORMATS[dates.most_common(1)[0][0]] if dates else None
+        return decimal, date_format
+
+    def _raw_rows(self) -> Iterator[List[str]]:
+        """Data rows as stripped text, skipping blank lines, frame lines and repeated headers."""
+        with open(self.file_path, encoding=self.encoding, errors='replace', newline='') as f:
+            for _ in range(self.header_line + 1):
+                f.readline()
+            if self.separator == '|':
+                # Dashed frame lines only contain - and |
+                lines = (line for line in f if line.strip().strip('-|'))
+                rows = (split_line(line, '|') for line in lines)
+            else:
+                rows = ([cell.strip() for cell in row] for row in csv.reader(f, delimiter=self.separator))
+            for row in rows:
+                if not any(row) or row == self.headers:
+                    continue
+                yield row
+
+    def rows(self) -> Iterator[List[Optional[str]]]:
+        """Data rows with one value per header; empty cells are None."""
+        width = len(self.headers)
+        match_number = self.number_pattern.match
+        date_pattern, (year, month, day) = self.date_format or (None, (1, 2, 3))
+        group, decimal = self.group, self.decimal
+        for row in self._raw_rows():
+            values: List[Optional[str]] = []
+            for value in row[:width]:
+                if not value:
+                    values.append(None)
+                    continue
+                first = value[0]
+                if first.isdigit() or first == '-':
+                    if date_pattern is not None and len(value) == 10:
+                        found = date_pattern.match(value)
+                        if found:
+                            values.append(f"{found.group(year)}-{found.group(month)}-{found.group(day)} 00:00:00")
+                            continue
+                    if match_number(value):
+                        negative = value[0] == '-' or value[-1] == '-'
+                        value = value.strip('-').replace(group, '').replace(decimal, '.')
+                        if negative:
+                            value = '-' + value
+                values.append(value)
+            if len(values) < width:
+                values.extend([None] * (width - len(values)))
+            yield values
+
+    def describe(self) -> dict:
+        return {
+            "encoding": self.encoding,
+            "separator": self.separator,
+            "header_line": self.header_line,
+            "decimal": self.decimal,
+            "date_format": self.date_format[0].pattern if self.date_format else None
+        }
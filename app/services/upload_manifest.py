@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from .snapshots import REPORT_TYPES
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_TABLE = "upload_files"
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadManifest:
+    """
+    One row per file received in the datalake, maintained by ingestion.
+
+    A row is written with status 'ingesting' before the ingest starts and
+    updated to 'ingested' or 'failed' with the row count, duration and load
+    ids afterwards, outside the ingest transaction, so failed uploads are
+    recorded too. The page and the freshness poll read file listings from
+    here instead of scanning the report folders.
+
+    Files that were in the report folders before the manifest existed are
+    registered once with status 'ingested' when a load of that name exists,
+    'unknown' otherwise.
+    """
+
+    def create(self, conn, datalake_dir: Optional[str] = None) -> None:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (MANIFEST_TABLE,)
+        ).fetchone()
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_type TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                size_bytes INTEGER,
+                sha256 TEXT,
+                status TEXT NOT NULL,
+                row_count INTEGER,
+                ingest_ms REAL,
+                load_ids TEXT,
+                error TEXT,
+                uploaded_on TEXT NOT NULL,
+                finished_on TEXT
+            )
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_upload_files_type ON {MANIFEST_TABLE}(file_type, id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_upload_files_uploaded ON {MANIFEST_TABLE}(uploaded_on)")
+        if not exists and datalake_dir:
+            self._register_existing(conn, datalake_dir)
+
+    def _register_existing(self, conn, datalake_dir: str) -> None:
+        found = []
+        for file_type in REPORT_TYPES:
+            folder_path = os.path.join(datalake_dir, file_type)
+            if not os.path.isdir(folder_path):
+                continue
+            for entry in os.scandir(folder_path):
+                if entry.is_file():
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, file_type, entry.name, stat.st_size))
+
+        # Oldest first, so ids follow upload order as they do for new uploads
+        for mtime, file_type, file_name, size in sorted(found):
+            load = conn.execute(
+                "SELECT id, row_count FROM uploads WHERE file_name = ? ORDER BY id LIMIT 1", (file_name,)
+            ).fetchone()
+            conn.execute(f"""
+                INSERT INTO {MANIFEST_TABLE} (file_type, file_name, size_bytes, status, row_count, load_ids, uploaded_on)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                file_type, file_name, size, "ingested" if load else "unknown", load[1] if load else None,
+                json.dumps([load[0]]) if load else None,
+                datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
+            ))
+        if found:
+            logger.info({
+                "agent": "UploadManifest",
+                "action": "existing_files_registered",
+                "files": len(found)
+            })
+
+    def begin(self, conn, file_path: str, file_type: str) -> int:
+        """Register a received file as being ingested and return its manifest id."""
+        return conn.execute(f"""
+            INSERT INTO {MANIFEST_TABLE} (file_type, file_name, size_bytes, sha256, status, uploaded_on)
+            VALUES (?, ?, ?, ?, 'ingesting', ?)
+        """, (
+            file_type, os.path.basename(file_path), os.path.getsize(file_path), file_sha256(file_path),
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        )).lastrowid
+
+    def finish(self, conn, entry_id: int, result: Dict[str, Any], seconds: float) -> None:
+        """Record the outcome of an ingest as returned by process_excel_file."""
+        if "loads" in result:
+            load_ids = sorted(result["loads"].values())
+        else:
+            load_ids = [result["load_id"]] if result.get("load_id") else []
+        conn.execute(f"""
+            UPDATE {MANIFEST_TABLE}
+            SET status = ?, row_count = ?, ingest_ms = ?, load_ids = ?, error = ?, finished_on = ?
+            WHERE id = ?
+        """, (
+            "ingested" if result.get("success") else "failed", result.get("rows"), round(seconds * 1000, 1),
+            json.dumps(load_ids) if load_ids else None, result.get("error"),
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'), entry_id
+        ))
+
+    def list_files(self, conn, file_type: str, limit: int, before: Optional[int] = None) -> Dict[str, Any]:
+        """
+        A page of the files of one report type, newest first, and the total count.
+
+        Pages are keyed on the id of the last file shown (before), so files
+        uploaded between two pages do not shift the next one.
+        """
+        total = conn.execute(
+            f"SELECT COUNT(*) FROM {MANIFEST_TABLE} WHERE file_type = ?", (file_type,)
+        ).fetchone()[0]
+        rows = conn.execute(f"""
+            SELECT id, file_name, size_bytes, status, row_count, ingest_ms, uploaded_on
+            FROM {MANIFEST_TABLE} WHERE file_type = ? AND id < ?
+            ORDER BY id DESC LIMIT ?
+        """, (file_type, before if before is not None else 2 ** 63 - 1, limit + 1)).fetchall()
+        return {"total": total, "files": [self._file(row) for row in rows[:limit]], "has_more": len(rows) > limit}
+
+    def oldest_file(self, conn) -> Optional[Dict[str, Any]]:
+        row = conn.execute(f"""
+            SELECT id, file_name, size_bytes, status, row_count, ingest_ms, uploaded_on, file_type
+            FROM {MANIFEST_TABLE} ORDER BY uploaded_on, id LIMIT 1
+        """).fetchone()
+        if row is None:
+            return None
+        return dict(self._file(row), file_type=row[7])
+
+    def version(self, conn) -> str:
+        """Changes whenever a file is registered or finishes ingesting."""
+        row = conn.execute(f"SELECT MAX(id), COUNT(finished_on), MAX(finished_on) FROM {MANIFEST_TABLE}").fetchone()
+        return ":".join(str(value) for value in row)
+
+    @staticmethod
+    def _file(row) -> Dict[str, Any]:
+        keys = ("id", "name", "size_bytes", "status", "row_count", "ingest_ms", "uploaded_on")
+        return dict(zip(keys, row))
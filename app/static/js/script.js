@@ -306,7 +306,8 @@ document.addEventListener('DOMContentLoaded', function() {
                         },
                         body: JSON.stringify({ 
                             query: translateData.query,
-                            visualization_type: translateData.visualization_type
+                            visualization_type: translateData.visualization_type,
+                            ticket: translateData.ticket
                         })
                     });
 
@@ -395,6 +396,10 @@ document.addEventListener('DOMContentLoaded', function() {
                         console.error('Error processing query data:', error);
                         addMessage('Error processing query results', false);
                     }
+                } else if (translateData.ticket) {
+                    // Let the server drop the result it started computing
+                    fetch(`/speculative/${translateData.ticket}`, { method: 'DELETE' })
+                        .catch(error => console.error('Error discarding speculative result:', error));
                 }
             }
         } catch (error) {
@@ -457,6 +462,122 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // Large exports are sent in chunks that are checksummed, retried and
+    // resumed after a lost connection; the server ingests once all are in
+    const UPLOAD_PARALLEL_CHUNKS = 4;
+    const UPLOAD_CHUNK_ATTEMPTS = 5;
+    // About 25 minutes of waiting for the ingest, polling less often as it goes on
+    const UPLOAD_POLL_ATTEMPTS = 150;
+
+    async function uploadJson(url, options) {
+        const response = await fetch(url, options);
+        const data = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            const error = new Error(data.error || `HTTP ${response.status}`);
+            error.status = response.status;
+            error.code = data.code;
+            throw error;
+        }
+        return data;
+    }
+
+    async function chunkDigest(blob) {
+        // crypto.subtle is only available on https and localhost; the checksum is optional
+        if (!window.crypto || !window.crypto.subtle) {
+            return null;
+        }
+        const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+        return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function uploadChunk(uploadId, file, index, chunkSize) {
+        const start = index * chunkSize;
+        const blob = file.slice(start, Math.min(start + chunkSize, file.size));
+        const headers = {
+            'Content-Type': 'application/octet-stream',
+            'Content-Range': `bytes ${start}-${start + blob.size - 1}/${file.size}`
+        };
+        const digest = await chunkDigest(blob);
+        if (digest) {
+            headers['X-Chunk-SHA256'] = digest;
+        }
+        for (let attempt = 1; ; attempt++) {
+            try {
+                return await uploadJson(`/upload_sessions/${uploadId}/chunks/${index}`, {
+                    method: 'PUT', headers, body: blob
+                });
+            } catch (error) {
+                // Lost connections, server errors and chunks damaged on the way are
+                // worth another try; any other answer will not change on retry
+                const retryable = !error.status || error.status >= 500 || error.code === 'chunk_checksum_mismatch';
+                if (!retryable || attempt >= UPLOAD_CHUNK_ATTEMPTS) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+            }
+        }
+    }
+
+    async function resumableUpload(type, file, onProgress) {
+        const resumeKey = `upload:${type}:${file.name}:${file.size}:${file.lastModified}`;
+        let session = null;
+        const uploadId = localStorage.getItem(resumeKey);
+        if (uploadId) {
+            session = await uploadJson(`/upload_sessions/${uploadId}`).catch(() => null);
+        }
+        if (!session || session.status === 'failed') {
+            session = await uploadJson('/upload_sessions', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({report: type, filename: file.name, size: file.size})
+            });
+            localStorage.setItem(resumeKey, session.upload_id);
+        }
+
+        const received = new Set(session.received);
+        const pending = [];
+        for (let index = 0; index < session.total_chunks; index++) {
+            if (!received.has(index)) {
+                pending.push(index);
+            }
+        }
+        const progress = () => onProgress(Math.min(received.size * session.chunk_size, file.size));
+        progress();
+
+        // The first chunk goes alone: the server rejects a wrong file after it
+        if (pending[0] === 0) {
+            await uploadChunk(session.upload_id, file, pending.shift(), session.chunk_size);
+            received.add(0);
+            progress();
+        }
+        const workers = Array.from({length: UPLOAD_PARALLEL_CHUNKS}, async () => {
+            while (pending.length) {
+                const index = pending.shift();
+                await uploadChunk(session.upload_id, file, index, session.chunk_size);
+                received.add(index);
+                progress();
+            }
+        });
+        await Promise.all(workers);
+
+        const completeUrl = `/upload_sessions/${session.upload_id}/complete`;
+        session = await uploadJson(completeUrl, {method: 'POST'});
+        for (let attempt = 1; session.status !== 'ingested' && session.status !== 'failed'; attempt++) {
+            if (attempt > UPLOAD_POLL_ATTEMPTS) {
+                // The session stays resumable: dropping the file again picks up its status
+                throw new Error('The file is still being processed, check again later');
+            }
+            await new Promise(resolve => setTimeout(resolve, Math.min(1000 * attempt, 10000)));
+            // Asking to complete again restarts an ingest whose server worker died
+            session = await uploadJson(completeUrl, {method: 'POST'});
+        }
+        localStorage.removeItem(resumeKey);
+        if (session.status === 'failed') {
+            throw new Error(`Database error: ${session.result.error || 'Unknown error'}`);
+        }
+        return session;
+    }
+
     // Initialize dropzones
     const dropzoneTypes = ['IW38', 'IW68', 'IW47'];
     
@@ -465,10 +586,25 @@ document.addEventListener('DOMContentLoaded', function() {
             paramName: 'file',
             createImageThumbnails: false,
             url: `/upload/${type}`,
-            acceptedFiles: '.xlsx,.xls',
-            dictDefaultMessage: `Drop ${type} Excel files here`,
+            acceptedFiles: '.xlsx,.xls,.xlsm,.csv,.tsv,.txt',
+            dictDefaultMessage: `Drop ${type} Excel or CSV/TSV exports here`,
             addRemoveLinks: true,
-            maxFilesize: 50, // MB
+            maxFilesize: 2048, // MB
+            // Files are sent by resumableUpload instead of Dropzone's single request
+            autoProcessQueue: false,
+            accept: function(file, done) {
+                done();
+                file.status = Dropzone.UPLOADING;
+                resumableUpload(type, file, bytesSent => {
+                    this.emit('uploadprogress', file, 100 * bytesSent / file.size, bytesSent);
+                }).then(session => {
+                    file.status = Dropzone.SUCCESS;
+                    this.emit('success', file, session);
+                }).catch(error => {
+                    file.status = Dropzone.ERROR;
+                    this.emit('error', file, error.message);
+                }).finally(() => this.emit('complete', file));
+            },
             init: function() {
                 this.on('success', function(file, response) {
                     // Add the new file to the list
@@ -499,6 +635,44 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // Older uploads are fetched a page at a time from the upload manifest, each
+    // page starting after the last file shown so new uploads do not shift it
+    document.querySelectorAll('.file-list-more').forEach(button => {
+        button.addEventListener('click', async () => {
+            const report = button.dataset.report;
+            button.disabled = true;
+            try {
+                const response = await fetch(
+                    `/uploads/${report}?before=${button.dataset.before}&per_page=${button.dataset.perPage}`);
+                const data = await response.json();
+                if (data.error) {
+                    throw new Error(data.error);
+                }
+                const fileList = document.getElementById(`file-list-${report}`);
+                data.files.forEach(file => {
+                    const fileItem = document.createElement('div');
+                    fileItem.className = 'file-item';
+                    fileItem.innerHTML = `
+                        <div class="file-info">
+                            <span class="file-name"></span>
+                            <span class="file-date">${file.lastUpdated}</span>
+                        </div>
+                    `;
+                    fileItem.querySelector('.file-name').textContent = file.name;
+                    fileList.appendChild(fileItem);
+                });
+                if (data.next_before === null) {
+                    button.remove();
+                    return;
+                }
+                button.dataset.before = data.next_before;
+            } catch (error) {
+                console.error(`Error loading ${report} uploads:`, error);
+            }
+            button.disabled = false;
+        });
+    });
+
     // Initialize database table accordions
     const tableHeaders = document.querySelectorAll('.table-header');
     tableHeaders.forEach(header => {
@@ -1,15 +1,22 @@
-import pandas as pd
 import sqlite3
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from app.services.staging import StagingStore, read_sheet_headers
+
+staging = StagingStore(os.path.join("datalake", "staging"))
 
 def analyze_file(file_path):
     """Analyze a single Excel file and print its headers."""
     try:
-        df = pd.read_excel(file_path)
+        # Headers of the first sheet, from the staging manifest when the file was staged
+        sheets = staging.headers(file_path) or read_sheet_headers(file_path)
+        columns = next(iter(sheets.values()), [])
         print(f"\nHeaders for {os.path.basename(file_path)}:")
-        for col in df.columns:
+        for col in columns:
             print(f"- {col}")
-        return list(df.columns)
+        return columns
     except Exception as e:
         print(f"Error reading {file_path}: {str(e)}")
         return []
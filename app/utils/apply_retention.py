@@ -0,0 +1,53 @@
+"""
+Purge superseded snapshots from the datalake database and reclaim the space.
+
+Keeps the newest --keep uploads of every report, deletes the rows of older
+ones (including their rollup, link and full-text entries) and runs an
+incremental VACUUM.
+
+Databases created before incremental auto-vacuum was the default keep the
+freed pages for reuse instead of shrinking; --convert switches them over
+once with a full VACUUM (stop the app first, it locks the whole file).
+
+    python -m app.utils.apply_retention --keep 2
+    python -m app.utils.apply_retention --convert
+"""
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Purge superseded snapshots")
+    parser.add_argument("--db", default=os.path.join("datalake", "datalake.db"), help="Database path")
+    parser.add_argument("--keep", type=int, default=1, help="Snapshots to keep per report")
+    parser.add_argument("--convert", action="store_true",
+                        help="Switch the database to incremental auto-vacuum first (full VACUUM)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    from app.services.database_service import DatabaseService
+
+    db_service = DatabaseService(args.db)
+    if args.convert:
+        result = db_service.enable_incremental_vacuum()
+        if not result["success"]:
+            raise SystemExit(f"Conversion failed: {result['error']}")
+        print("Converted to incremental auto-vacuum" if result["converted"] else "Already incremental")
+    elif not db_service.incremental_vacuum_enabled():
+        print("Note: incremental auto-vacuum is off, freed pages are kept for reuse (see --convert)")
+
+    before = os.path.getsize(args.db)
+    result = db_service.apply_retention(args.keep)
+    if not result["success"]:
+        raise SystemExit(f"Retention failed: {result['error']}")
+
+    print(f"Purged loads: {result['purged_loads'] or 'none'}")
+    for table, count in result["deleted_rows"].items():
+        print(f"  {table}: {count} rows deleted")
+    print(f"Database size: {before / 1e6:.1f} MB -> {os.path.getsize(args.db) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+How many questions can one process have in flight at once?
+
+Answers questions end to end (classify, generate SQL, execute, chart columns
+and summaries) against a seeded scratch database while every LLM call is
+answered by a LocalBackend after a fixed latency, on a thread of its own as
+the Anthropic client would. At each level N, N clients keep one question open
+each, and the report shows throughput, latency and the threads the process
+needed. A level counts as sustained while its p95 latency
+stays within --tolerance of the single-question latency.
+
+Modes:
+  threads  the pipeline called directly, one thread per open question
+  views    the Flask views through the test client, one thread per open
+           request as under the gthread server in gunicorn.conf.py
+
+    python -m app.utils.benchmark_concurrency --levels 1,32,256,1024 --latency 0.5
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MODES = ("threads", "views")
+
+
+class TaggedResponder:
+    """
+    SyntheticResponder whose SQL carries the question number as a comment.
+
+    The gateway lets identical concurrent requests share one API call; every
+    benchmark question must cost its own calls, so the prompts and the
+    generated queries (which the summary requests repeat) are kept distinct.
+    """
+
+    def __init__(self, responder):
+        self.responder = responder
+
+    def __call__(self, request: Dict[str, Any]) -> str:
+        from app.services.llm_replay import request_stage
+        text = self.responder(request)
+        if request_stage(request) == "generate_sql":
+            match = re.search(r"\(question (\d+)\)", request["messages"][0]["content"])
+            if match:
+                text = f"{text} /* question {match.group(1)} */"
+        return text
+
+
+class ThreadSampler:
+    """Records the highest number of live threads while running."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def answer_blocking(coordinator, db_service, prompt: str) -> bool:
+    generated = coordinator.generate_sql_query(prompt)
+    if "query" not in generated:
+        return False
+    query_result = db_service.execute_query(generated["query"], read_only=True)
+    if not query_result["success"]:
+        return False
+    processed = coordinator.process_query_results(
+        generated["query"], query_result, generated.get("visualization_type"))
+    return "error" not in processed
+
+
+def answer_views(app, prompt: str) -> bool:
+    client = app.test_client()
+    response = client.post("/translate_to_sql", json={"message": prompt})
+    data = response.get_json() or {}
+    if response.status_code != 200 or "query" not in data:
+        return False
+    response = client.post("/execute_query", json={
+        "query": data["query"],
+        "visualization_type": data.get("visualization_type"),
+        "ticket": data.get("ticket")
+    })
+    return response.status_code == 200
+
+
+def run_level(mode: str, level: int, rounds: int, prompts: List[str], app, coordinator, db_service,
+              offset: int) -> Dict[str, Any]:
+    """Keep `level` questions open for `rounds` questions per client."""
+    latencies = []
+    outcomes = []
+
+    def client_prompts(client: int) -> List[str]:
+        return [
+            f"{prompts[(client + r) % len(prompts)]} (question {offset + client * rounds + r})"
+            for r in range(rounds)
+        ]
+
+    def timed(answer, *args) -> None:
+        started = time.perf_counter()
+        outcomes.append(answer(*args))
+        latencies.append(time.perf_counter() - started)
+
+    def blocking_client(client: int) -> None:
+        for prompt in client_prompts(client):
+            if mode == "views":
+                timed(answer_views, app, prompt)
+            else:
+                timed(answer_blocking, coordinator, db_service, prompt)
+
+    started = time.perf_counter()
+    with ThreadSampler() as sampler:
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            list(pool.map(blocking_client, range(level)))
+    elapsed = time.perf_counter() - started
+
+    from app.utils.benchmark_pipeline import percentile
+    return {
+        "mode": mode,
+        "in_flight": level,
+        "questions": len(outcomes),
+        "failures": outcomes.count(False),
+        "elapsed_s": round(elapsed, 3),
+        "questions_per_s": round(len(outcomes) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "peak_threads": sampler.peak
+    }
+
+
+def run_benchmark(modes: List[str], levels: List[int], rounds: int, latency: float, rows: int,
+                  tolerance: float) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="reportchat-concurrency-")
+    os.makedirs(os.path.join(workdir, "datalake"), exist_ok=True)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+
+    from app.services.llm_gateway import LLMGateway, LocalBackend, set_llm_gateway
+    from app.utils.benchmark_pipeline import SyntheticResponder, sample_prompts, seed_database
+
+    # The stand-in API has no concurrency or rate limit of its own
+    set_llm_gateway(LLMGateway(LocalBackend(TaggedResponder(SyntheticResponder()), latency=latency),
+                               max_concurrency=max(levels) * 2, requests_per_minute=1e9))
+
+    from app import create_app
+    from app.routes import main
+    app = create_app()
+    logging.getLogger().setLevel(logging.WARNING)
+    db_service = main.get_db_service()
+    seed_database(db_service, rows)
+    coordinator = main.get_agent_coordinator()
+
+    prompts = sample_prompts()
+    # Build the schema description and load plotly before anything is timed
+    answer_blocking(coordinator, db_service, f"{prompts[0]} (question warm-up)")
+    report = {"latency_s": latency, "rows": rows, "rounds": rounds, "results": [], "sustained": {}}
+    offset = 0
+    for mode in modes:
+        baseline = None
+        for level in levels:
+            result = run_level(mode, level, rounds, prompts, app, coordinator, db_service, offset)
+            offset += level * rounds
+            baseline = baseline or result["p50_ms"]
+            result["sustained"] = not result["failures"] and result["p95_ms"] <= baseline * tolerance
+            if result["sustained"]:
+                report["sustained"][mode] = level
+            report["results"].append(result)
+            print(f"{mode:<8}{level:>7}{result['questions']:>7}{result['failures']:>6}"
+                  f"{result['questions_per_s']:>10}{result['p50_ms']:>11}{result['p95_ms']:>11}"
+                  f"{result['peak_threads']:>9}  {'yes' if result['sustained'] else 'no'}", flush=True)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure concurrent in-flight questions per process")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma-separated subset of {', '.join(MODES)}")
+    parser.add_argument("--levels", default="1,8,32,128,512", help="Comma-separated numbers of open questions")
+    parser.add_argument("--rounds", type=int, default=2, help="Questions asked by each client per level")
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds every LLM call takes")
+    parser.add_argument("--rows", type=int, default=2000, help="IW38 orders to seed")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="Sustained while p95 <= tolerance x single-question p50")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the report to this file")
+    args = parser.parse_args()
+
+    modes = [mode for mode in args.modes.split(",") if mode]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        raise SystemExit(f"Unknown modes: {', '.join(sorted(unknown))}")
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+
+    print(f"{'mode':<8}{'open':>7}{'asked':>7}{'fail':>6}{'q/s':>10}{'p50 ms':>11}{'p95 ms':>11}"
+          f"{'threads':>9}  sustained")
+    report = run_benchmark(modes, [int(level) for level in re.split(r"[,\s]+", args.levels) if level],
+                           args.rounds, args.latency, args.rows, args.tolerance)
+    for mode, level in report["sustained"].items():
+        print(f"{mode}: sustains {level} questions in flight")
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
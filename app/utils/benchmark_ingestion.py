@@ -0,0 +1,268 @@
+"""
+Ingest and query benchmark on synthetic SAP reports.
+
+For each scale, generates IW38/IW47/IW68 files with app.utils.generate_sap_data
+(or reuses them from --data-dir), ingests them with process_excel_file into
+a fresh database and measures throughput. A second ingest into another
+fresh database runs under tracemalloc for the peak Python memory, since
+tracing slows the ingest down too much to time it. Then a fixed set of
+analytic queries runs against the loaded database.
+
+The report is JSON; pass a previous report as --baseline to list the
+measurements that got slower (or heavier) by more than --tolerance.
+
+    python -m app.utils.benchmark_ingestion --scales 10000,100000 --json ingest.json
+    python -m app.utils.benchmark_ingestion --scales 10000,100000 --baseline ingest.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Representative questions, written the way the SQL generator writes them
+ANALYTIC_QUERIES = {
+    "order_type_share": (
+        "SELECT order_type, COUNT(*) AS order_count, "
+        "ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM IW38), 2) AS order_percentage "
+        "FROM IW38 GROUP BY order_type ORDER BY order_count DESC"
+    ),
+    "costs_by_location": (
+        "SELECT common_fields.functional_location, IW38.plant_section, "
+        "SUM(CAST(IW38.total_actual_costs AS FLOAT)) AS total_actual_costs "
+        "FROM IW38 JOIN common_fields ON IW38.common_id = common_fields.id "
+        "GROUP BY common_fields.functional_location, IW38.plant_section "
+        "ORDER BY total_actual_costs DESC LIMIT 10"
+    ),
+    "work_per_employee": (
+        "SELECT IW47.employees, COUNT(DISTINCT common_fields.order_number) AS orders_finished, "
+        "SUM(CAST(IW47.actual_work AS FLOAT)) AS total_actual_work "
+        "FROM IW47 JOIN common_fields ON IW47.common_id = common_fields.id "
+        "GROUP BY IW47.employees ORDER BY orders_finished DESC"
+    ),
+    "damage_codes": (
+        "SELECT code_group, problem_code_text, COUNT(*) AS items "
+        "FROM IW68 GROUP BY code_group, problem_code_text ORDER BY items DESC LIMIT 20"
+    ),
+    "orders_per_month": (
+        "SELECT substr(created_on, 1, 7) AS month, COUNT(*) AS orders, "
+        "SUM(CAST(total_actual_costs AS FLOAT)) AS costs FROM IW38 GROUP BY month ORDER BY month"
+    ),
+    "breakdown_work": (
+        "SELECT o.order_number, SUM(CAST(IW47.actual_work AS FLOAT)) AS hours "
+        "FROM IW47 JOIN common_fields c ON IW47.common_id = c.id "
+        "JOIN common_fields o ON o.order_number = c.order_number AND o.file_type = 'IW38' "
+        "WHERE o.breakdown = 'X' GROUP BY o.order_number ORDER BY hours DESC LIMIT 25"
+    ),
+    "planned_vs_actual": (
+        "SELECT work_center, SUM(CAST(planned_work AS FLOAT)) AS planned, "
+        "SUM(CAST(actual_work AS FLOAT)) AS actual FROM IW47 GROUP BY work_center"
+    )
+}
+
+# Lower is better for these; throughput is compared the other way round
+COMPARED = {
+    "ingest": ("seconds", "peak_memory_mb"),
+    "queries": ("p50_ms", "p95_ms")
+}
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit
+    }
+
+
+def prepare_data(data_dir: str, rows: int, formats: List[str], seed: int) -> Dict[str, Any]:
+    """Synthetic files for one scale, generated unless data_dir holds them already."""
+    from app.utils.generate_sap_data import generate, load_manifest
+
+    path = os.path.join(data_dir, f"rows_{rows}_seed_{seed}")
+    manifest = load_manifest(path)
+    if manifest is None or not set(formats) <= set(manifest["params"]["formats"]):
+        manifest = generate(path, rows, formats, seed)
+    manifest["dir"] = path
+    return manifest
+
+
+def ingest(files: List[Dict[str, Any]], data_dir: str, workdir: str, trace_memory: bool):
+    """Ingest the files in order into a fresh database; return the database service and a result per file."""
+    from app.services.database_service import DatabaseService
+
+    os.makedirs(workdir)
+    db_service = DatabaseService(os.path.join(workdir, "benchmark.db"), os.path.join(workdir, "staging"))
+    db_service.initialize_database()
+    results = []
+    for entry in files:
+        path = os.path.join(data_dir, entry["path"])
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        outcome = db_service.process_excel_file(path, entry["report"])
+        seconds = time.perf_counter() - started
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if not outcome.get("success"):
+            raise RuntimeError(f"Ingest of {entry['path']} failed: {outcome.get('error')}")
+        results.append({
+            "report": entry["report"],
+            "format": entry["format"],
+            "file": entry["path"],
+            "bytes": entry["bytes"],
+            "rows": outcome["rows"],
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(outcome["rows"] / seconds, 1),
+            "peak_memory_mb": round(peak / 1e6, 1) if peak is not None else None
+        })
+    return db_service, results
+
+
+def time_queries(db_service, repeat: int) -> List[Dict[str, Any]]:
+    from app.utils.benchmark_pipeline import percentile
+
+    results = []
+    for name, query in ANALYTIC_QUERIES.items():
+        # The first run warms the page cache and is not counted
+        outcome = db_service.execute_query(query, read_only=True)
+        if not outcome["success"]:
+            raise RuntimeError(f"Query {name} failed: {outcome['error']}")
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            db_service.execute_query(query, read_only=True)
+            samples.append(time.perf_counter() - started)
+        results.append({
+            "query": name,
+            "rows": len(outcome["results"]),
+            "p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 95) * 1000, 2),
+            "min_ms": round(min(samples) * 1000, 2)
+        })
+    return results
+
+
+def run_benchmark(scales: List[int], formats: List[str], data_dir: str, repeat: int, seed: int,
+                  trace_memory: bool = True) -> Dict[str, Any]:
+    sys.path.insert(0, REPO_ROOT)
+    # Per-row INFO logging would dominate the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = {
+        "benchmark": "ingestion",
+        "created_on": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "environment": environment(),
+        "params": {"formats": formats, "repeat": repeat, "seed": seed},
+        "scales": []
+    }
+    for rows in scales:
+        data = prepare_data(data_dir, rows, formats, seed)
+        files = [entry for fmt in formats for entry in data["files"] if entry["format"] == fmt]
+        scale = {"rows": rows, "report_rows": data["rows"], "ingest": [], "queries": []}
+        with tempfile.TemporaryDirectory() as workdir:
+            for fmt in formats:
+                format_files = [entry for entry in files if entry["format"] == fmt]
+                db_service, timed = ingest(format_files, data["dir"], os.path.join(workdir, fmt), False)
+                if fmt == formats[0]:
+                    scale["queries"] = time_queries(db_service, repeat)
+                if trace_memory:
+                    traced_service, traced = ingest(format_files, data["dir"], os.path.join(workdir, f"{fmt}_traced"),
+                                                    True)
+                    for result, traced_result in zip(timed, traced):
+                        result["peak_memory_mb"] = traced_result["peak_memory_mb"]
+                scale["ingest"].extend(timed)
+        report["scales"].append(scale)
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Measurements of report that are worse than in baseline by more than tolerance (0.2 = 20%)."""
+    regressions = []
+    baseline_scales = {scale["rows"]: scale for scale in baseline.get("scales", [])}
+    for scale in report["scales"]:
+        previous_scale = baseline_scales.get(scale["rows"])
+        if previous_scale is None:
+            continue
+        for section, fields in COMPARED.items():
+            key = "query" if section == "queries" else "file"
+            previous = {entry[key]: entry for entry in previous_scale.get(section, [])}
+            for entry in scale[section]:
+                old = previous.get(entry[key])
+                if old is None:
+                    continue
+                for field in fields:
+                    if entry.get(field) is None or not old.get(field):
+                        continue
+                    change = entry[field] / old[field] - 1
+                    if change > tolerance:
+                        regressions.append(f"rows={scale['rows']} {section} {entry[key]} {field}: "
+                                           f"{old[field]} -> {entry[field]} (+{change:.0%})")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    for scale in report["scales"]:
+        print(f"\nrows={scale['rows']}  " + "  ".join(f"{name}={count}" for name, count in scale["report_rows"].items()))
+        print(f"  {'file':<16}{'rows':>10}{'MB':>8}{'seconds':>10}{'rows/s':>12}{'peak MB':>10}")
+        for entry in scale["ingest"]:
+            peak = entry["peak_memory_mb"] if entry["peak_memory_mb"] is not None else "-"
+            print(f"  {entry['file']:<16}{entry['rows']:>10}{entry['bytes'] / 1e6:>8.1f}{entry['seconds']:>10}"
+                  f"{entry['rows_per_second']:>12}{peak:>10}")
+        print(f"  {'query':<24}{'rows':>8}{'p50 ms':>10}{'p95 ms':>10}{'min ms':>10}")
+        for entry in scale["queries"]:
+            print(f"  {entry['query']:<24}{entry['rows']:>8}{entry['p50_ms']:>10}{entry['p95_ms']:>10}"
+                  f"{entry['min_ms']:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", default="10000", help="Comma-separated IW38 row counts, e.g. 10000,100000")
+    parser.add_argument("--formats", default="xlsx,csv,tsv", help="Comma-separated file formats to ingest")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "reportchat_synthetic"),
+                        help="Where generated files are kept between runs")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per query")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc ingest")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the report to this file")
+    parser.add_argument("--baseline", default=None, help="Earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before a regression")
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    baseline_report: Optional[Dict[str, Any]] = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline_report = json.load(f)
+
+    result = run_benchmark([int(rows) for rows in args.scales.split(",") if rows],
+                           [fmt for fmt in args.formats.split(",") if fmt], os.path.abspath(args.data_dir),
+                           args.repeat, args.seed, not args.no_memory)
+    print_report(result)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if baseline_report is not None:
+        found = compare(result, baseline_report, args.tolerance)
+        print(f"\n{len(found)} regression(s) against {args.baseline}")
+        for line in found:
+            print(f"  {line}")
+        sys.exit(1 if found else 0)
@@ -0,0 +1,338 @@
+"""
+Offline end-to-end latency benchmark for /translate_to_sql -> /execute_query.
+
+Drives the Flask pipeline with the sample prompts from app.py while every LLM
+call is answered by a ReplayBackend: recorded responses from a cassette
+(see LLM_RECORD_PATH) when available, otherwise canned synthetic responses,
+delayed by a configurable LatencyModel. Reports p50/p95/p99 latency per stage
+and throughput for each concurrency level.
+
+Like the browser, each flow passes the ticket from /translate_to_sql on to
+/execute_query, so the query and its processing run speculatively and the
+report counts how many of those results were used (hits) or had to be
+recomputed (misses).
+
+    python -m app.utils.benchmark_pipeline --levels 1,4,16 --requests 24
+"""
+import argparse
+import ast
+import json
+import logging
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CANNED_SQL = {
+    "employee": (
+        "SELECT IW47.employees, COUNT(DISTINCT common_fields.order_number) AS orders_finished, "
+        "SUM(CAST(IW47.actual_work AS FLOAT)) AS total_actual_work "
+        "FROM IW47 JOIN common_fields ON IW47.common_id = common_fields.id "
+        "GROUP BY IW47.employees ORDER BY orders_finished DESC",
+        {"x": "employees", "y": "total_actual_work"}
+    ),
+    "costs": (
+        "SELECT common_fields.functional_location, IW38.plant_section, "
+        "SUM(CAST(IW38.total_actual_costs AS FLOAT)) AS total_actual_costs "
+        "FROM IW38 JOIN common_fields ON IW38.common_id = common_fields.id "
+        "GROUP BY common_fields.functional_location, IW38.plant_section "
+        "ORDER BY total_actual_costs DESC LIMIT 10",
+        {"x": "functional_location", "y": "total_actual_costs"}
+    ),
+    "order type": (
+        "SELECT order_type, COUNT(*) AS order_count, "
+        "ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM IW38), 2) AS order_percentage "
+        "FROM IW38 GROUP BY order_type",
+        {"x": "order_type", "y": "order_percentage"}
+    )
+}
+
+FALLBACK_PROMPTS = [
+    "give me per employee how many orders he or she finished and the total amount of time (actual work) @bar",
+    "give me top 10 of the total actual costs with functional location and plant section @pie",
+    "give me a percentage of the different order types @pie"
+]
+
+
+def sample_prompts() -> List[str]:
+    """Read the sample prompts from the trailing docstring of app.py."""
+    try:
+        with open(os.path.join(REPO_ROOT, "app.py"), encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+        for node in tree.body:
+            if isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+                prompts = [line.strip() for line in node.value.value.splitlines() if line.strip()]
+                if prompts:
+                    return prompts
+    except (OSError, SyntaxError):
+        pass
+    return FALLBACK_PROMPTS
+
+
+def _canned_sql(text: str) -> tuple:
+    text = text.lower()
+    for keyword, canned in CANNED_SQL.items():
+        if keyword in text:
+            return canned
+    return CANNED_SQL["order type"]
+
+
+class SyntheticResponder:
+    """
+    Produce a plausible response for any agent request without calling the API.
+
+    With bad_sql_rate > 0 a share of first SQL attempts reference a column that
+    does not exist, exercising the validation feedback loop; the corrected
+    query is returned once the generator reports the error.
+    """
+
+    def __init__(self, bad_sql_rate: float = 0.0, seed: int = 7):
+        self.bad_sql_rate = bad_sql_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, request: Dict[str, Any]) -> str:
+        from app.services.llm_replay import request_stage
+        stage = request_stage(request)
+        content = request["messages"][-1]["content"]
+        if stage == "classify":
+            return json.dumps({"type": "sql", "is_followup": False, "context": None})
+        if stage == "generate_sql":
+            query = _canned_sql(request["messages"][0]["content"])[0]
+            with self._lock:
+                corrupt = self._random.random() < self.bad_sql_rate
+            if corrupt and len(request["messages"]) == 1:
+                return query.replace("total_actual_", "total_act_").replace("order_type", "ordertype")
+            return query
+        if stage == "visualization_columns":
+            for sql, columns in CANNED_SQL.values():
+                if sql in content:
+                    return json.dumps(columns)
+            return json.dumps({"x": "order_type", "y": "order_count"})
+        if stage == "management_summary":
+            return "Order volume is concentrated in a few categories, which drive most of the maintenance cost."
+        return ("The results show a skewed distribution: the largest categories account for the majority "
+                "of the total, while a long tail of smaller categories contributes little. " * 4).strip()
+
+
+def seed_database(db_service, rows: int, seed: int = 7) -> None:
+    """Fill the benchmark database with linked IW38/IW47/IW68 rows."""
+    from app.services.dictionary_encoding import DictionaryEncoder
+    rnd = random.Random(seed)
+    order_types = ["PM01", "PM02", "PM03", "PM04"]
+    sections = ["A10", "B20", "C30", "D40", "E50"]
+    employees = [f"Technician {i:02d}" for i in range(25)]
+    with closing(db_service.get_db_connection()) as conn, conn:
+        encoder = DictionaryEncoder(conn)
+        loads = {file_type: db_service.snapshots.begin_load(conn, file_type, "benchmark seed")
+                 for file_type in ("IW38", "IW47")}
+        counts = {"IW38": 0, "IW47": 0}
+        for i in range(rows):
+            order = str(4000000 + i)
+            notification = str(10000000 + i)
+            location = f"PLANT-{rnd.randint(1, 40):03d}"
+            common = {"order_number": order, "notification_number": notification,
+                      "breakdown": "", "functional_location": location}
+            common_id = encoder.insert("common_fields", dict(common, file_type="IW38", load_id=loads["IW38"]))
+            counts["IW38"] += 1
+            encoder.insert("IW38", {
+                "common_id": common_id,
+                "load_id": loads["IW38"],
+                "created_on": "2024-05-01 00:00:00",
+                "order_type": rnd.choice(order_types),
+                "plant_section": rnd.choice(sections),
+                "total_actual_costs": f"{rnd.uniform(50, 5000):.2f}",
+                "description": "Replace pump seal"
+            })
+            for _ in range(rnd.randint(1, 3)):
+                common_id = encoder.insert("common_fields", dict(common, file_type="IW47", load_id=loads["IW47"]))
+                counts["IW47"] += 1
+                encoder.insert("IW47", {
+                    "common_id": common_id,
+                    "load_id": loads["IW47"],
+                    "created_on": "2024-05-02 00:00:00",
+                    "employees": rnd.choice(employees),
+                    "actual_work": f"{rnd.uniform(0.5, 8):.1f}"
+                })
+        for file_type, load_id in loads.items():
+            db_service.snapshots.finish_load(conn, load_id, counts[file_type])
+        db_service._update_derived_tables(conn)
+        conn.commit()
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # The smallest value with at least pct percent of the samples at or below it
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    return {
+        stage: {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1)
+        }
+        for stage, values in sorted(samples.items())
+    }
+
+
+class StageTimer:
+    """Collects durations per stage from many threads."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def wrap_backend(self, backend):
+        """Time every LLM call by pipeline stage."""
+        from app.services.llm_replay import request_stage
+        create = backend.create
+
+        def timed_create(**kwargs):
+            started = time.perf_counter()
+            try:
+                return create(**kwargs)
+            finally:
+                self.add(f"llm.{request_stage(kwargs)}", time.perf_counter() - started)
+
+        backend.create = timed_create
+        return backend
+
+    def wrap_method(self, owner, name: str, stage: str) -> None:
+        method = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+
+        setattr(owner, name, timed)
+
+
+def run_flow(app, prompt: str, timer: StageTimer) -> bool:
+    client = app.test_client()
+    started = time.perf_counter()
+    response = client.post("/translate_to_sql", json={"message": prompt})
+    timer.add("translate_to_sql", time.perf_counter() - started)
+    data = response.get_json() or {}
+    if response.status_code != 200 or "query" not in data:
+        return False
+    executed = time.perf_counter()
+    response = client.post("/execute_query", json={
+        "query": data["query"],
+        "visualization_type": data.get("visualization_type"),
+        "ticket": data.get("ticket")
+    })
+    timer.add("execute_query", time.perf_counter() - executed)
+    timer.add("end_to_end", time.perf_counter() - started)
+    return response.status_code == 200
+
+
+def run_benchmark(levels: List[int], requests_per_level: int, rows: int, cassette: str,
+                  latency_scale: float, llm_concurrency: int, seed: int,
+                  bad_sql_rate: float = 0.0) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="reportchat-bench-")
+    os.makedirs(os.path.join(workdir, "datalake"), exist_ok=True)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+
+    from app.services.llm_gateway import LLMGateway, LocalBackend, set_llm_gateway
+    from app.services.llm_replay import LatencyModel, ReplayBackend
+
+    timer = StageTimer()
+    backend = ReplayBackend(cassette, latency_model=LatencyModel(scale=latency_scale, seed=seed),
+                            fallback=LocalBackend(responder=SyntheticResponder(bad_sql_rate, seed)))
+    set_llm_gateway(LLMGateway(timer.wrap_backend(backend), max_concurrency=llm_concurrency,
+                               requests_per_minute=1_000_000))
+
+    from app import create_app
+    from app.routes import main
+    app = create_app()
+    # Per-call INFO logging would dominate the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+    seed_database(main.get_db_service(), rows, seed)
+    timer.wrap_method(main.get_db_service(), "execute_query", "db.execute_query")
+
+    prompts = sample_prompts()
+    report = {"prompts": prompts, "rows": rows, "latency_scale": latency_scale, "bad_sql_rate": bad_sql_rate,
+              "llm_concurrency": llm_concurrency, "levels": []}
+    speculation = main.speculative_executor
+    for level in levels:
+        timer.samples.clear()
+        hits, misses = speculation.hits, speculation.misses
+        jobs = [prompts[i % len(prompts)] for i in range(requests_per_level)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            outcomes = list(pool.map(lambda prompt: run_flow(app, prompt, timer), jobs))
+        elapsed = time.perf_counter() - started
+        report["levels"].append({
+            "concurrency": level,
+            "requests": len(jobs),
+            "failures": outcomes.count(False),
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(len(jobs) / elapsed, 2),
+            "sql_attempts_per_request": round(
+                len(timer.samples["llm.generate_sql"]) / max(1, len(timer.samples["translate_to_sql"])), 2),
+            "speculation": {"hits": speculation.hits - hits, "misses": speculation.misses - misses},
+            "stages": summarize(timer.samples)
+        })
+    report["replay"] = {"hits": backend.hits, "misses": backend.misses}
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    for level in report["levels"]:
+        print(f"\nconcurrency={level['concurrency']}  requests={level['requests']}  "
+              f"failures={level['failures']}  throughput={level['throughput_rps']} req/s  "
+              f"sql attempts/request={level['sql_attempts_per_request']}  "
+              f"speculation hits/misses={level['speculation']['hits']}/{level['speculation']['misses']}")
+        print(f"  {'stage':<32}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for stage, stats in level["stages"].items():
+            print(f"  {stage:<32}{stats['count']:>6}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=24, help="Prompt flows per concurrency level")
+    parser.add_argument("--rows", type=int, default=5000, help="IW38 orders to seed")
+    parser.add_argument("--cassette", default=None, help="Cassette recorded with LLM_RECORD_PATH")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier for synthetic LLM latency")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="Gateway in-flight request limit")
+    parser.add_argument("--bad-sql-rate", type=float, default=0.0,
+                        help="Share of synthetic first SQL attempts that reference an unknown column")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the report to this file")
+    args = parser.parse_args()
+
+    cassette = os.path.abspath(args.cassette) if args.cassette else None
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    result = run_benchmark([int(level) for level in re.split(r"[,\s]+", args.levels) if level],
+                           args.requests, args.rows, cassette, args.latency_scale,
+                           args.llm_concurrency, args.seed, args.bad_sql_rate)
+    print_report(result)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
@@ -1,21 +1,18 @@
-import pandas as pd
 import os
 import sqlite3
+import sys
 from typing import Dict, List, Set
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from app.services.staging import StagingStore, read_sheet_headers
+
+staging = StagingStore(os.path.join("datalake", "staging"))
+
 def analyze_excel_headers(file_path: str) -> Dict[str, List[str]]:
     """Analyze Excel file headers and return a dictionary of sheet names and their headers."""
     try:
-        # Read all sheets
-        excel_file = pd.ExcelFile(file_path)
-        headers = {}
-        
-        for sheet_name in excel_file.sheet_names:
-            # Read first row of each sheet
-            df = pd.read_excel(excel_file, sheet_name=sheet_name, nrows=1)
-            headers[sheet_name] = [str(col) for col in df.columns]
-            
-        return headers
+        # The staging manifest has the headers of every sheet; otherwise read only the header rows
+        return staging.headers(file_path) or read_sheet_headers(file_path)
     except Exception as e:
         print(f"Error analyzing {file_path}: {str(e)}")
         return {}
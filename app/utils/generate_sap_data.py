@@ -0,0 +1,406 @@
+"""
+Generate synthetic IW38, IW47 and IW68 exports at a configurable scale.
+
+Orders and notifications are linked across the three reports the way SAP
+links them: every IW47 confirmation belongs to an IW38 order, every IW68
+item to a notification that is either on an IW38 order or stands alone.
+Order types, work centers, functional locations, damage codes and the
+like follow skewed (Zipf) distributions, so a few values dominate as they
+do in a real plant.
+
+Workbooks hold typed dates and numbers, as SAP's spreadsheet export writes
+them, and are split every 1,048,575 rows like Excel itself. CSV and TSV
+files hold text in SAP's list formats: DD.MM.YYYY and 1.234,56 with
+--number-format de, MM/DD/YYYY and 1,234.56 with en, optionally behind
+title lines (--preamble) and in a legacy code page (--encoding cp1252).
+
+    python -m app.utils.generate_sap_data --rows 100000 --formats xlsx,csv --out datalake/synthetic
+"""
+import argparse
+import bisect
+import csv
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REPORTS = ("IW38", "IW47", "IW68")
+FORMATS = ("xlsx", "csv", "tsv")
+MANIFEST = "manifest.json"
+
+# Excel's row limit, less the header row
+MAX_WORKBOOK_ROWS = 1_048_575
+
+# Decimals SAP shows for the quantity and amount columns
+NUMBER_DECIMALS = {
+    "Total act.costs": 2,
+    "Breakdown dur.": 2,
+    "Work (planned)": 1,
+    "Actual work": 1
+}
+
+DATE_FORMATS = {"de": "%d.%m.%Y", "en": "%m/%d/%Y"}
+
+ORDER_TYPES = ["PM01", "PM02", "PM03", "PM04", "PM05"]
+# Share of orders of each type that come from a notification
+NOTIFICATION_SHARE = {"PM01": 1.0, "PM02": 0.2, "PM03": 0.95, "PM04": 0.5, "PM05": 0.1}
+PLANT_SECTIONS = ["A10", "A20", "B10", "B20", "C10", "C20", "D10", "E10", "F10", "G10", "H10", "U90"]
+WORK_CENTERS = ["MECH01", "ELEC01", "MECH02", "INST01", "PROD01", "LUBE01", "HVAC01", "WELD01", "CIVIL01", "EXT01"]
+DESCRIPTIONS = [
+    "Replace pump seal", "Leak at flange", "Motor overheating", "Inspect conveyor belt", "Lubrication round",
+    "Replace bearing", "Calibrate pressure transmitter", "Valve does not close", "Vibration on gearbox",
+    "Safety inspection", "Replace filter element", "Repair cable tray", "Belt misalignment", "Noise from fan",
+    "Replace V-belts", "Check emergency stop", "Oil leak hydraulic unit", "Replace level switch",
+    "Thermographic survey", "Clean heat exchanger", "Repair door interlock", "Replace gasket manway",
+    "Sensor failure", "Tighten anchor bolts", "Painting of structure"
+]
+CONFIRMATION_TEXTS = [
+    "Work completed", "Part replaced", "Adjusted and tested", "Waiting for spare part", "Inspected, no findings",
+    "Cleaned", "Temporary repair", "Tested OK", "Follow-up notification created", "Lubricated"
+]
+SYSTEM_STATUSES = ["CNF", "PCNF", "CNF NMAT", "CNF PRC", "PCNF NMAT"]
+CODE_GROUPS = {
+    "PUMP": ("Pumps", [("D01", "Seal leakage"), ("D02", "Bearing damage"), ("D03", "Cavitation"),
+                       ("D04", "Impeller wear"), ("D05", "Coupling failure")]),
+    "MOTOR": ("Electric motors", [("D01", "Overheating"), ("D02", "Winding failure"), ("D03", "Bearing noise"),
+                                  ("D04", "Insulation fault")]),
+    "VALVE": ("Valves", [("D01", "Internal leakage"), ("D02", "Stuck"), ("D03", "Actuator fault"),
+                         ("D04", "Packing leak")]),
+    "CONV": ("Conveyors", [("D01", "Belt damage"), ("D02", "Misalignment"), ("D03", "Roller seized"),
+                           ("D04", "Drive failure")]),
+    "INSTR": ("Instrumentation", [("D01", "Drift"), ("D02", "No signal"), ("D03", "Display fault")]),
+    "STRUC": ("Structures", [("D01", "Corrosion"), ("D02", "Crack"), ("D03", "Loose bolts")])
+}
+CAUSES = {
+    "WEAR": ("Wear and tear", [("C01", "Normal wear"), ("C02", "End of lifetime"), ("C03", "Abrasion")]),
+    "OPER": ("Operation", [("C01", "Operating error"), ("C02", "Overload"), ("C03", "Dry running")]),
+    "MAINT": ("Maintenance", [("C01", "Insufficient lubrication"), ("C02", "Wrong part"),
+                              ("C03", "Incorrect assembly")]),
+    "EXT": ("External", [("C01", "Contamination"), ("C02", "Weather"), ("C03", "Power failure")])
+}
+EFFECTS = ["No effect", "Reduced output", "Production stopped", "Quality affected", "Safety risk"]
+FIRST_NAMES = ["Jan", "Piet", "Anna", "Sanne", "Tom", "Lisa", "Mark", "Eva", "Kees", "Fatima", "Ahmed", "Joost",
+               "Marieke", "Bas", "Noor", "Ruben", "Sophie", "Daan", "Emma", "Lucas"]
+LAST_NAMES = ["de Vries", "Jansen", "Bakker", "Visser", "Smit", "Meijer", "de Boer", "Mulder", "Bos", "Vos",
+              "Peters", "Hendriks", "van Dijk", "Dekker", "Brouwer"]
+
+
+def report_headers(report: str) -> List[str]:
+    """Column headers of a report in export order, as the ingest expects them."""
+    from app.services.database_service import COMMON_COLUMNS, REPORT_COLUMNS
+    return [header for _, header in COMMON_COLUMNS + REPORT_COLUMNS[report]]
+
+
+class Zipf:
+    """Draw from a list of values with probability proportional to 1 / rank ** s."""
+
+    def __init__(self, rnd: random.Random, values: List[Any], s: float = 1.1):
+        self.rnd = rnd
+        self.values = list(values)
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank ** s) for rank in range(1, len(self.values) + 1)))
+        self.total = self.cum_weights[-1]
+
+    def __call__(self) -> Any:
+        return self.values[bisect.bisect(self.cum_weights, self.rnd.random() * self.total)]
+
+
+def format_number(value: float, decimals: int, number_format: str) -> str:
+    text = f"{value:,.{decimals}f}"
+    if number_format == "de":
+        text = text.replace(",", "_").replace(".", ",").replace("_", ".")
+    return text
+
+
+class CsvReportWriter:
+    """Writes one report as SAP list text: formatted numbers and dates, optional title lines."""
+
+    def __init__(self, path: str, headers: List[str], separator: str, number_format: str,
+                 encoding: str, preamble: int):
+        self.path = path
+        self.rows = 0
+        self.file = open(path, "w", newline="", encoding=encoding, errors="replace")
+        self.writer = csv.writer(self.file, delimiter=separator, lineterminator="\r\n")
+        date_format = DATE_FORMATS[number_format]
+        self.formatters = []
+        for header in headers:
+            decimals = NUMBER_DECIMALS.get(header)
+            if decimals is not None:
+                self.formatters.append(
+                    lambda value, d=decimals: "" if value is None else format_number(value, d, number_format))
+            else:
+                self.formatters.append(
+                    lambda value: "" if value is None
+                    else value.strftime(date_format) if isinstance(value, date)
+                    else value.strftime("%H:%M:%S") if isinstance(value, dt_time)
+                    else value)
+        titles = ["Synthetic PM report", f"Generated {datetime.now().strftime(date_format)}"]
+        for line in range(preamble):
+            self.file.write((titles[line] if line < len(titles) else "") + "\r\n")
+        self.writer.writerow(headers)
+
+    def write(self, row: List[Any]) -> None:
+        self.writer.writerow([format_value(value) for format_value, value in zip(self.formatters, row)])
+        self.rows += 1
+
+    def close(self) -> List[Dict[str, Any]]:
+        self.file.close()
+        return [{"path": self.path, "rows": self.rows, "bytes": os.path.getsize(self.path)}]
+
+
+class XlsxReportWriter:
+    """Writes one report as typed workbook cells, starting a new workbook at Excel's row limit."""
+
+    def __init__(self, base_path: str, headers: List[str], max_rows: int = MAX_WORKBOOK_ROWS):
+        self.base_path = base_path
+        self.headers = headers
+        self.max_rows = max_rows
+        self.parts: List[Dict[str, Any]] = []
+        self.workbook = None
+
+    def _open(self) -> None:
+        from openpyxl import Workbook
+        stem, extension = os.path.splitext(self.base_path)
+        path = self.base_path if not self.parts else f"{stem}_{len(self.parts) + 1}{extension}"
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet("Sheet1")
+        self.sheet.append(self.headers)
+        self.parts.append({"path": path, "rows": 0})
+
+    def _save(self) -> None:
+        part = self.parts[-1]
+        self.workbook.save(part["path"])
+        part["bytes"] = os.path.getsize(part["path"])
+        self.workbook = None
+
+    def write(self, row: List[Any]) -> None:
+        if self.workbook is None:
+            self._open()
+        self.sheet.append(row)
+        self.parts[-1]["rows"] += 1
+        if self.parts[-1]["rows"] >= self.max_rows:
+            self._save()
+
+    def close(self) -> List[Dict[str, Any]]:
+        if self.workbook is None and not self.parts:
+            self._open()
+        if self.workbook is not None:
+            self._save()
+        return self.parts
+
+
+class PlantModel:
+    """The master data orders refer to, and skewed pickers over it."""
+
+    def __init__(self, rnd: random.Random, rows: int):
+        self.rnd = rnd
+        locations = []
+        for i in range(max(50, min(5000, rows // 20))):
+            section = PLANT_SECTIONS[i % len(PLANT_SECTIONS)]
+            locations.append((f"NL01-{section}-U{i // len(PLANT_SECTIONS) + 1:03d}", section))
+        rnd.shuffle(locations)
+        self.location = Zipf(rnd, locations, 0.8)
+        self.equipment = {location: [str(10000000 + i * 4 + k) for k in range(rnd.randint(1, 4))]
+                          for i, (location, _) in enumerate(locations)}
+        self.order_type = Zipf(rnd, ORDER_TYPES, 1.2)
+        self.work_center = Zipf(rnd, WORK_CENTERS)
+        self.description = Zipf(rnd, DESCRIPTIONS)
+        self.confirmation_text = Zipf(rnd, CONFIRMATION_TEXTS)
+        self.system_status = Zipf(rnd, SYSTEM_STATUSES, 1.5)
+        self.code_group = Zipf(rnd, list(CODE_GROUPS), 0.9)
+        self.cause_group = Zipf(rnd, list(CAUSES), 0.9)
+        self.effect = Zipf(rnd, EFFECTS, 1.3)
+        employees = [(f"{first} {last}", str(10000 + i * 7))
+                     for i, (first, last) in enumerate(itertools.product(FIRST_NAMES, LAST_NAMES))]
+        rnd.shuffle(employees)
+        self.employees = {work_center: Zipf(rnd, employees[i * 20:(i + 1) * 20], 0.7)
+                          for i, work_center in enumerate(WORK_CENTERS)}
+        users = sorted({f"{first[:1]}{last.split()[-1][:6]}".upper() for first, last in
+                        itertools.product(FIRST_NAMES, LAST_NAMES)})
+        self.user = Zipf(rnd, users, 0.9)
+
+
+def generate_rows(rows: int, seed: int = 7, end_date: date = date(2024, 12, 31), days: int = 730):
+    """
+    Yield (report, row) for `rows` IW38 orders and the IW47 and IW68 rows that belong to them.
+
+    Row values are typed: date and time objects, floats for amounts and
+    quantities, None for empty cells.
+    """
+    rnd = random.Random(seed)
+    plant = PlantModel(rnd, rows)
+    start_date = end_date - timedelta(days=days)
+    next_notification = 10000000
+    next_confirmation = 100000
+
+    def iw68_rows(order, notification, breakdown, location, equipment):
+        group = plant.code_group()
+        group_text, damages = CODE_GROUPS[group]
+        cause_group = plant.cause_group()
+        cause_group_text, causes = CAUSES[cause_group]
+        for _ in range(1 if rnd.random() < 0.8 else rnd.randint(2, 4)):
+            damage_code, damage_text = damages[min(int(rnd.expovariate(0.8)), len(damages) - 1)]
+            cause_code, cause_text = causes[min(int(rnd.expovariate(0.8)), len(causes) - 1)]
+            yield "IW68", [
+                order, notification, breakdown, location,
+                group, group_text, damage_code, damage_text, f"{damage_text} on {equipment}", cause_group, cause_group_text,
+                cause_text, plant.effect(), plant.user()
+            ]
+
+    for i in range(rows):
+        order = str(4000000 + i)
+        order_type = plant.order_type()
+        location, section = plant.location()
+        equipment = rnd.choice(plant.equipment[location])
+        created_on = start_date + timedelta(days=int(rnd.random() ** 0.7 * days))
+        basic_start = created_on + timedelta(days=int(rnd.expovariate(0.3)))
+        basic_finish = basic_start + timedelta(days=int(rnd.expovariate(0.5)))
+        finished = rnd.random() < 0.85 and basic_start <= end_date
+        actual_finish = basic_start + timedelta(days=int(rnd.expovariate(0.4))) if finished else None
+        breakdown = "X" if order_type == "PM01" and rnd.random() < 0.25 else None
+        work_center = plant.work_center()
+
+        notification = None
+        if rnd.random() < NOTIFICATION_SHARE[order_type]:
+            notification = str(next_notification)
+            next_notification += 1
+
+        yield "IW38", [
+            order, notification, breakdown, location,
+            created_on, basic_start, equipment, plant.description(), section,
+            round(rnd.lognormvariate(6.0, 1.2), 2), order_type, work_center,
+            str(300000 + PLANT_SECTIONS.index(section) * 1000 + i % 97) if order_type == "PM02" else None,
+            actual_finish, f"41{PLANT_SECTIONS.index(section):02d}00", basic_finish,
+            round(rnd.lognormvariate(1.0, 1.0), 2) if breakdown else None
+        ]
+
+        # Confirmations: none for open orders, a long tail for big jobs
+        confirmations = int(rnd.expovariate(0.6)) + 1 if finished else (1 if rnd.random() < 0.3 else 0)
+        employee = plant.employees[work_center]
+        for _ in range(confirmations):
+            name, personnel_number = employee()
+            planned = round(rnd.choice((0.5, 1.0, 2.0, 2.0, 4.0, 4.0, 8.0, 16.0)), 1)
+            confirmed_on = basic_start + timedelta(days=rnd.randint(0, max(0, (basic_finish - basic_start).days)))
+            yield "IW47", [
+                order, notification, breakdown, location,
+                confirmed_on, plant.user(), actual_finish or confirmed_on, str(next_confirmation), name,
+                personnel_number, plant.confirmation_text(), planned,
+                round(planned * rnd.lognormvariate(0.0, 0.35), 1), plant.system_status(), work_center,
+                dt_time(rnd.choice((6, 7, 7, 8, 8, 9, 10, 13, 14, 22)), rnd.choice((0, 15, 30, 45)))
+            ]
+            next_confirmation += 1
+
+        if notification:
+            yield from iw68_rows(order, notification, breakdown, location, equipment)
+        # Notifications nobody made an order for
+        if rnd.random() < 0.1:
+            yield from iw68_rows(None, str(next_notification), None, location, equipment)
+            next_notification += 1
+
+
+def generate(out_dir: str, rows: int, formats: Iterable[str] = ("xlsx",), seed: int = 7,
+             number_format: str = "de", separator: Optional[str] = None, encoding: str = "utf-8",
+             preamble: int = 0, max_workbook_rows: int = MAX_WORKBOOK_ROWS) -> Dict[str, Any]:
+    """
+    Write the synthetic reports to out_dir in every requested format.
+
+    Args:
+        out_dir: Directory for the files and their manifest.json
+        rows: Number of IW38 orders; IW47 and IW68 grow with it
+        formats: Any of xlsx, csv and tsv
+        seed: Random seed; the same seed and rows give the same data
+        number_format: de or en, for the number and date text of CSV/TSV
+        separator: CSV field separator, by default ; for de and , for en
+        encoding: Text encoding of CSV/TSV files
+        preamble: Title lines written above the CSV/TSV header
+        max_workbook_rows: Rows per workbook before a new one is started
+
+    Returns:
+        Dict containing:
+        - params: the arguments the files were generated with
+        - files: path, format, rows and bytes per report and file
+        - rows: row count per report
+        - seconds: generation time
+    """
+    formats = [fmt for fmt in formats if fmt]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown format(s): {', '.join(sorted(unknown))}")
+    if number_format not in DATE_FORMATS:
+        raise ValueError(f"Unknown number format: {number_format}")
+    separator = separator or (";" if number_format == "de" else ",")
+    os.makedirs(out_dir, exist_ok=True)
+    started = time.perf_counter()
+
+    writers = {}
+    for report in REPORTS:
+        headers = report_headers(report)
+        for fmt in formats:
+            path = os.path.join(out_dir, f"{report}.{fmt}")
+            if fmt == "xlsx":
+                writers[report, fmt] = XlsxReportWriter(path, headers, max_workbook_rows)
+            else:
+                writers[report, fmt] = CsvReportWriter(path, headers, "\t" if fmt == "tsv" else separator,
+                                                       number_format, encoding, preamble)
+    by_report = {report: [writer for (r, _), writer in writers.items() if r == report] for report in REPORTS}
+
+    counts = dict.fromkeys(REPORTS, 0)
+    for report, row in generate_rows(rows, seed):
+        counts[report] += 1
+        for writer in by_report[report]:
+            writer.write(row)
+
+    files = []
+    for (report, fmt), writer in writers.items():
+        for part in writer.close():
+            files.append(dict(part, report=report, format=fmt, path=os.path.basename(part["path"])))
+
+    manifest = {
+        "params": {"rows": rows, "seed": seed, "formats": sorted(formats), "number_format": number_format,
+                   "separator": separator, "encoding": encoding, "preamble": preamble},
+        "files": files,
+        "rows": counts,
+        "seconds": round(time.perf_counter() - started, 2)
+    }
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(out_dir: str) -> Optional[Dict[str, Any]]:
+    """The manifest of a previous generate() into out_dir, if its files are all still there."""
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not all(os.path.exists(os.path.join(out_dir, entry["path"])) for entry in manifest["files"]):
+        return None
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000, help="IW38 orders (10k to 5M)")
+    parser.add_argument("--formats", default="xlsx", help="Comma-separated: xlsx, csv, tsv")
+    parser.add_argument("--out", default=os.path.join("datalake", "synthetic"), help="Output directory")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--number-format", choices=sorted(DATE_FORMATS), default="de",
+                        help="Number and date text of CSV/TSV files")
+    parser.add_argument("--separator", default=None, help="CSV separator (default ; for de, , for en)")
+    parser.add_argument("--encoding", default="utf-8", help="Encoding of CSV/TSV files, e.g. cp1252")
+    parser.add_argument("--preamble", type=int, default=0, help="Title lines above the CSV/TSV header")
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_ROOT)
+    result = generate(args.out, args.rows, args.formats.split(","), args.seed, args.number_format,
+                      args.separator, args.encoding, args.preamble)
+    print(f"Generated {', '.join(f'{count} {report}' for report, count in result['rows'].items())} rows "
+          f"in {result['seconds']} s")
+    for entry in result["files"]:
+        print(f"  {entry['path']:<16}{entry['rows']:>10} rows{entry['bytes'] / 1e6:>10.1f} MB")
@@ -0,0 +1,169 @@
+"""
+Compare database size and GROUP BY time with and without dictionary encoding.
+
+Seeds a database through the normal ingest path, then copies the report rows
+into three fresh files: the encoded storage tables behind the app's views,
+the same tables behind views that decode with LEFT JOINs, and plain TEXT
+tables (the layout before encoding). All are vacuumed and the same GROUP BY,
+filter and whole-table queries are timed on each, plus the keyed forms the
+schema prompt recommends.
+
+    python -m app.utils.measure_encoding --rows 200000
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import closing
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUERIES = {
+    "plant_section count": "SELECT plant_section, COUNT(*) FROM IW38 GROUP BY plant_section",
+    "order_type costs": "SELECT order_type, SUM(CAST(total_actual_costs AS REAL)) FROM IW38 GROUP BY order_type",
+    "functional_location join": (
+        "SELECT c.functional_location, COUNT(*) FROM IW38 t "
+        "JOIN common_fields c ON c.id = t.common_id GROUP BY c.functional_location"
+    ),
+    "order_type filter": (
+        "SELECT SUM(CAST(total_actual_costs AS REAL)) FROM IW38 WHERE order_type = 'PM01'"
+    ),
+    "functional_location like": (
+        "SELECT COUNT(*) FROM common_fields WHERE functional_location LIKE '%-01%'"
+    ),
+    "count all": "SELECT COUNT(*) FROM IW38",
+    "costs total": "SELECT SUM(CAST(total_actual_costs AS REAL)) FROM IW38"
+}
+
+# The same questions on the dictionary keys, as the schema prompt recommends
+KEYED_QUERIES = {
+    "plant_section count": "SELECT plant_section, COUNT(*) FROM IW38 GROUP BY plant_section_id",
+    "order_type costs": (
+        "SELECT order_type, SUM(CAST(total_actual_costs AS REAL)) FROM IW38 GROUP BY order_type_id"
+    ),
+    "functional_location join": (
+        "SELECT c.functional_location, COUNT(*) FROM IW38 t "
+        "JOIN common_fields c ON c.id = t.common_id GROUP BY c.functional_location_id"
+    ),
+    "order_type filter": (
+        "SELECT SUM(CAST(total_actual_costs AS REAL)) FROM IW38 "
+        "WHERE order_type_id = (SELECT id FROM dim_order_type WHERE value = 'PM01')"
+    ),
+    "functional_location like": (
+        "SELECT COUNT(*) FROM common_fields WHERE functional_location_id IN "
+        "(SELECT id FROM dim_functional_location WHERE value LIKE '%-01%')"
+    )
+}
+
+
+def create_joined_views(conn) -> None:
+    """The alternative view layout: decode every key with a LEFT JOIN instead of a scalar subquery."""
+    from app.services.dictionary_encoding import ENCODED_COLUMNS, dimension_table, storage_table
+
+    for table, encoded in ENCODED_COLUMNS.items():
+        select, joins = [], []
+        for (column,) in conn.execute(f"SELECT name FROM pragma_table_info('{storage_table(table)}')").fetchall():
+            name = column[:-3] if column.endswith("_id") else None
+            if name in encoded:
+                select.append(f"d_{name}.value AS {name}")
+                joins.append(f"LEFT JOIN {dimension_table(encoded[name])} d_{name} ON d_{name}.id = t.{column}")
+            select.append(f"t.{column}")
+        conn.execute(f"DROP VIEW IF EXISTS {table}")
+        conn.execute(f"CREATE VIEW {table} AS SELECT {', '.join(select)} FROM {storage_table(table)} t "
+                     f"{' '.join(joins)}")
+
+
+def build_copies(source_path: str, workdir: str) -> dict:
+    """Copy the report rows of source_path into an encoded and a plain database file."""
+    from app.services.dictionary_encoding import ENCODED_COLUMNS, DIMENSIONS, storage_table, dimension_table
+
+    paths = {layout: os.path.join(workdir, f"{layout}.db") for layout in ("encoded", "joined", "plain")}
+    for layout, path in paths.items():
+        with closing(sqlite3.connect(path)) as conn, conn:
+            conn.execute("ATTACH DATABASE ? AS src", (source_path,))
+            if layout in ("encoded", "joined"):
+                names = [dimension_table(d) for d in DIMENSIONS] + [storage_table(t) for t in ENCODED_COLUMNS]
+                for name in names:
+                    ddl = conn.execute("SELECT sql FROM src.sqlite_master WHERE name = ?", (name,)).fetchone()[0]
+                    conn.execute(ddl)
+                    conn.execute(f"INSERT INTO main.{name} SELECT * FROM src.{name}")
+                if layout == "encoded":
+                    for table in ENCODED_COLUMNS:
+                        ddl = conn.execute("SELECT sql FROM src.sqlite_master WHERE name = ?", (table,)).fetchone()[0]
+                        conn.execute(ddl)
+            else:
+                for table in ENCODED_COLUMNS:
+                    columns = [row[1] for row in conn.execute(f"PRAGMA src.table_info({table})")]
+                    # Without the dictionary keys the views also expose
+                    columns = [c for c in columns if not (c.endswith("_id") and c[:-3] in columns)]
+                    definitions = [
+                        "id INTEGER PRIMARY KEY" if column == "id"
+                        else f"{column} INTEGER" if column == "common_id"
+                        else f"{column} TEXT"
+                        for column in columns
+                    ]
+                    conn.execute(f"CREATE TABLE main.{table} ({', '.join(definitions)})")
+                    conn.execute(f"INSERT INTO main.{table} SELECT {', '.join(columns)} FROM src.{table}")
+            conn.commit()
+            conn.execute("DETACH DATABASE src")
+            if layout == "joined":
+                # Only once src is detached: an unqualified DROP VIEW would otherwise reach into it
+                create_joined_views(conn)
+                conn.commit()
+        with closing(sqlite3.connect(path)) as conn:
+            conn.execute("VACUUM")
+    return paths
+
+
+def time_query(path: str, query: str, repeat: int) -> float:
+    """Best wall time of a query in milliseconds."""
+    conn = sqlite3.connect(path)
+    try:
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(query).fetchall()
+            best = min(best, time.perf_counter() - started)
+        return round(best * 1000, 1)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the effect of dictionary encoding")
+    parser.add_argument("--rows", type=int, default=200000, help="IW38 orders to seed")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query, best time is reported")
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_ROOT)
+    logging.getLogger().setLevel(logging.WARNING)
+    from app.services.database_service import DatabaseService
+    from app.utils.benchmark_pipeline import seed_database
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, "source.db")
+        db_service = DatabaseService(source)
+        db_service.initialize_database()
+        seed_database(db_service, args.rows)
+        paths = build_copies(source, workdir)
+
+        sizes = {layout: os.path.getsize(path) for layout, path in paths.items()}
+        print(f"Database size: plain {sizes['plain'] / 1e6:.1f} MB, encoded {sizes['encoded'] / 1e6:.1f} MB "
+              f"({100 * (1 - sizes['encoded'] / sizes['plain']):.0f}% smaller)")
+
+        # encoded: the views the app creates; joined: the LEFT JOIN alternative
+        print(f"\n{'query':<28}{'plain ms':>10}{'encoded ms':>12}{'joined ms':>11}{'on keys ms':>12}")
+        for name, query in QUERIES.items():
+            plain_ms = time_query(paths["plain"], query, args.repeat)
+            encoded_ms = time_query(paths["encoded"], query, args.repeat)
+            joined_ms = time_query(paths["joined"], query, args.repeat)
+            keyed = KEYED_QUERIES.get(name)
+            keyed_ms = time_query(paths["encoded"], keyed, args.repeat) if keyed else "-"
+            print(f"{name:<28}{plain_ms:>10}{encoded_ms:>12}{joined_ms:>11}{keyed_ms:>12}")
+
+
+if __name__ == "__main__":
+    main()
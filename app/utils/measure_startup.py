@@ -0,0 +1,85 @@
+"""
+Measure how long the app takes to import, boot and answer its first request.
+
+Each run starts a fresh interpreter in a scratch directory (so the real
+datalake is not touched) with -X importtime, then reports the boot time of
+create_app(), the time of the first GET / and the slowest imports. Runs with
+PRELOAD_SERVICES=1 show what moving the work into boot costs.
+
+    python -m app.utils.measure_startup --repeat 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+from app import create_app
+app = create_app()
+booted = time.perf_counter()
+modules_at_boot = sorted(sys.modules)
+response = app.test_client().get('/')
+first_request = time.perf_counter()
+print(json.dumps({{
+    "boot_ms": (booted - started) * 1000,
+    "first_request_ms": (first_request - booted) * 1000,
+    "status": response.status_code,
+    "modules_at_boot": modules_at_boot
+}}))
+"""
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Self import time in microseconds summed per top-level package."""
+    per_package = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        per_package[package] = per_package.get(package, 0) + int(self_us)
+    return per_package
+
+
+def run_once(preload: bool) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "datalake"))
+        env = dict(os.environ, LLM_BACKEND="local", PRELOAD_SERVICES="1" if preload else "")
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", CHILD.format(root=REPO_ROOT)],
+            cwd=workdir, env=env, capture_output=True, text=True, check=True
+        )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["imports"] = parse_importtime(completed.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app import, boot and first-request time")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode, best time is reported")
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports to list")
+    args = parser.parse_args()
+
+    for preload in (False, True):
+        runs = [run_once(preload) for _ in range(args.repeat)]
+        best = min(runs, key=lambda run: run["boot_ms"])
+        loaded = [name for name in ("pandas", "numpy", "plotly", "openpyxl", "anthropic")
+                  if name in best["modules_at_boot"]]
+        print(f"\n{'PRELOAD_SERVICES=1' if preload else 'lazy (default)'}")
+        print(f"  boot (import + create_app): {min(run['boot_ms'] for run in runs):8.0f} ms")
+        print(f"  first GET /:                {min(run['first_request_ms'] for run in runs):8.0f} ms")
+        print(f"  heavy modules loaded at boot: {', '.join(loaded) or 'none'}")
+        print("  import time per package up to the first response:")
+        for name, micros in sorted(best["imports"].items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {name:<40}{micros / 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Rebuild the datalake database from the staged uploads instead of the workbooks.
+
+Every staged upload is replayed through the normal ingest path in upload
+order into a fresh database file, so the result has the current schema,
+snapshots and derived tables. SAP text exports are not staged and are
+re-read from the report folders in the same order. Workbooks that were uploaded before staging
+existed are staged first with --stage-missing. The live database is not
+touched; replace it with the rebuilt file while the app is stopped.
+
+    python -m app.utils.rebuild_database --stage-missing
+    python -m app.utils.rebuild_database --out datalake/rebuilt.db --keep 1
+"""
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+
+REPORT_FOLDERS = ["IW38", "IW47", "IW68"]
+WORKBOOK_EXTENSIONS = (".xlsx", ".xls", ".xlsm")
+TEXT_EXTENSIONS = (".csv", ".tsv", ".txt")
+
+
+def stage_missing(datalake: str, staging) -> int:
+    """Stage every workbook in the report folders that has no up-to-date staging copy."""
+    from app.services.database_service import read_report
+
+    staged = 0
+    for folder in REPORT_FOLDERS:
+        folder_path = os.path.join(datalake, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for file_name in sorted(os.listdir(folder_path)):
+            file_path = os.path.join(folder_path, file_name)
+            if file_name.lower().endswith(WORKBOOK_EXTENSIONS) and staging.manifest(file_path) is None:
+                read_report(file_path, staging)
+                staged += 1
+    return staged
+
+
+def text_uploads(datalake: str):
+    """(mtime_ns, file_type, path) of every text export in the report folders."""
+    uploads = []
+    for folder in REPORT_FOLDERS:
+        folder_path = os.path.join(datalake, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for file_name in os.listdir(folder_path):
+            if file_name.lower().endswith(TEXT_EXTENSIONS):
+                file_path = os.path.join(folder_path, file_name)
+                uploads.append((os.stat(file_path).st_mtime_ns, folder, file_path))
+    return uploads
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the database from staged uploads")
+    parser.add_argument("--datalake", default="datalake", help="Folder with the report folders and staging")
+    parser.add_argument("--out", default=os.path.join("datalake", "rebuilt.db"), help="Database file to create")
+    parser.add_argument("--stage-missing", action="store_true", help="Stage workbooks without a staging copy first")
+    parser.add_argument("--keep", type=int, default=0, help="Apply snapshot retention afterwards (0 keeps all)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    from app.services.database_service import DatabaseService
+    from app.services.staging import StagingStore
+
+    staging = StagingStore(os.path.join(args.datalake, "staging"))
+    if args.stage_missing:
+        started = time.perf_counter()
+        count = stage_missing(args.datalake, staging)
+        print(f"Staged {count} workbooks in {time.perf_counter() - started:.1f}s")
+
+    if os.path.exists(args.out):
+        raise SystemExit(f"{args.out} already exists")
+    db_service = DatabaseService(args.out, staging_dir=staging.staging_dir)
+    result = db_service.initialize_database()
+    if not result["success"]:
+        raise SystemExit(f"Initialization failed: {result['error']}")
+
+    started = time.perf_counter()
+    rows = 0
+    uploads = [(manifest["source_mtime_ns"], manifest["file_type"], manifest) for manifest in staging.manifests()]
+    uploads += text_uploads(args.datalake)
+    for _, file_type, source in sorted(uploads, key=lambda upload: upload[0]):
+        if file_type not in REPORT_FOLDERS:
+            continue
+        if isinstance(source, str):
+            load_id, count = db_service.ingest_text_report(source, file_type)
+            name = os.path.basename(source)
+        else:
+            df = staging.load_manifest(source)
+            load_id = db_service.ingest_dataframe(df, file_type, source["source"])
+            count = len(df)
+            name = source["source"]
+        rows += count
+        print(f"  load {load_id}: {file_type} {name} ({count} rows)")
+    print(f"Ingested {rows} rows in {time.perf_counter() - started:.1f}s into {args.out}")
+
+    if args.keep:
+        retention = db_service.apply_retention(args.keep)
+        if not retention["success"]:
+            raise SystemExit(f"Retention failed: {retention['error']}")
+        print(f"Purged loads: {retention['purged_loads'] or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
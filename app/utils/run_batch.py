@@ -0,0 +1,57 @@
+"""
+Answer a list of prompts in one batch from the command line.
+
+Reads one prompt per line from a file (or stdin with "-"); without a file the
+standard questions from app.py are used. Prints per-item timings and writes
+the full results, charts and summaries as JSON when --output is given.
+
+    python -m app.utils.run_batch morning_questions.txt --output answers.json
+"""
+import argparse
+import json
+import os
+import sys
+
+from dotenv import load_dotenv
+
+
+def read_prompts(path):
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a list of prompts concurrently")
+    parser.add_argument("prompts", nargs="?", help="File with one prompt per line, or - for stdin")
+    parser.add_argument("--db", default=os.path.join("datalake", "datalake.db"), help="Database path")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel items (default: LLM concurrency limit)")
+    parser.add_argument("--output", default=None, help="Write the full batch result to this JSON file")
+    args = parser.parse_args()
+
+    load_dotenv()
+    from app.agents import AgentCoordinator
+    from app.services.database_service import DatabaseService
+    from app.utils.benchmark_pipeline import sample_prompts
+
+    prompts = read_prompts(args.prompts) if args.prompts else sample_prompts()
+    db_service = DatabaseService(args.db)
+    coordinator = AgentCoordinator(db_service=db_service)
+    batch = coordinator.run_batch(prompts, max_workers=args.workers)
+
+    for index, item in enumerate(batch["items"], 1):
+        status = "error: " + item["error"] if item["error"] else f"{len(item['results'] or [])} rows"
+        timings = ", ".join(f"{phase} {ms} ms" for phase, ms in item["timings_ms"].items())
+        print(f"{index:>3}. {item['prompt']}\n     {status} ({timings})")
+    print(f"\n{len(batch['items'])} prompts in {batch['elapsed_ms']} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(batch, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
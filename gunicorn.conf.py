@@ -0,0 +1,44 @@
+"""
+Production server configuration.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+A question spends almost all of its time waiting on Claude, and every open
+request holds a worker thread until it is answered. The Anthropic client is
+synchronous, so threads bound how many questions a worker has open; the
+views stay synchronous and the LLM gateway runs a question's independent
+model calls (the two summaries) side by side on its own pool.
+
+- One gthread worker per process keeps the LLM gateway, its rate limit and
+  the speculative result cache shared by all requests. Add workers only for
+  CPU-bound load (uploads, charts); each worker has its own LLM limits.
+- WEB_THREADS is the number of requests a worker serves at once. Questions
+  beyond LLM_MAX_CONCURRENCY only queue in the gateway, so a few times that
+  leaves room for uploads, dashboards and static files without parking
+  threads that cannot make progress.
+- LLM_MAX_CONCURRENCY and LLM_REQUESTS_PER_MINUTE bound what actually goes to
+  the API; requests beyond them wait in the gateway.
+- The timeout covers a full question including LLM retries.
+
+Measure what one process sustains with app.utils.benchmark_concurrency.
+"""
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5001")
+worker_class = "gthread"
+workers = int(os.getenv("WEB_WORKERS", "1"))
+threads = int(os.getenv("WEB_THREADS", "32"))
+timeout = int(os.getenv("WEB_TIMEOUT", "180"))
+graceful_timeout = 30
+keepalive = 5
+
+# Import the app once in the master; services hold thread pools, so each
+# worker creates its own after the fork, before it takes traffic
+preload_app = True
+
+
+def post_worker_init(worker):
+    from app.routes.main import warm_up
+
+    with worker.app.wsgi().app_context():
+        warm_up()
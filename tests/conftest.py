@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture
+def db_service(tmp_path):
+    from app.services.database_service import DatabaseService
+
+    service = DatabaseService(str(tmp_path / "datalake.db"))
+    assert service.initialize_database()["success"]
+    return service
@@ -0,0 +1,20 @@
+from app.utils.benchmark_pipeline import percentile
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 11))
+    assert percentile(values, 50) == 5
+    assert percentile(values, 90) == 9
+    assert percentile(values, 95) == 10
+    assert percentile(values, 100) == 10
+    assert percentile(values, 0) == 1
+
+
+def test_percentile_of_two_samples():
+    # With --repeat 2 the median is the faster run, not the slower one
+    assert percentile([2.0, 1.0], 50) == 1.0
+    assert percentile([2.0, 1.0], 95) == 2.0
+
+
+def test_percentile_of_nothing():
+    assert percentile([], 50) == 0.0
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app.services.chunked_uploads import CHUNK_CHECKSUM_MISMATCH, COMPLETE_LOCK, ChunkedUploadStore, UploadError
+
+
+def never_ingest(file_path, file_type, shard):
+    raise AssertionError("the upload is not complete")
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkedUploadStore(str(tmp_path / "incoming"), chunk_size=4)
+
+
+def test_only_a_damaged_chunk_is_marked_retryable(store):
+    upload_id = store.create("IW38", "orders.xlsx", 8)["upload_id"]
+    with pytest.raises(UploadError) as damaged:
+        store.write_chunk(upload_id, 1, b"abcd", hashlib.sha256(b"abce").hexdigest(), never_ingest)
+    assert (damaged.value.status, damaged.value.code) == (422, CHUNK_CHECKSUM_MISMATCH)
+
+    # Same status, but a file that is no workbook stays one however often it is sent
+    with pytest.raises(UploadError) as not_a_workbook:
+        store.write_chunk(upload_id, 0, b"abcd", hashlib.sha256(b"abcd").hexdigest(), never_ingest)
+    assert (not_a_workbook.value.status, not_a_workbook.value.code) == (422, None)
+
+
+def complete_without_ingest(store):
+    # The worker that took the ingest lock dies before its ingest runs
+    upload_id = store.create("IW38", "orders.xlsx", 4)["upload_id"]
+    store._executor.submit = lambda *args, **kwargs: None
+    status = store.write_chunk(upload_id, 0, b"PK\x03\x04", None, never_ingest)
+    assert status["status"] == "ingesting"
+    return upload_id
+
+
+def test_ingest_of_a_dead_worker_is_started_again(tmp_path):
+    store = ChunkedUploadStore(str(tmp_path / "incoming"), chunk_size=4)
+    upload_id = complete_without_ingest(store)
+    ingested = []
+
+    def ingest(file_path, file_type, shard):
+        ingested.append(os.path.basename(file_path))
+        return {"success": True}
+
+    # Another worker leaves a live lock alone
+    other = ChunkedUploadStore(str(tmp_path / "incoming"), chunk_size=4)
+    assert other.complete(upload_id, ingest)["status"] == "ingesting"
+
+    lock = os.path.join(store.incoming_dir, upload_id, COMPLETE_LOCK)
+    stale = time.time() - 2 * other.lock_timeout
+    os.utime(lock, (stale, stale))
+    other.complete(upload_id, ingest)
+    other._executor.shutdown(wait=True)
+    status = other.status(upload_id)
+    assert status["status"] == "ingested", status
+    assert ingested == [status["filename"]]
+    # Asking again does not ingest twice
+    assert other.complete(upload_id, ingest)["status"] == "ingested"
+    assert len(ingested) == 1
+
+
+def test_lock_of_a_dead_process_is_stale(store):
+    upload_id = complete_without_ingest(store)
+    lock = os.path.join(store.incoming_dir, upload_id, COMPLETE_LOCK)
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+
+    assert store._is_stale(lock, {"pid": dead.pid, "host": socket.gethostname()})
+    assert not store._is_stale(lock, {"pid": os.getpid(), "host": socket.gethostname()})
+
+
+def test_prune_keeps_sessions_that_still_receive_chunks(store):
+    upload_id = store.create("IW38", "orders.xlsx", 8)["upload_id"]
+    path = os.path.join(store.incoming_dir, upload_id)
+    old = time.time() - 2 * store.ttl_seconds
+    for name in (path, os.path.join(path, "session.json"), os.path.join(path, "chunks")):
+        os.utime(name, (old, old))
+    store.write_chunk(upload_id, 0, b"PK\x03\x04", None, never_ingest)
+    os.utime(path, (old, old))
+
+    store.prune()
+    assert os.path.isdir(path)
+
+    os.utime(os.path.join(path, "chunks", "0"), (old, old))
+    store.prune()
+    assert not os.path.exists(path)
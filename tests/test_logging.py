@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FORKING_SCRIPT = """
+import logging, os, sys
+from app import setup_logging
+
+setup_logging()
+pid = os.fork()
+if pid == 0:
+    logging.getLogger("worker").info({"agent": "test", "action": "logged_in_child"})
+    sys.exit(0)
+os.waitpid(pid, 0)
+logging.getLogger("master").info({"agent": "test", "action": "logged_in_parent"})
+"""
+
+
+def test_forked_worker_writes_its_log_records(tmp_path):
+    log_file = tmp_path / "app.log"
+    subprocess.run([sys.executable, "-c", FORKING_SCRIPT], cwd=REPO_ROOT, check=True, timeout=30,
+                   stdout=subprocess.DEVNULL, env={**os.environ, "LOG_FILE": str(log_file)})
+
+    actions = [json.loads(line).get("action") for line in log_file.read_text().splitlines()]
+    assert sorted(actions) == ["logged_in_child", "logged_in_parent"]
@@ -0,0 +1,72 @@
+from contextlib import closing
+
+from app.services.text_reports import TextReport
+
+IW38_HEADERS = ["Order", "Notification", "Created on", "Plant section", "Total act.costs", "Order Type"]
+IW47_HEADERS = ["Order", "Notification", "Created On", "Act.finish date", "Confirmation", "Personnel no.",
+                "Actual work"]
+
+
+def rollup(db_service, table, measure):
+    with closing(db_service.get_db_connection()) as conn:
+        return conn.execute(f"SELECT week, {measure} FROM {table} ORDER BY week").fetchall()
+
+
+def test_invalid_dates_roll_up_without_a_week(db_service):
+    db_service.ingest_rows(IW38_HEADERS, [
+        ["4000001", "10000001", "00.00.0000", "P100", "10", "PM01"],
+        ["4000002", "10000002", "2024-13-01 00:00:00", "P100", "20", "PM01"],
+        ["4000003", "10000003", "2024-02-30", "P100", "30", "PM01"],
+        ["4000004", "10000004", "2024-03-06 00:00:00", "P100", "40", "PM01"],
+        ["4000005", "10000005", "07.03.2024", "P100", "50", "PM01"]
+    ], "IW38", "orders.csv")
+
+    assert rollup(db_service, "rollup_iw38_costs", "order_count, total_actual_costs") == [
+        ("", 3, 60.0), ("2024-03-04", 2, 90.0)
+    ]
+
+
+def test_invalid_finish_date_falls_back_to_creation_day(db_service):
+    db_service.ingest_rows(IW47_HEADERS, [
+        ["4000001", "10000001", "05.03.2024", "00.00.0000", "100001", "1001", "2"],
+        ["4000002", "10000002", "31.02.2024", "31.02.2024", "100002", "1001", "3"]
+    ], "IW47", "confirmations.csv")
+
+    assert rollup(db_service, "rollup_iw47_work", "actual_work") == [("", 3.0), ("2024-03-04", 2.0)]
+
+
+def test_text_export_with_placeholder_dates_ingests(db_service, tmp_path):
+    # SAP writes 00.00.0000 for unset dates; the export used to abort on the rollup's NOT NULL week
+    export = tmp_path / "IW38.csv"
+    export.write_text(
+        "Order;Notification;Created on;Plant section;Total act.costs;Order Type\n"
+        "4000001;10000001;00.00.0000;P100;1.234,50;PM01\n"
+        "4000002;10000002;06.03.2024;P100;10,00;PM02\n",
+        encoding="utf-8"
+    )
+    assert TextReport.detect(str(export), IW38_HEADERS).date_format is not None
+
+    result = db_service.process_excel_file(str(export), "IW38")
+    assert result["success"], result.get("error")
+    assert [row[0] for row in rollup(db_service, "rollup_iw38_costs", "order_count")] == ["", "2024-03-04"]
+
+
+def test_rollups_are_much_smaller_than_their_source(db_service):
+    # A year of orders across many functional locations, people and days
+    db_service.ingest_rows(IW38_HEADERS + ["Functional Loc."], [
+        [str(4000000 + i), str(10000000 + i), f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}", f"P{i % 4}", str(i),
+         f"PM0{i % 3}", f"FL-{i}"]
+        for i in range(5000)
+    ], "IW38", "orders.csv")
+    db_service.ingest_rows(IW47_HEADERS + ["Work ctr (act.)"], [
+        [str(4000000 + i), str(10000000 + i), f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}", "", str(100000 + i),
+         str(1000 + i % 500), "1", f"WC{i % 5}"]
+        for i in range(5000)
+    ], "IW47", "confirmations.csv")
+
+    with closing(db_service.get_db_connection()) as conn:
+        for table, source in [("rollup_iw38_costs", "IW38"), ("rollup_iw47_work", "IW47")]:
+            rows = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            assert rows * 10 < conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+        assert conn.execute("SELECT SUM(order_count), SUM(total_actual_costs) FROM rollup_iw38_costs"
+                            ).fetchone() == (5000, sum(range(5000)))
@@ -0,0 +1,105 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app.agents.schema_prompt import SchemaPromptBuilder
+
+HEADERS = ["Order", "Notification", "Plant section", "Total act.costs", "Order Type"]
+
+
+def orders(start, count, cost=lambda number: f"{number}.5"):
+    return [[str(start + i), str(10000000 + start + i), "P100", cost(i), "PM01"] for i in range(count)]
+
+
+def test_numeric_columns_need_every_value_to_be_a_number(db_service):
+    # The first 200 values used to decide; a text value further down was missed
+    rows = orders(4000000, 300)
+    rows[250][3] = "n/a"
+    db_service.ingest_rows(HEADERS, rows, "IW38", "costs.csv")
+
+    stats = db_service.get_column_statistics("IW38", ["total_actual_costs", "order_number"])
+    assert stats["success"]
+    assert stats["columns"]["total_actual_costs"]["numeric"] is False
+
+
+def test_numeric_range_is_numeric(db_service):
+    db_service.ingest_rows(HEADERS, orders(4000000, 20, cost=lambda i: str(i * 50)), "IW38", "costs.csv")
+
+    costs = db_service.get_column_statistics("IW38", ["total_actual_costs"])["columns"]["total_actual_costs"]
+    assert costs["numeric"] is True
+    # Compared as numbers, not as text where "950" > "100"
+    assert (costs["min"], costs["max"]) == (0.0, 950.0)
+
+
+def test_previous_prompt_is_served_while_the_new_one_is_built(db_service):
+    db_service.ingest_rows(HEADERS, orders(4000000, 5), "IW38", "first.csv")
+    builder = SchemaPromptBuilder(db_service)
+    first = builder.build()
+    assert "IW38 (5 rows)" in first
+
+    release = threading.Event()
+    render = builder._render
+
+    def slow_render():
+        release.wait(10)
+        return render()
+
+    builder._render = slow_render
+    db_service.ingest_rows(HEADERS, orders(4000100, 5), "IW38", "second.csv")
+
+    # The request does not wait for the statistics of the new data
+    started = time.perf_counter()
+    assert builder.build() == first
+    assert time.perf_counter() - started < 1
+
+    release.set()
+    deadline = time.time() + 10
+    while builder.build() == first and time.time() < deadline:
+        time.sleep(0.05)
+    assert "IW38 (10 rows)" in builder.build()
+
+
+def test_users_only_see_the_report_tables(db_service):
+    tables = db_service.get_visible_table_info()["tables"]
+    assert {"IW38", "IW47", "IW68", "common_fields"} <= set(tables)
+    assert not [name for name in tables
+                if name.startswith(("sqlite_", "dim_")) or "_fts" in name or name.endswith(("_data", "_current"))
+                or name == "db_meta"]
+    assert len(tables) < len(db_service.get_table_info()["tables"]) // 2
+
+
+def test_dates_are_not_numbers(db_service):
+    db_service.ingest_rows(HEADERS + ["Created on", "Bas. start date", "Breakdown dur."], [
+        row + list(values) for row, values in zip(orders(4000000, 4), [
+            ("2023-01-05", "05.01.2023", "-1.5"),
+            ("2023-11-30", "30.11.2023", "2e-3"),
+            ("2024-02-01", "01.02.2024", "+4"),
+            ("2024-12-31", "31.12.2024", "1.5E+2")
+        ])
+    ], "IW38", "dates.csv")
+
+    stats = db_service.get_column_statistics("IW38", ["created_on", "basic_start_date", "breakdown_duration"])
+    assert stats["columns"]["created_on"]["numeric"] is False
+    assert stats["columns"]["basic_start_date"]["numeric"] is False
+    duration = stats["columns"]["breakdown_duration"]
+    assert (duration["numeric"], duration["min"], duration["max"]) == (True, -1.5, 150.0)
+
+
+def test_version_checks_close_their_connections(db_service, monkeypatch):
+    opened = []
+    connect = db_service.get_db_connection
+
+    def tracked():
+        opened.append(connect())
+        return opened[-1]
+
+    monkeypatch.setattr(db_service, "get_db_connection", tracked)
+    db_service.get_data_version()
+    db_service.get_schema_version()
+
+    assert len(opened) == 2
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
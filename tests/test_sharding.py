@@ -0,0 +1,104 @@
+import csv
+import sqlite3
+
+import pytest
+
+from app.services.database_service import DatabaseService
+from app.services.sharding import MAX_SHARDS, ShardedDatabaseService, plan_fan_out
+
+IW38_HEADERS = ["Order", "Notification", "Created on", "Plant section", "Total act.costs", "Order Type"]
+IW47_HEADERS = ["Order", "Notification", "Created On", "Act.finish date", "Confirmation", "Personnel no.",
+                "Actual work"]
+
+WORK_PER_ORDER_TYPE = """
+    SELECT o.order_type, SUM(CAST(w.actual_work AS FLOAT)) AS work
+    FROM IW38 o
+    JOIN common_fields oc ON oc.id = o.common_id
+    JOIN common_fields wc ON wc.order_number = oc.order_number AND wc.file_type = 'IW47'
+    JOIN IW47 w ON w.common_id = wc.id
+    GROUP BY o.order_type
+"""
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    service = ShardedDatabaseService(str(tmp_path / "datalake.db"), str(tmp_path / "shards"))
+    assert service.initialize_database()["success"]
+    return service
+
+
+def upload(service, tmp_path, file_type, headers, rows, shard=None):
+    path = tmp_path / f"{file_type}_{len(list(tmp_path.iterdir()))}.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        writer.writerows(rows)
+    return service.process_excel_file(str(path), file_type, shard)
+
+
+def test_more_plant_sections_than_sqlite_can_attach(sharded, tmp_path):
+    rows = [[str(4000000 + i), str(10000000 + i), "2024-03-01", f"P{i:02d}", "10", "PM01"] for i in range(12)]
+    result = upload(sharded, tmp_path, "IW38", IW38_HEADERS, rows)
+    assert result["success"], result
+
+    assert len(sharded.shards) == MAX_SHARDS
+    assert sharded.validate_query("SELECT plant_section, shard FROM IW38")["success"]
+    assert sharded.get_table_info()["success"]
+    result = sharded.execute_query("SELECT COUNT(DISTINCT plant_section) AS sections FROM IW38")
+    assert result["success"], result
+    assert result["results"] == [{"sections": 12}]
+
+    # Sections beyond the limit share the default shard, explicit tags for new shards are refused
+    assert not upload(sharded, tmp_path, "IW38", IW38_HEADERS, rows[:1], shard="extra")["success"]
+
+
+def test_join_across_shards_when_confirmations_come_first(sharded, tmp_path):
+    assert upload(sharded, tmp_path, "IW47", IW47_HEADERS, [
+        ["4000001", "10000001", "2024-03-01", "2024-03-02", "100001", "1001", "2"],
+        ["4000001", "10000001", "2024-03-01", "2024-03-02", "100002", "1001", "3"]
+    ])["success"]
+    assert upload(sharded, tmp_path, "IW38", IW38_HEADERS, [
+        ["4000001", "10000001", "2024-03-01", "P10", "10", "PM01"],
+        ["4000002", "10000002", "2024-03-01", "P20", "20", "PM02"]
+    ])["success"]
+
+    # The confirmations stayed in the default shard, their order went to P10
+    assert sorted(sharded.shards) == ["default", "p10", "p20"]
+    assert plan_fan_out(WORK_PER_ORDER_TYPE) is None
+    result = sharded.execute_query(WORK_PER_ORDER_TYPE)
+    assert result["success"], result
+    assert [(row["order_type"], row["work"]) for row in result["results"]] == [("PM01", 5.0)]
+
+
+def test_single_table_aggregates_still_fan_out():
+    assert plan_fan_out("SELECT plant_section, SUM(total_actual_costs) FROM IW38 GROUP BY plant_section")
+    assert plan_fan_out("SELECT COUNT(*) FROM IW38 WHERE order_type = 'PM01'")
+    assert plan_fan_out("SELECT COUNT(*) FROM IW38, IW47") is None
+
+
+def test_failed_shard_rolls_back_the_whole_upload(sharded, tmp_path, monkeypatch):
+    assert upload(sharded, tmp_path, "IW38", IW38_HEADERS, [
+        ["4000001", "10000001", "2024-03-01", "P10", "10", "PM01"]
+    ])["success"]
+
+    ingest_dataframe = DatabaseService.ingest_dataframe
+
+    def failing_for_p20(service, part, file_type, file_name):
+        if "P20" in set(part["Plant section"]):
+            raise sqlite3.OperationalError("database is locked")
+        return ingest_dataframe(service, part, file_type, file_name)
+
+    monkeypatch.setattr(DatabaseService, "ingest_dataframe", failing_for_p20)
+    result = upload(sharded, tmp_path, "IW38", IW38_HEADERS, [
+        ["4000002", "10000002", "2024-04-01", "P10", "20", "PM01"],
+        ["4000003", "10000003", "2024-04-01", "P20", "30", "PM02"]
+    ])
+    assert not result["success"]
+
+    # The part already written to P10 is gone and the first upload is still the current snapshot
+    current = sharded.execute_query("SELECT order_number FROM IW38_current JOIN common_fields_current c "
+                                    "ON c.id = IW38_current.common_id")
+    assert current["success"], current
+    assert [row["order_number"] for row in current["results"]] == ["4000001"]
+    assert sharded.execute_query("SELECT COUNT(*) AS loads FROM uploads")["results"] == [{"loads": 1}]
+    assert sharded.apply_retention(1)["purged_loads"] == []
@@ -0,0 +1,14 @@
+from app.services.speculative_cache import SpeculativeExecutor
+
+
+def test_claims_count_hits_and_misses():
+    executor = SpeculativeExecutor()
+    ticket = executor.submit("SELECT 1", lambda: {"success": True})
+
+    assert executor.claim(ticket, "SELECT 2") is None
+    other = executor.submit("SELECT 1", lambda: {"success": True})
+    assert executor.claim(other, "SELECT 1") == {"success": True}
+    # Without a ticket there was nothing to claim, which is neither
+    assert executor.claim(None, "SELECT 1") is None
+
+    assert (executor.hits, executor.misses) == (1, 1)
@@ -0,0 +1,33 @@
+import os
+
+import pandas as pd
+
+from app.services import staging
+from app.services.database_service import read_report
+from app.services.staging import StagingStore
+
+
+def test_npy_text_columns_round_trip_without_padding(tmp_path, monkeypatch):
+    monkeypatch.setattr(staging, "staging_format", lambda: "npy")
+    workbook = tmp_path / "IW38" / "orders.xlsx"
+    workbook.parent.mkdir()
+    descriptions = ["x" * 2000] + ["pump", "Lüfter ⚙ defekt", None, ""] * 250
+    pd.DataFrame({
+        "Order": [str(4000000 + i) for i in range(len(descriptions))],
+        "Description": descriptions,
+        "Total act.costs": [1.5] * len(descriptions)
+    }).to_excel(workbook, index=False)
+    store = StagingStore(str(tmp_path / "staging"))
+
+    parsed = read_report(str(workbook), store)
+    staged = store.load(str(workbook))
+    assert staged is not None
+    pd.testing.assert_frame_equal(staged, parsed)
+    assert staged["Description"].tolist()[:5] == ["x" * 2000, "pump", "Lüfter ⚙ defekt", None, None]
+
+    # One long value must not widen every other one to 2000 characters
+    column = [c["name"] for c in store.manifest(str(workbook))["columns"]].index("Description")
+    path = store.path_for(str(workbook))
+    size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)
+               if name.startswith(f"{column}."))
+    assert size < 50_000
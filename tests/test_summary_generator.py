@@ -0,0 +1,17 @@
+import time
+
+from app.agents.summary_generator import SummaryGenerator
+from app.services.llm_gateway import LLMGateway, LocalBackend
+
+
+def test_summaries_take_one_round_trip():
+    llm = LLMGateway(LocalBackend(lambda request: request["system"][:20], latency=0.3), requests_per_minute=1e9)
+
+    started = time.perf_counter()
+    result = SummaryGenerator(llm).generate_summaries([{"plant_section": "P10", "orders": 3}], "SELECT 1")
+    elapsed = time.perf_counter() - started
+
+    assert result["success"], result
+    assert result["management_summary"] != result["comprehensive_summary"]
+    # The two summaries overlap on the gateway's threads
+    assert elapsed < 0.5
@@ -0,0 +1,31 @@
+from contextlib import closing
+
+
+def upload(db_service, tmp_path, name):
+    path = tmp_path / name
+    path.write_text("Order\n4000001\n")
+    with closing(db_service.get_db_connection()) as conn, conn:
+        db_service.upload_manifest.begin(conn, str(path), "IW38")
+
+
+def names(listing):
+    return [entry["name"] for entry in listing["files"]]
+
+
+def test_uploads_between_pages_do_not_repeat_files(db_service, tmp_path):
+    for i in range(5):
+        upload(db_service, tmp_path, f"orders_{i}.csv")
+
+    first = db_service.list_upload_files("IW38", per_page=2)
+    assert names(first) == ["orders_4.csv", "orders_3.csv"]
+    assert first["has_more"]
+
+    # A file uploaded while the first page is on screen
+    upload(db_service, tmp_path, "orders_5.csv")
+    second = db_service.list_upload_files("IW38", before=first["files"][-1]["id"], per_page=2)
+    assert names(second) == ["orders_2.csv", "orders_1.csv"]
+
+    last = db_service.list_upload_files("IW38", before=second["files"][-1]["id"], per_page=2)
+    assert names(last) == ["orders_0.csv"]
+    assert not last["has_more"]
+    assert last["total"] == 6
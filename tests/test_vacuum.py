@@ -0,0 +1,28 @@
+import sqlite3
+from contextlib import closing
+
+from app.services.database_service import DatabaseService
+
+
+def auto_vacuum(path):
+    with closing(sqlite3.connect(path)) as conn:
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+
+def test_new_database_is_incremental(db_service):
+    assert auto_vacuum(db_service.db_path) == 2
+
+
+def test_startup_leaves_existing_database_alone(tmp_path):
+    path = str(tmp_path / "old.db")
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute("CREATE TABLE legacy (x)")
+
+    service = DatabaseService(path)
+    assert service.initialize_database()["success"]
+    # No VACUUM at startup: the mode only changes through the explicit conversion
+    assert auto_vacuum(path) == 0
+
+    assert service.enable_incremental_vacuum() == {"success": True, "converted": True}
+    assert auto_vacuum(path) == 2
+    assert service.enable_incremental_vacuum() == {"success": True, "converted": False}